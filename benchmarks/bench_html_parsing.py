@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+"""Benchmark for price_scraper HTML extraction.
+
+Compares parse time and peak memory of a full BeautifulSoup tree
+against targeted extraction, over the saved Trolley search page.
+
+Author:
+    Andrés Pérez
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from os.path import join, dirname
+from bs4 import BeautifulSoup
+from typing import Callable, List, Tuple
+
+# Add benchmarked modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from price_scraper import extract_listings
+from local_servers import HTML_TEST_FILE
+
+
+def full_tree(html: str, parser: str) -> List[Tuple[str, str]]:
+    """Extracts product entries the way the scraper originally did."""
+    soup = BeautifulSoup(html, parser)
+    return [(product.a["href"],
+             str(product.a.find("div", class_="_price").contents[0]))
+            for product in soup.find_all("div", class_="product-listing")]
+
+
+def targeted(html: str, parser: str) -> List[Tuple[str, str]]:
+    """Extracts product entries with the current scraper."""
+    return list(extract_listings(html, parser))
+
+
+def measure(extractor: Callable[[str, str], List[Tuple[str, str]]],
+            html: str,
+            parser: str,
+            rounds: int) -> Tuple[float, int]:
+    """Gets mean time per round and peak memory of an extractor."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        extractor(html, parser)
+    elapsed = (time.perf_counter() - start) / rounds
+
+    tracemalloc.start()
+    extractor(html, parser)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    """Runs HTML extraction benchmark"""
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--rounds", type=int, default=50,
+                            help="number of times each page is parsed")
+    arg_parser.add_argument("--parsers", nargs="+",
+                            default=["lxml", "html.parser"],
+                            help="HTML parsers to compare")
+    args = arg_parser.parse_args()
+
+    with open(HTML_TEST_FILE, "r", encoding="utf-8") as f:
+        html = f.read()
+
+    for parser in args.parsers:
+        assert full_tree(html, parser) == targeted(html, parser)
+        for extractor in (full_tree, targeted):
+            elapsed, peak = measure(extractor, html, parser, args.rounds)
+            print(f"{parser:<12} {extractor.__name__:<9} "
+                  f"{elapsed * 1000:8.2f}ms {peak / 1024:9.1f}KiB peak")
+
+
+if __name__ == "__main__":
+    main()
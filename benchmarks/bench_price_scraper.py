@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+"""Benchmark for price_scraper module.
+
+Measures how long it takes to scrape prices for several
+products, against a local stand-in for the Trolley website.
+
+Author:
+    Andrés Pérez
+"""
+
+import argparse
+import sys
+import time
+from os.path import join, dirname
+
+# Add benchmarked modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+import price_scraper
+from http_client import HttpClient
+from local_servers import LocalServer, trolley_handler
+
+
+def main() -> None:
+    """Runs price scraping benchmark"""
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--products", type=int, default=24,
+                            help="number of products to scrape")
+    arg_parser.add_argument("--latency", type=float, default=0.2,
+                            help="server latency per request, in seconds")
+    arg_parser.add_argument("--workers", type=int, nargs="+",
+                            default=[1, 4, 8, 16],
+                            help="max-in-flight limits to compare")
+    args = arg_parser.parse_args()
+
+    names = [f"product{i}" for i in range(args.products)]
+    with LocalServer(trolley_handler(args.latency)) as server:
+        price_scraper.SOURCE_URL = server.url
+        print(f"{args.products} products, {args.latency}s latency")
+        for workers in args.workers:
+            # A new session, so pages are not revalidated from earlier rounds.
+            client = HttpClient(pool_size=workers)
+            start = time.perf_counter()
+            result = price_scraper.scrape_prices(names, max_workers=workers,
+                                                 timeout=10.0, client=client)
+            elapsed = time.perf_counter() - start
+            client.close()
+            assert [r[0] for r in result] == names
+            print(f"workers={workers:<3} {elapsed:7.3f}s "
+                  f"{args.products / elapsed:7.1f} products/s")
+
+
+if __name__ == "__main__":
+    main()
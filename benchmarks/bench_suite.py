@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+
+"""Benchmark suite for inventory and shopping list hot paths.
+
+Runs without GPU, camera or Internet connection: detection and
+capture are faked, while Trolley and Telegram are replaced by local
+stand-in servers. Results are compared against a stored baseline.
+
+Author:
+    Andrés Pérez
+"""
+
+import argparse
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from os.path import join, dirname, isfile
+from statistics import mean, median
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List
+
+# Add benchmarked modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+import price_scraper
+from http_client import HttpClient
+from detectors import Detection, FakeDetector
+from inventory_manager import InventoryManager
+from inventory_telebot import InventoryTelebot
+from local_servers import (LocalServer, FakeTelegram, FakeCamera,
+                           trolley_handler, free_port)
+
+PATH2BASELINE: str = join(dirname(__file__), "baseline.json")
+"""Results which later runs are compared against."""
+
+LABELS: List[str] = ["BACKGROUND", "honey", "water", "rice", "pasta"]
+"""Product classes known by fake detector."""
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Gets a percentile, as the nearest sorted value."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_manager(workdir: str, detect_latency: float, capture_latency: float) -> InventoryManager:
+    """Creates an inventory manager whose files live in a temporary folder."""
+    path2labels = join(workdir, "labels.txt")
+    with open(path2labels, "w") as labels_file:
+        labels_file.write("\n".join(LABELS))
+    InventoryManager._PATH2CONSTRAINTS = join(workdir, ".constraints.csv")
+    InventoryManager._PATH2PRICES = join(workdir, ".prices.json")
+    InventoryManager._PATH2HISTORY = join(workdir, ".history.bin")
+
+    # A few units of every product, so that a shopping list is needed.
+    detections = [Detection(class_id) for class_id in range(1, len(LABELS))
+                  for _ in range(class_id)]
+    return InventoryManager("", path2labels, "fake",
+                            price_workers=4, price_timeout=10.0,
+                            detector=FakeDetector(LABELS, detections, detect_latency),
+                            camera=FakeCamera(latency=capture_latency))
+
+
+def bench_inventory(manager: InventoryManager, rounds: int) -> Dict[str, float]:
+    """Measures `inventory()` latency, with warm price cache."""
+    manager.inventory()
+    latencies: List[float] = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        manager.inventory()
+        latencies.append(time.perf_counter() - start)
+    return {"inventory_mean_s": mean(latencies),
+            "inventory_p50_s": median(latencies),
+            "inventory_p95_s": percentile(latencies, 0.95)}
+
+
+def bench_scraper(product_counts: List[int], workers: int) -> Dict[str, float]:
+    """Measures price scraping throughput for several product counts."""
+    results: Dict[str, float] = {}
+    for count in product_counts:
+        names = [f"product{i}" for i in range(count)]
+        # Pages cached by earlier rounds must not be revalidated.
+        client = HttpClient(pool_size=workers)
+        start = time.perf_counter()
+        price_scraper.scrape_prices(names, max_workers=workers, timeout=10.0,
+                                    client=client)
+        results[f"scrape_{count}_products_per_s"] = count / (time.perf_counter() - start)
+        client.close()
+    return results
+
+
+def bench_transfer(product_count: int, workers: int) -> Dict[str, float]:
+    """Measures bytes received per product, on first and later refreshes."""
+    names = [f"product{i}" for i in range(product_count)]
+    client = HttpClient(pool_size=workers)
+    results: Dict[str, float] = {}
+    for refresh in ("first", "revalidated"):
+        received = client.bytes_received
+        price_scraper.scrape_prices(names, max_workers=workers, timeout=10.0,
+                                    client=client)
+        results[f"scrape_{refresh}_kb_per_product"] = \
+            (client.bytes_received - received) / product_count / 1024
+    client.close()
+    return results
+
+
+def bench_list(manager: InventoryManager,
+               workdir: str,
+               telegram_latency: float,
+               rounds: int) -> Dict[str, float]:
+    """Measures time from a /list message until its answer is sent."""
+    telegram = FakeTelegram(latency=telegram_latency)
+    InventoryTelebot._PATH2PHOTOS = join(workdir, ".photos.json")
+    with LocalServer(telegram.handler()) as server:
+        telebot = InventoryTelebot("123:BENCH", telegram.chat_id, manager,
+                                   base_url=server.url + "/bot")
+        telebot.start()
+        try:
+            def round_trip() -> float:
+                start = time.perf_counter()
+                telegram.send_command("/list")
+                telegram.wait_for("Shopping list")
+                return time.perf_counter() - start
+
+            # First round includes connection setup and bot info lookup.
+            round_trip()
+            latencies = [round_trip() for _ in range(rounds)]
+
+            tracemalloc.start()
+            round_trip()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            telebot.stop()
+
+    return {"list_mean_s": mean(latencies),
+            "list_p95_s": percentile(latencies, 0.95),
+            "list_peak_python_mb": peak / 2**20}
+
+
+def bench_updates(workdir: str, telegram_latency: float, rounds: int) -> Dict[str, float]:
+    """Measures time from a /help message until its answer, per update mode."""
+    InventoryTelebot._PATH2PHOTOS = join(workdir, ".photos.json")
+    results: Dict[str, float] = {}
+    for mode in ("polling", "webhook"):
+        telegram = FakeTelegram(latency=telegram_latency)
+        port = free_port()
+        with LocalServer(telegram.handler()) as server:
+            telebot = InventoryTelebot("123:BENCH", telegram.chat_id,
+                                       base_url=server.url + "/bot",
+                                       webhook_url=f"http://127.0.0.1:{port}/hook"
+                                       if mode == "webhook" else None,
+                                       webhook_port=port)
+            telebot.start()
+            try:
+                if telebot.mode != mode:
+                    raise RuntimeError(f"Bot could not start {mode}")
+
+                def round_trip() -> float:
+                    start = time.perf_counter()
+                    telegram.send_command("/help")
+                    telegram.wait_for("commands")
+                    return time.perf_counter() - start
+
+                round_trip()
+                latencies = [round_trip() for _ in range(rounds)]
+            finally:
+                telebot.stop()
+        results[f"help_{mode}_mean_s"] = mean(latencies)
+        results[f"help_{mode}_p95_s"] = percentile(latencies, 0.95)
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> bool:
+    """Prints each result next to its baseline, tells if none regressed."""
+    passed = True
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            print(f"{name:<32} {value:12.4f}")
+            continue
+        # Throughput must not drop, anything else must not grow.
+        numerator, denominator = (reference, value) if name.endswith("_per_s") \
+                                 else (value, reference)
+        ratio = numerator / denominator if denominator else \
+                1.0 if not numerator else float("inf")
+        regressed = ratio > tolerance
+        passed &= not regressed
+        print(f"{name:<32} {value:12.4f} baseline {reference:12.4f} "
+              f"x{ratio:5.2f}{'  REGRESSION' if regressed else ''}")
+    return passed
+
+
+def main() -> None:
+    """Runs benchmark suite"""
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--rounds", type=int, default=20,
+                            help="measured rounds per benchmark")
+    arg_parser.add_argument("--products", type=int, nargs="+", default=[4, 16, 64],
+                            help="product counts for scraping throughput")
+    arg_parser.add_argument("--workers", type=int, default=8,
+                            help="max-in-flight scraping requests")
+    arg_parser.add_argument("--trolley-latency", type=float, default=0.05,
+                            help="Trolley server latency per request, in seconds")
+    arg_parser.add_argument("--telegram-latency", type=float, default=0.02,
+                            help="Telegram server latency per request, in seconds")
+    arg_parser.add_argument("--detect-latency", type=float, default=0.03,
+                            help="fake detection time, in seconds")
+    arg_parser.add_argument("--capture-latency", type=float, default=0.01,
+                            help="fake capture time, in seconds")
+    arg_parser.add_argument("--tolerance", type=float, default=1.25,
+                            help="maximum slowdown ratio against baseline")
+    arg_parser.add_argument("--save-baseline", action="store_true",
+                            help="store results as new baseline")
+    args = arg_parser.parse_args()
+
+    results: Dict[str, float] = {}
+    with LocalServer(trolley_handler(args.trolley_latency)) as trolley, \
+         TemporaryDirectory() as workdir:
+        price_scraper.SOURCE_URL = trolley.url
+        manager = make_manager(workdir, args.detect_latency, args.capture_latency)
+        try:
+            benchmarks: List[Callable[[], Dict[str, float]]] = [
+                lambda: bench_inventory(manager, args.rounds),
+                lambda: bench_scraper(args.products, args.workers),
+                lambda: bench_transfer(max(args.products), args.workers),
+                lambda: bench_list(manager, workdir, args.telegram_latency, args.rounds),
+                lambda: bench_updates(workdir, args.telegram_latency, args.rounds),
+            ]
+            for benchmark in benchmarks:
+                results.update(benchmark())
+        finally:
+            manager.close()
+    # Peak resident memory of the whole process, in kilobytes on Linux.
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    if args.save_baseline:
+        with open(PATH2BASELINE, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {PATH2BASELINE}")
+
+    baseline: Dict[str, float] = {}
+    if isfile(PATH2BASELINE):
+        with open(PATH2BASELINE, "r") as f:
+            baseline = json.load(f)
+    if not compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
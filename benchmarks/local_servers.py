@@ -0,0 +1,298 @@
+"""Local stand-in servers for benchmarking purposes.
+
+Remote websites are replaced by HTTP servers running on
+localhost, so that measurements do not depend on Internet
+connection quality.
+
+Author:
+    Andrés Pérez
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Condition
+from os.path import join, dirname
+from urllib.parse import parse_qsl
+from urllib.request import Request, urlopen
+import socket
+from hashlib import sha256
+import gzip
+import numpy as np
+import json
+import time
+from typing import Any, Dict, List, Optional, Type
+
+HTML_TEST_FILE: str = join(dirname(dirname(__file__)), "tests",
+                           "honey-Trolley.co.uk-test.txt")
+"""Saved search page used as response body for every request."""
+
+
+def free_port() -> int:
+    """Finds a local TCP port nobody is listening on."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class LocalServer:
+    """Runs an HTTP server on a background thread.
+
+    Args:
+        handler: Request handler class for the server.
+
+    Attributes:
+        url: Base url the server can be reached at.
+
+    Example::
+
+        >>> with LocalServer(handler) as server:
+        ...     requests.get(server.url)
+    """
+
+    def __init__(self, handler: Type[BaseHTTPRequestHandler]) -> None:
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        host, port = self._server.server_address[:2]
+        self.url: str = f"http://{host}:{port}"
+
+    def __enter__(self) -> "LocalServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def trolley_handler(latency: float = 0.0) -> Type[BaseHTTPRequestHandler]:
+    """Makes a request handler that imitates Trolley search pages.
+
+    Pages are gzip compressed on demand, and revalidated through
+    their `ETag`.
+
+    Args:
+        latency: Seconds to wait before answering each request.
+
+    Returns:
+        Handler class to be passed to `LocalServer`.
+    """
+    with open(HTML_TEST_FILE, "rb") as f:
+        body: bytes = f.read()
+    compressed: bytes = gzip.compress(body)
+    # Every page stays the same, so they all share one validator.
+    etag: str = '"' + sha256(body).hexdigest()[:16] + '"'
+
+    class TrolleyHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:
+            time.sleep(latency)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+            content = compressed if gzipped else body
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.send_header("ETag", etag)
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *_) -> None:
+            # Keep benchmark output clean.
+            pass
+
+    return TrolleyHandler
+
+
+class FakeTelegram:
+    """Imitates the Telegram Bot API methods used by the chatbot.
+
+    Updates are delivered through long polling or, once the bot sets
+    a webhook, posted straight to it. Either way, a bot running
+    against it goes through its real network path.
+
+    Args:
+        latency: Seconds to wait before answering each request.
+        chat_id: Numeric id of the only chat.
+
+    Attributes:
+        sent: Method name and parameters of every message sent by the bot.
+        webhook_url: Url updates are posted to, `None` if bot polls them.
+
+    Example::
+
+        >>> telegram = FakeTelegram(latency=0.05)
+        >>> with LocalServer(telegram.handler()) as server:
+        ...     bot = InventoryTelebot("123:TEST", 42, base_url=server.url + "/bot")
+        ...     bot.start()
+        ...     telegram.send_command("/list")
+        ...     telegram.wait_for("Shopping list")
+    """
+
+    def __init__(self, latency: float = 0.0, chat_id: int = 42) -> None:
+        self.latency = latency
+        self.chat_id = chat_id
+        self.sent: List[Dict[str, Any]] = []
+        self.webhook_url: Optional[str] = None
+        self._updates: List[Dict[str, Any]] = []
+        self._next_update = 1
+        self._changed = Condition()
+
+    def send_command(self, text: str) -> None:
+        """Makes a user message available to the bot.
+
+        Args:
+            text: Message text, such as ``"/list"``.
+        """
+        message = self._message(text)
+        command = text.split()[0]
+        if command.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0,
+                                    "length": len(command)}]
+        with self._changed:
+            update = {"update_id": self._next_update, "message": message}
+            self._next_update += 1
+            if self.webhook_url is None:
+                self._updates.append(update)
+                self._changed.notify_all()
+                return
+
+        request = Request(self.webhook_url, data=json.dumps(update).encode(),
+                          headers={"Content-Type": "application/json"})
+        with urlopen(request, timeout=10.0):
+            pass
+
+    def wait_for(self, text: str, timeout: float = 30.0) -> Dict[str, Any]:
+        """Waits until the bot sends a message that contains some text.
+
+        Args:
+            text: Text to look for.
+            timeout: Seconds to wait.
+
+        Returns:
+            Parameters of such message, which is removed from `sent`.
+
+        Raises:
+            TimeoutError: If no such message arrives in time.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                for index, params in enumerate(self.sent):
+                    if text in str(params.get("text", "")):
+                        return self.sent.pop(index)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Bot did not send {text!r}")
+                self._changed.wait(remaining)
+
+    def handler(self) -> Type[BaseHTTPRequestHandler]:
+        """Makes a request handler to be passed to `LocalServer`."""
+        telegram = self
+
+        class TelegramHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written apart, do not wait for an ACK in between.
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                method = self.path.rsplit("/", 1)[-1]
+                result = telegram._answer(method, self._params(body))
+                data = json.dumps({"ok": True, "result": result}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _params(self, body: bytes) -> Dict[str, Any]:
+                content_type = self.headers.get("Content-Type", "")
+                if content_type.startswith("application/json"):
+                    return json.loads(body or b"{}")
+                if content_type.startswith("multipart/form-data"):
+                    # Uploaded files are not needed, only their size.
+                    return {"upload_size": len(body)}
+                return dict(parse_qsl(body.decode()))
+
+            def log_message(self, *_) -> None:
+                # Keep benchmark output clean.
+                pass
+
+        return TelegramHandler
+
+    def _answer(self, method: str, params: Dict[str, Any]) -> Any:
+        if method in ("setWebhook", "deleteWebhook"):
+            self.webhook_url = params.get("url") or None
+            return True
+        if method == "getUpdates":
+            return self._poll(int(params.get("offset") or 0),
+                              float(params.get("timeout") or 0))
+        time.sleep(self.latency)
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "DeepPantryBot",
+                    "username": "DeepPantryBot"}
+        if method in ("sendMessage", "sendPhoto"):
+            message = self._message(params.get("text", ""), from_bot=True)
+            if method == "sendPhoto":
+                file_id = params.get("photo") if isinstance(params.get("photo"), str) \
+                          else f"photo-{len(self.sent)}"
+                message["photo"] = [{"file_id": file_id, "file_unique_id": file_id,
+                                     "width": 640, "height": 480}]
+            with self._changed:
+                self.sent.append(dict(params, method=method))
+                self._changed.notify_all()
+            return message
+        # Webhook deletion and alike only need an acknowledgement.
+        return True
+
+    def _poll(self, offset: int, timeout: float) -> List[Dict[str, Any]]:
+        # Short polls let a stopping bot exit quickly.
+        deadline = time.monotonic() + min(timeout, 0.5)
+        with self._changed:
+            # Updates below offset were already confirmed by the bot.
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._changed.wait(deadline - time.monotonic())
+            return list(self._updates)
+
+    def _message(self, text: str, from_bot: bool = False) -> Dict[str, Any]:
+        user = {"id": 1 if from_bot else self.chat_id, "is_bot": from_bot,
+                "first_name": "DeepPantryBot" if from_bot else "User"}
+        return {"message_id": self._next_update, "date": int(time.time()),
+                "chat": {"id": self.chat_id, "type": "private"},
+                "from": user, "text": text}
+
+
+class FakeCamera:
+    """Video source that returns random frames.
+
+    Args:
+        width: Frame width, in pixels.
+        height: Frame height, in pixels.
+        latency: Seconds each capture takes.
+        frames: Number of distinct frames to cycle through.
+    """
+
+    def __init__(self,
+                 width: int = 1280,
+                 height: int = 720,
+                 latency: float = 0.0,
+                 frames: int = 4) -> None:
+        rng = np.random.default_rng(0)
+        self._frames = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+                        for _ in range(frames)]
+        self._latency = latency
+        self._count = 0
+
+    def Capture(self) -> np.ndarray:
+        time.sleep(self._latency)
+        self._count += 1
+        return self._frames[self._count % len(self._frames)]
@@ -0,0 +1,209 @@
+"""A single camera watching a pantry shelf.
+
+This module keeps capture state of each video source apart,
+so that several shelves can be analyzed independently.
+
+Author:
+    Andrés Pérez
+"""
+
+from frame_buffer import FrameBuffer, copy_image
+from scene_change import SceneChangeDetector
+from jpeg_encoder import JpegEncoder
+from detectors import to_numpy
+from metrics import METRICS
+from threading import Lock
+from hashlib import sha256
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class CameraSource:
+    """Captures frames from one camera and counts products on them.
+
+    Every source keeps its own frame buffer, capture interval and
+    scene change reference, so a slow or broken camera does not
+    affect any other.
+
+    Args:
+        name: Source identifier, such as its input uri.
+        camera: Video source with a `Capture()` method.
+        count_products: Function that counts products per class on a frame.
+        encoder: JPEG encoder for pictures of this source.
+        frame_buffer_size: If positive, number of latest frames captured
+            continuously in background. Otherwise, frames are captured
+            on demand.
+        frame_max_age: Maximum seconds a buffered frame can be reused for.
+        capture_interval: Seconds between two background captures. When
+            capturing on demand, minimum seconds between two captures,
+            requests in between reuse the last frame.
+        capture_timeout: Seconds to wait for a buffered frame.
+        scene_change: If given, decides whether detection can be skipped.
+
+    Attributes:
+        name: Source identifier.
+        scene_change: Decides whether detection can be skipped, including
+            skip counters. `None` if disabled.
+        counts: Product counts per class from last successful update,
+            `None` if there was none yet.
+        updated: Time of last successful update, as given by `time.monotonic`.
+        error: Description of last failed update, `None` if it succeeded.
+
+    Example::
+
+        >>> source = CameraSource("/dev/video0", videoSource("/dev/video0"), count)
+        >>> source.update()
+        {'honey': 3}
+    """
+
+    def __init__(self,
+                 name: str,
+                 camera: Any,
+                 count_products: Callable[[Any], Dict[str, int]],
+                 encoder: Optional[JpegEncoder] = None,
+                 frame_buffer_size: int = 0,
+                 frame_max_age: float = 1.0,
+                 capture_interval: float = 0.0,
+                 capture_timeout: float = 5.0,
+                 scene_change: Optional[SceneChangeDetector] = None) -> None:
+        self.name = name
+        self._camera = camera
+        self._count_products = count_products
+        self._encoder = encoder if encoder is not None else JpegEncoder()
+        self._frame_max_age = frame_max_age
+        self._capture_timeout = capture_timeout
+        self._capture_interval = capture_interval
+        # Time and copy of last frame captured on demand, if any.
+        self._captured: Optional[Tuple[float, Any]] = None
+        self._frames: Optional[FrameBuffer] = None
+        if frame_buffer_size > 0:
+            # Copy frames, camera buffers get recycled on later captures.
+            self._frames = FrameBuffer(camera,
+                                       size=frame_buffer_size,
+                                       interval=capture_interval,
+                                       copy=copy_image)
+        self.scene_change = scene_change
+        # Serializes updates, scene reference and counts must stay coupled.
+        self._lock = Lock()
+        self._frame: Optional[Any] = None
+        # Tells unchanged pictures apart from sensor noise, if detection does not.
+        self._photo_scene = SceneChangeDetector() if scene_change is None else None
+        self._photo_lock = Lock()
+
+        self.counts: Optional[Dict[str, int]] = None
+        self.updated: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        """Starts background capture, if enabled."""
+        if self._frames is not None:
+            self._frames.start()
+
+    def stop(self) -> None:
+        """Stops background capture, if enabled."""
+        if self._frames is not None:
+            self._frames.stop()
+
+    def update(self) -> Dict[str, int]:
+        """Captures a new frame and counts products on it.
+
+        Returns:
+            Number of units per product class.
+
+        Raises:
+            TimeoutError: If background capture does not deliver a frame.
+        """
+        with self._lock:
+            try:
+                self._frame = self.capture()
+                counts = self._count(self._frame)
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                if self.scene_change is not None:
+                    # Next frame must not be compared against an uncounted one.
+                    self.scene_change.reset()
+                raise
+            self.counts = counts
+            self.updated = time.monotonic()
+            self.error = None
+            return dict(counts)
+
+    def capture(self) -> Any:
+        """Gets a recent frame from camera.
+
+        Returns:
+            Captured image.
+
+        Raises:
+            TimeoutError: If background capture does not deliver a frame.
+        """
+        with METRICS.timer("capture"):
+            if self._frames is None:
+                return self._capture_on_demand()
+            # Reuse a buffered frame, as long as it is recent enough.
+            return self._frames.get(self._frame_max_age, self._capture_timeout)[1]
+
+    def picture(self, previous: bool = False) -> bytes:
+        """Picture taken by this source.
+
+        Args:
+            previous: If `True` and `update` has been called at least
+                once, get picture from last update.
+
+        Returns:
+            JPEG image contents.
+        """
+        return self.photo(previous)[0]
+
+    def photo(self, previous: bool = False) -> Tuple[bytes, str]:
+        """Picture taken by this source, along with a key of its scene.
+
+        Args:
+            previous: If `True` and `update` has been called at least
+                once, get picture from last update.
+
+        Returns:
+            JPEG image contents, and a key that stays the same for
+            every picture of an unchanged scene.
+        """
+        with self._lock:
+            if not previous or self._frame is None:
+                self._frame = self.capture()
+            frame = self._frame
+        data = self._encoder.encode(frame)
+
+        image = to_numpy(frame)
+        if self._photo_scene is None:
+            key = self.scene_change.reference_key(image)
+        else:
+            with self._photo_lock:
+                self._photo_scene.has_changed(image)
+                key = self._photo_scene.reference_key(image)
+        # Pictures of a scene that is not the reference one are only equal to themselves.
+        return data, ("scene-" + key) if key is not None else sha256(data).hexdigest()
+
+    def _capture_on_demand(self) -> Any:
+        # Camera is not captured more often than its interval allows.
+        if self._capture_interval <= 0:
+            return self._camera.Capture()
+        captured = self._captured
+        if captured is not None and \
+           time.monotonic() - captured[0] < self._capture_interval:
+            METRICS.increment("capture_reused")
+            return captured[1]
+        # Copy frame, camera buffers get recycled while it is reused.
+        frame = copy_image(self._camera.Capture())
+        self._captured = (time.monotonic(), frame)
+        return frame
+
+    def _count(self, frame: Any) -> Dict[str, int]:
+        if self.scene_change is not None:
+            with METRICS.timer("scene_change"):
+                changed = self.scene_change.has_changed(to_numpy(frame))
+            logging.debug(f"{self.name}: {self.scene_change.report()}")
+            # Reuse previous counts if scene looks the same.
+            if not changed and self.counts is not None:
+                METRICS.increment("detection_skipped")
+                return self.counts
+        return self._count_products(frame)
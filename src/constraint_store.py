@@ -0,0 +1,165 @@
+"""In-memory store for product unit constraints.
+
+This module keeps minimum units per product in memory,
+backed by a csv file that is only read when it changes.
+
+Author:
+    Andrés Pérez
+"""
+
+from threading import Lock
+from os import replace, remove, stat, fsync, chmod
+from os.path import isfile, dirname
+from stat import S_IMODE
+from tempfile import NamedTemporaryFile
+import csv
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class UnkownClassNameError(Exception):
+    """Product class with such name is not supported."""
+
+
+class InvalidConstraintError(Exception):
+    """Product unit constraint value is wrong."""
+
+
+class ConstraintStore:
+    """Minimum number of units that should be available per product.
+
+    Constraints are cached in memory and file contents are parsed
+    again only if its modification time or size changes, so that
+    manual edits are still taken into account.
+
+    Updates replace the whole file at once via a temporary file,
+    hence a crash while writing never leaves a truncated file.
+
+    Note:
+        You can get a deeper understsanding about
+        constraints file format under `CONFIG.md`.
+
+    Args:
+        path: Path to a csv file that stores constraints.
+        classes: Product names used to create a default file, if missing.
+
+    Example::
+
+        >>> store = ConstraintStore("../config/.constraints.csv", ("honey", "water"))
+        >>> store.update({"honey": 2, "water": 1})
+        >>> store.constraints()
+        {'honey': 2, 'water': 1}
+    """
+
+    _HEADERS: Tuple[str, str] = ("Class", "Constraint")
+
+    def __init__(self, path: str, classes: Iterable[str] = ()) -> None:
+        self._path = path
+        self._lock = Lock()
+        self._headers: List[str] = list(self._HEADERS)
+        self._constraints: Dict[str, int] = {}
+        # File modification time and size for last loaded contents.
+        self._signature: Optional[Tuple[int, int]] = None
+        # Increased whenever loaded contents may have changed.
+        self._version = 0
+
+        if not isfile(self._path):
+            # Create default constraints for each object class.
+            with self._lock:
+                self._write({class_name: 0 for class_name in classes})
+
+    def constraints(self) -> Dict[str, int]:
+        """Current constraints, reloaded only if the file has changed.
+
+        Returns:
+            Minimum units that can be accessed by product name.
+
+        Raises:
+            FileNotFoundError: If constraints file does not exist.
+            ValueError: If a constraint value is not an integer.
+        """
+        with self._lock:
+            if self._file_signature() != self._signature:
+                self._load()
+            return dict(self._constraints)
+
+    def changed_since(self, version: int) -> Tuple[int, Optional[Dict[str, int]]]:
+        """Current constraints, only if they may differ from an older version.
+
+        Args:
+            version: Version returned by a previous call, or -1 if none.
+
+        Returns:
+            Current version, and minimum units by product name or `None`
+            if nothing was loaded or written since `version`.
+
+        Raises:
+            FileNotFoundError: If constraints file does not exist.
+            ValueError: If a constraint value is not an integer.
+        """
+        with self._lock:
+            if self._file_signature() != self._signature:
+                self._load()
+            if version == self._version:
+                return version, None
+            return self._version, dict(self._constraints)
+
+    def update(self, constraints: Dict[str, int]) -> None:
+        """Sets new constraints for several products in a single write.
+
+        Args:
+            constraints: New minimum units by product name.
+
+        Raises:
+            FileNotFoundError: If constraints file does not exist.
+            ValueError: If a stored constraint value is not an integer.
+        """
+        with self._lock:
+            if self._file_signature() != self._signature:
+                self._load()
+            new_data = dict(self._constraints)
+            new_data.update(constraints)
+            self._write(new_data)
+
+    def _file_signature(self) -> Tuple[int, int]:
+        file_stat = stat(self._path)
+        return file_stat.st_mtime_ns, file_stat.st_size
+
+    def _load(self) -> None:
+        signature = self._file_signature()
+        with open(self._path, "r", newline="") as csv_file:
+            csv_reader = csv.DictReader(csv_file)
+            # Get column headers and constraint field for each product.
+            class_h, constraint_h = csv_reader.fieldnames
+            constraints = {row[class_h]: int(row[constraint_h])
+                           for row in csv_reader}
+        self._headers = [class_h, constraint_h]
+        self._constraints = constraints
+        self._signature = signature
+        self._version += 1
+
+    def _write(self, constraints: Dict[str, int]) -> None:
+        # Write a whole new file next to the old one, then swap them.
+        with NamedTemporaryFile("w", newline="", delete=False,
+                                dir=dirname(self._path),
+                                prefix=".constraints_", suffix=".tmp") as csv_file:
+            csv_writer = csv.writer(csv_file)
+            csv_writer.writerow(self._headers)
+            csv_writer.writerows(constraints.items())
+            csv_file.flush()
+            fsync(csv_file.fileno())
+        created = not isfile(self._path)
+        try:
+            # Temporary files are private, keep permissions of the replaced
+            # file, or those of a file created as usual.
+            if created:
+                open(self._path, "a").close()
+            chmod(csv_file.name, S_IMODE(stat(self._path).st_mode))
+            replace(csv_file.name, self._path)
+        except OSError:
+            remove(csv_file.name)
+            if created and isfile(self._path):
+                remove(self._path)
+            raise
+        self._constraints = constraints
+        self._signature = self._file_signature()
+        self._version += 1
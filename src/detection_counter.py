@@ -0,0 +1,175 @@
+"""Bulk post-processing of detected objects.
+
+This module filters detections by class confidence and box size,
+then counts them per product with array operations, so that dense
+shelves with hundreds of objects are counted at once.
+
+Author:
+    Andrés Pérez
+"""
+
+import numpy as np
+from detectors import Detection, box_areas, detection_arrays
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+
+class DetectionCounter:
+    """Counts detected objects per product class.
+
+    Class names are resolved once, into a table from class index to
+    product position, instead of being looked up for every object.
+
+    Args:
+        labels: Class names by class index, including BACKGROUND class.
+        threshold: Minimum confidence for an object to be counted.
+        class_thresholds: Minimum confidence of certain classes, by
+            class name, replacing `threshold` for them.
+        min_area: Minimum box area for an object to be counted, in
+            square pixels.
+
+    Raises:
+        ValueError: If a class name in `class_thresholds` is unknown.
+
+    Attributes:
+        classes: Names of counted classes, lowercase, without BACKGROUND.
+
+    Example::
+
+        >>> counter = DetectionCounter(["BACKGROUND", "Honey", "Rice"],
+        ...                            threshold=0.5, class_thresholds={"rice": 0.8})
+        >>> counter.count([Detection(1, 0.6), Detection(2, 0.6), Detection(2, 0.9)])
+        {'honey': 1, 'rice': 1}
+    """
+
+    def __init__(self,
+                 labels: Sequence[str],
+                 threshold: float = 0.0,
+                 class_thresholds: Optional[Mapping[str, float]] = None,
+                 min_area: float = 0.0) -> None:
+        names = [label.lower() for label in labels]
+        self.classes: Tuple[str, ...] = tuple(name for name in names
+                                              if name != "background")
+        # Product position of each class index, -1 for BACKGROUND.
+        positions = {name: position for position, name in enumerate(self.classes)}
+        self._positions = np.array([positions.get(name, -1) for name in names],
+                                   dtype=np.int64)
+
+        self._thresholds = np.full(len(names), threshold, dtype=np.float64)
+        for name, class_threshold in (class_thresholds or {}).items():
+            if name.lower() not in positions:
+                raise ValueError(f"Unknown class for confidence threshold: {name}")
+            self._thresholds[names.index(name.lower())] = class_threshold
+        self._min_area = min_area
+
+    def count(self, detections: Sequence[Detection]) -> Dict[str, int]:
+        """Counts objects that pass every filter.
+
+        Args:
+            detections: Detected objects.
+
+        Returns:
+            Number of units per product class, only for those found.
+        """
+        if not detections:
+            return {}
+        # Backends that return lists get their objects gathered first.
+        class_ids, confidences, boxes = detection_arrays(detections)
+        return self.count_arrays(class_ids, confidences,
+                                 box_areas(boxes) if self._min_area > 0 else None)
+
+    def count_arrays(self,
+                     class_ids: np.ndarray,
+                     confidences: np.ndarray,
+                     areas: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """Counts objects given as arrays, one element per object.
+
+        Args:
+            class_ids: Index of object class within labels file.
+            confidences: Detection confidence [0, 1].
+            areas: Box area in square pixels, only needed to filter by size.
+
+        Returns:
+            Number of units per product class, only for those found.
+        """
+        positions = self._positions[class_ids[self._kept(class_ids, confidences, areas)]]
+        totals = np.bincount(positions[positions >= 0], minlength=len(self.classes))
+        return {self.classes[position]: int(totals[position])
+                for position in np.flatnonzero(totals)}
+
+    def count_regions(self,
+                      detections: Sequence[Detection],
+                      regions: Mapping[str, Tuple[float, float, float, float]]
+                      ) -> Dict[str, Dict[str, int]]:
+        """Counts objects that pass every filter, within each region.
+
+        Objects belong to the first region their box center lies in,
+        those outside every region are not counted.
+
+        Args:
+            detections: Detected objects.
+            regions: Corner coordinates (left, top, right, bottom) of
+                each region, in pixels, by region name.
+
+        Returns:
+            Number of units per product class, only for those found,
+            by region name.
+        """
+        if not detections:
+            return {name: {} for name in regions}
+        return self.count_regions_arrays(*detection_arrays(detections), regions)
+
+    def count_regions_arrays(self,
+                             class_ids: np.ndarray,
+                             confidences: np.ndarray,
+                             boxes: np.ndarray,
+                             regions: Mapping[str, Tuple[float, float, float, float]]
+                             ) -> Dict[str, Dict[str, int]]:
+        """Counts objects given as arrays, within each region.
+
+        Args:
+            class_ids: Index of object class within labels file.
+            confidences: Detection confidence [0, 1].
+            boxes: Corner coordinates (left, top, right, bottom) per object.
+            regions: Corner coordinates of each region, in pixels, by
+                region name.
+
+        Returns:
+            Number of units per product class, only for those found,
+            by region name.
+        """
+        names = list(regions)
+        counts: Dict[str, Dict[str, int]] = {name: {} for name in names}
+        if not class_ids.size or not names:
+            return counts
+
+        centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+        centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+        corners = np.array(list(regions.values()), dtype=np.float64)
+        # Whether each object lies within each region, one row per region.
+        inside = (centers_x >= corners[:, :1]) & (centers_x < corners[:, 2:3]) & \
+                 (centers_y >= corners[:, 1:2]) & (centers_y < corners[:, 3:])
+        region_ids = np.where(inside.any(axis=0), inside.argmax(axis=0), -1)
+
+        areas = box_areas(boxes) if self._min_area > 0 else None
+        kept = self._kept(class_ids, confidences, areas) & (region_ids >= 0)
+        positions = self._positions[class_ids[kept]]
+        valid = positions >= 0
+        # Both indices are counted at once, as a flat region by class table.
+        totals = np.bincount(region_ids[kept][valid] * len(self.classes) + positions[valid],
+                             minlength=len(names) * len(self.classes)
+                             ).reshape(len(names), len(self.classes))
+        for name, region_totals in zip(names, totals):
+            counts[name] = {self.classes[position]: int(region_totals[position])
+                            for position in np.flatnonzero(region_totals)}
+        return counts
+
+    def _kept(self,
+              class_ids: np.ndarray,
+              confidences: np.ndarray,
+              areas: Optional[np.ndarray]) -> np.ndarray:
+        # Class indices out of labels range are never counted.
+        known = (class_ids >= 0) & (class_ids < len(self._positions))
+        kept = known & (confidences >= self._thresholds[np.where(known, class_ids, 0)])
+        if areas is not None and self._min_area > 0:
+            kept &= areas >= self._min_area
+        return kept
@@ -0,0 +1,569 @@
+"""Capture and detection isolated in their own process.
+
+This module runs cameras and object detection apart from the chatbot
+and the price scraper, so that neither slows the other down, and
+restarts them whenever they crash.
+
+Author:
+    Andrés Pérez
+"""
+
+from collections import deque
+import ctypes
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+from threading import Thread, Event
+import weakref
+import logging
+import signal
+import time
+from detectors import Detection, Detector, load_labels, to_numpy
+from metrics import METRICS
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+# Fields of each slot: publication number, capture time, shape and detections.
+_SEQ, _TIME, _HEIGHT, _WIDTH, _CHANNELS, _COUNT = range(6)
+# Fields of each detection: class id, confidence and box corners.
+_BOX_FIELDS = 6
+# Fields shared by the whole ring.
+_LATEST, _PUBLISHED, _BEAT = range(3)
+# Seconds between two checks for a new frame.
+_POLL_INTERVAL = 0.005
+# Seconds an idle worker waits for a frame request, between heartbeats.
+_IDLE_BEAT = 1.0
+
+
+def open_video_source(input_uri: str) -> Any:
+    """Opens a video source, loading Jetson libraries on demand.
+
+    Args:
+        input_uri: Resource id for an image/camera input.
+
+    Returns:
+        Video source with a `Capture()` method.
+    """
+    from jetson.utils import videoSource
+    return videoSource(input_uri)
+
+
+class SharedFrame(np.ndarray):
+    """Image whose pixels live within a `FrameRing`.
+
+    Frames are read-only, and their ring slot is not written again
+    until every array that uses its memory, including views derived
+    from it, is released.
+
+    Attributes:
+        timestamp: Capture time, as given by `time.monotonic`.
+        detections: Objects detected on this image by worker process.
+    """
+
+    def __array_finalize__(self, obj: Optional[np.ndarray]) -> None:
+        self.timestamp: float = getattr(obj, "timestamp", 0.0)
+        self.detections: List[Detection] = getattr(obj, "detections", [])
+
+
+class _SlotMemory:
+    # Exposes part of a ring slot as array memory. Arrays keep it as their
+    # base, along with every view derived from them, so it lives as long
+    # as any of them does.
+    def __init__(self, pixels: Any, offset: int, shape: Tuple[int, ...]) -> None:
+        self._pixels = pixels
+        self.__array_interface__ = {"data": (ctypes.addressof(pixels) + offset, True),
+                                    "shape": shape,
+                                    "typestr": "|u1",
+                                    "version": 3}
+
+
+class FrameRing:
+    """Frames and their detections, shared between processes.
+
+    Memory is allocated once by the process that creates the ring,
+    and inherited by worker processes started afterwards. A single
+    writer fills a free slot and publishes it as latest frame, while
+    readers get arrays backed by the shared memory itself, pixels
+    are never copied on their way out.
+
+    Slots whose frames are still referenced by a reader are pinned,
+    the writer skips them. Hence, at least one slot more than frames
+    held at once, plus the latest one, is needed to keep publishing.
+
+    Readers never wait for the shared lock without a timeout, nor are
+    they notified by the writer, they check for new frames instead.
+    Thus a writer terminated while holding the lock cannot block them
+    forever, but such ring must not be written anymore.
+
+    Note:
+        Slots are pinned and released by the process that created the
+        ring, which must be the only reader.
+
+    Args:
+        slots: Number of frames stored at once.
+        max_width: Maximum frame width, in pixels.
+        max_height: Maximum frame height, in pixels.
+        channels: Maximum number of channels per pixel.
+        max_detections: Maximum number of detections stored per frame,
+            further ones are discarded.
+        context: Multiprocessing context workers are started from,
+            `spawn` by default.
+
+    Raises:
+        ValueError: If there are less than 3 slots.
+
+    Example::
+
+        >>> ring = FrameRing(slots=4, max_width=1280, max_height=720)
+        >>> ring.publish(image, detector.detect(image))
+        True
+        >>> frame = ring.acquire(max_age=1.0, timeout=5.0)
+        >>> frame.shape, len(frame.detections)
+        ((720, 1280, 3), 4)
+    """
+
+    def __init__(self,
+                 slots: int,
+                 max_width: int,
+                 max_height: int,
+                 channels: int = 3,
+                 max_detections: int = 256,
+                 context: Optional[Any] = None) -> None:
+        if slots < 3:
+            raise ValueError(f"Invalid number of ring slots: {slots}")
+
+        context = context if context is not None else multiprocessing.get_context("spawn")
+        self._slots = slots
+        self._max_width = max_width
+        self._max_height = max_height
+        self._channels = channels
+        self._capacity = max_width * max_height * channels
+        self._max_detections = max_detections
+        self._lock = context.Lock()
+        self._pixels = RawArray(ctypes.c_uint8, slots * self._capacity)
+        self._meta = RawArray(ctypes.c_double, slots * 6)
+        self._boxes = RawArray(ctypes.c_double, slots * max_detections * _BOX_FIELDS)
+        self._state = RawArray(ctypes.c_double, 3)
+        self._pins = RawArray(ctypes.c_int, slots)
+        self._state[_LATEST] = -1
+        self._map()
+
+    @property
+    def published(self) -> int:
+        """Number of frames published so far."""
+        return int(self._state[_PUBLISHED])
+
+    @property
+    def heartbeat(self) -> float:
+        """Last time writer reported progress, 0 if it did not yet."""
+        return float(self._state[_BEAT])
+
+    def beat(self, timestamp: Optional[float] = None) -> None:
+        """Reports writer progress.
+
+        Args:
+            timestamp: Time to report, now by default.
+        """
+        self._state[_BEAT] = time.monotonic() if timestamp is None else timestamp
+
+    def fit(self,
+            image: np.ndarray,
+            detections: Sequence[Detection]) -> Tuple[np.ndarray, List[Detection]]:
+        """Shrinks a frame larger than ring slots, so that it can be published.
+
+        Pixels are subsampled by the smallest integer factor that makes
+        the frame fit, and detection boxes are scaled along. Channels
+        beyond ring capacity, such as alpha, are dropped.
+
+        Args:
+            image: Frame to be published.
+            detections: Objects detected on image.
+
+        Returns:
+            Image and detections, as given if they already fit.
+        """
+        if image.ndim == 3 and image.shape[2] > self._channels:
+            image = image[..., :self._channels]
+        height, width = image.shape[:2]
+        factor = max(1, -(-height // self._max_height), -(-width // self._max_width))
+        if factor == 1:
+            return image, list(detections)
+        return image[::factor, ::factor], [
+            Detection(obj.class_id, obj.confidence, obj.left / factor, obj.top / factor,
+                      obj.right / factor, obj.bottom / factor) for obj in detections]
+
+    def publish(self,
+                image: np.ndarray,
+                detections: Sequence[Detection],
+                timestamp: Optional[float] = None) -> bool:
+        """Stores a frame and makes it the latest one.
+
+        Args:
+            image: 8-bit image, with up to `max_width` by `max_height` pixels.
+            detections: Objects detected on image.
+            timestamp: Capture time, now by default.
+
+        Returns:
+            Whether frame was stored, `False` if every slot is pinned.
+
+        Raises:
+            ValueError: If image does not fit within a slot, see `fit`.
+        """
+        if image.dtype != np.uint8 or image.size > self._capacity or \
+           image.ndim not in (2, 3):
+            raise ValueError(f"Image does not fit in ring: {image.shape} {image.dtype}")
+
+        with self._lock:
+            latest = int(self._state[_LATEST])
+            # Oldest slot that is not pinned, latest one is always kept.
+            slot = next((slot for slot in ((latest + i) % self._slots
+                                           for i in range(1, self._slots))
+                         if not self._pins[slot]), None)
+        if slot is None:
+            return False
+
+        # Nobody reads this slot, pixels are copied without holding the lock.
+        self._pixel_view[slot, :image.size] = image.reshape(-1)
+        detections = detections[:self._max_detections]
+        for row, obj in zip(self._box_view[slot], detections):
+            row[:] = (obj.class_id, obj.confidence, obj.left, obj.top, obj.right, obj.bottom)
+
+        height, width = image.shape[:2]
+        with self._lock:
+            self._meta_view[slot] = (self.published + 1,
+                                     time.monotonic() if timestamp is None else timestamp,
+                                     height, width,
+                                     image.shape[2] if image.ndim == 3 else 0,
+                                     len(detections))
+            self._state[_LATEST] = slot
+            self._state[_PUBLISHED] += 1
+        return True
+
+    def acquire(self, max_age: float, timeout: Optional[float] = None) -> SharedFrame:
+        """Newest frame, waiting for a new one if it is too old.
+
+        Args:
+            max_age: Maximum seconds elapsed since frame capture.
+            timeout: Seconds to wait for a new frame, `None` waits forever
+                and 0 only checks once.
+
+        Returns:
+            Frame backed by shared memory, with its detections.
+
+        Raises:
+            TimeoutError: If no recent enough frame arrives in time.
+        """
+        oldest = time.monotonic() - max_age
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = 1.0 if deadline is None else deadline - time.monotonic()
+            if self._lock.acquire(timeout=max(remaining, 0.0)):
+                try:
+                    taken = self._take(oldest)
+                finally:
+                    self._lock.release()
+                if taken is not None:
+                    break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"No frame published within {timeout}s")
+            time.sleep(_POLL_INTERVAL)
+
+        slot, (_, timestamp, height, width, channels, _), boxes = taken
+
+        shape = (int(height), int(width)) + ((int(channels),) if channels else ())
+        memory = _SlotMemory(self._pixels, slot * self._capacity, shape)
+        # Slot is released on a later acquisition, finalizers must not lock.
+        weakref.finalize(memory, self._released.append, slot)
+        frame = np.asarray(memory).view(SharedFrame)
+        frame.timestamp = timestamp
+        frame.detections = [Detection(int(box[0]), *box[1:]) for box in boxes]
+        return frame
+
+    def _take(self, oldest: float) -> Optional[Tuple[int, List[float], List[List[float]]]]:
+        # Pins latest slot if it is recent enough, lock must be held.
+        # Slots of frames nobody references anymore are released first.
+        while self._released:
+            self._pins[self._released.popleft()] -= 1
+        slot = int(self._state[_LATEST])
+        if slot < 0 or self._meta_view[slot, _TIME] < oldest:
+            return None
+        self._pins[slot] += 1
+        meta = self._meta_view[slot].tolist()
+        return slot, meta, self._box_view[slot, :int(meta[_COUNT])].tolist()
+
+    def _map(self) -> None:
+        # Array views over shared memory, which cannot be pickled.
+        self._pixel_view = np.frombuffer(self._pixels, np.uint8).reshape(self._slots, -1)
+        self._meta_view = np.frombuffer(self._meta, np.float64).reshape(self._slots, -1)
+        self._box_view = np.frombuffer(self._boxes, np.float64).reshape(
+            self._slots, self._max_detections, _BOX_FIELDS)
+        self._released: Deque[int] = deque()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        for view in ("_pixel_view", "_meta_view", "_box_view", "_released"):
+            del state[view]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._map()
+
+
+def _run_worker(ring: FrameRing,
+                open_camera: Callable[[], Any],
+                make_detector: Callable[[], Detector],
+                interval: float,
+                wanted: Any,
+                stop_event: Any) -> None:
+    # Interrupts are handled by main process, which stops worker in turn.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    camera = open_camera()
+    detector = make_detector()
+    shrunk = False
+    while not stop_event.is_set():
+        ring.beat()
+        # Stay idle until a frame is requested, so the GPU is not kept busy.
+        if not wanted.wait(_IDLE_BEAT):
+            continue
+        wanted.clear()
+        image = camera.Capture()
+        # Some video sources return nothing on capture timeouts.
+        if image is None:
+            continue
+        timestamp = time.monotonic()
+        detections = detector.detect(image)
+        pixels = to_numpy(image)
+        frame, detections = ring.fit(pixels, detections)
+        if frame.shape[:2] != pixels.shape[:2] and not shrunk:
+            shrunk = True
+            logging.warning(f"Frames of {pixels.shape[1]}x{pixels.shape[0]} pixels "
+                            f"exceed ring size, downscaled to {frame.shape[1]}x{frame.shape[0]}")
+        try:
+            if not ring.publish(frame, detections, timestamp):
+                logging.warning("Every frame ring slot is pinned, frame dropped")
+        except ValueError as e:
+            # A frame that cannot be published must not crash the worker on every restart.
+            logging.warning(f"Frame dropped: {e}")
+        stop_event.wait(interval)
+
+
+class DetectionWorker:
+    """Captures frames and detects objects in a separate process.
+
+    Worker process publishes each frame, along with its detections,
+    through a `FrameRing`. Main process takes them with `Capture()`,
+    so a worker can be used as camera by `InventoryManager`, along
+    with a `WorkerDetector`. Frames are only captured and detected
+    when `Capture()` finds none recent enough, hence an idle worker
+    does not use the GPU.
+
+    Worker is restarted if it exits or stops reporting progress for
+    `hang_timeout` seconds, waiting `restart_delay` seconds first.
+    Such delay doubles after each restart that does not publish any
+    frame, up to `max_restart_delay`. Restarted workers publish through
+    a new ring, since a terminated one may have left its lock held.
+    Frames larger than `max_width` by `max_height` are downscaled.
+
+    Note:
+        Camera and detector are created within worker process, thus
+        `open_camera` and `make_detector` must be picklable, such as
+        module level functions or partial objects of them.
+
+    Args:
+        name: Worker identifier, such as its input uri.
+        open_camera: Function which opens a video source.
+        make_detector: Function which creates an object detector.
+        max_width: Maximum frame width, in pixels.
+        max_height: Maximum frame height, in pixels.
+        slots: Number of frames shared at once.
+        interval: Minimum seconds between two captures.
+        frame_max_age: Maximum seconds a published frame can be reused for.
+        capture_timeout: Seconds to wait for a recent frame.
+        restart_delay: Seconds to wait before restarting worker.
+        max_restart_delay: Maximum seconds to wait before restarting worker.
+        hang_timeout: Seconds without progress before worker is
+            considered hung, once it has started capturing.
+
+    Raises:
+        ValueError: If there are less than 3 slots.
+
+    Attributes:
+        name: Worker identifier.
+        restarts: Number of times worker has been restarted.
+
+    Example::
+
+        >>> worker = DetectionWorker("/dev/video0",
+        ...                          partial(open_video_source, "/dev/video0"),
+        ...                          partial(create_detector, "detectnet", model, labels),
+        ...                          max_width=1280, max_height=720)
+        >>> worker.start()
+        >>> frame = worker.Capture()
+        >>> WorkerDetector(labels).detect(frame)
+        [Detection(class_id=1, confidence=0.93, ...)]
+        >>> worker.stop()
+    """
+
+    def __init__(self,
+                 name: str,
+                 open_camera: Callable[[], Any],
+                 make_detector: Callable[[], Detector],
+                 max_width: int = 1920,
+                 max_height: int = 1080,
+                 slots: int = 4,
+                 interval: float = 0.0,
+                 frame_max_age: float = 1.0,
+                 capture_timeout: float = 5.0,
+                 restart_delay: float = 1.0,
+                 max_restart_delay: float = 60.0,
+                 hang_timeout: float = 30.0) -> None:
+        # CUDA cannot be used by processes forked from one that did.
+        self._context = multiprocessing.get_context("spawn")
+        self._ring_size = (slots, max_width, max_height)
+        self._ring = FrameRing(*self._ring_size, context=self._context)
+        self.name = name
+        self._open_camera = open_camera
+        self._make_detector = make_detector
+        self._interval = interval
+        self._frame_max_age = frame_max_age
+        self._capture_timeout = capture_timeout
+        self._restart_delay = restart_delay
+        self._max_restart_delay = max_restart_delay
+        self._hang_timeout = hang_timeout
+        self.restarts: int = 0
+
+        self._process: Optional[Any] = None
+        self._worker_stop = self._context.Event()
+        # Set whenever main process needs a new frame.
+        self._wanted = self._context.Event()
+        self._stop_event = Event()
+        self._thread = Thread(target=self._supervise, name="detection_worker",
+                              daemon=True)
+
+    @property
+    def running(self) -> bool:
+        """Whether worker is being supervised."""
+        return self._thread.is_alive()
+
+    @property
+    def alive(self) -> bool:
+        """Whether worker process is alive right now."""
+        return self._process is not None and self._process.is_alive()
+
+    def start(self) -> None:
+        """Starts worker process and its supervision."""
+        self._spawn()
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops worker process.
+
+        Args:
+            timeout: Seconds to wait for an ongoing detection to finish,
+                worker is terminated afterwards.
+        """
+        self._stop_event.set()
+        self._worker_stop.set()
+        # Wake worker up, if it is waiting for a request.
+        self._wanted.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._process is not None:
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+
+    def Capture(self) -> SharedFrame:
+        """Gets a recent frame, named after video sources' method.
+
+        Returns:
+            Frame backed by shared memory, with its detections.
+
+        Raises:
+            TimeoutError: If worker does not publish a frame in time.
+        """
+        ring = self._ring
+        try:
+            return ring.acquire(self._frame_max_age, 0.0)
+        except TimeoutError:
+            pass
+        self._wanted.set()
+        return ring.acquire(self._frame_max_age, self._capture_timeout)
+
+    def _spawn(self) -> None:
+        self._ring.beat(0.0)
+        self._process = self._context.Process(
+            target=_run_worker, name=f"detection_worker {self.name}", daemon=True,
+            args=(self._ring, self._open_camera, self._make_detector,
+                  self._interval, self._wanted, self._worker_stop))
+        self._process.start()
+
+    def _supervise(self) -> None:
+        failures = 0
+        published = self._ring.published
+        while not self._stop_event.wait(0.5):
+            assert self._process is not None
+            if self._process.is_alive():
+                heartbeat = self._ring.heartbeat
+                if not heartbeat or time.monotonic() - heartbeat < self._hang_timeout:
+                    if self._ring.published > published:
+                        failures = 0
+                    continue
+                logging.warning(f"Detection worker {self.name} stopped responding, "
+                                f"terminating it")
+                self._process.terminate()
+                self._process.join()
+            else:
+                logging.warning(f"Detection worker {self.name} exited with code "
+                                f"{self._process.exitcode}")
+
+            delay = min(self._restart_delay * 2 ** failures, self._max_restart_delay)
+            failures += 1
+            if self._stop_event.wait(delay):
+                break
+            # Frames already handed out keep the memory of previous ring.
+            self._ring = FrameRing(*self._ring_size, context=self._context)
+            published = 0
+            self._spawn()
+            self.restarts += 1
+            METRICS.increment("worker_restart")
+            logging.info(f"Detection worker {self.name} restarted")
+
+
+class WorkerDetector(Detector):
+    """Hands out detections made by a `DetectionWorker`.
+
+    Args:
+        path2labels: Path to a file that contains class labels to be recognized.
+
+    Example::
+
+        >>> detector = WorkerDetector("models/labels.txt")
+        >>> manager = InventoryManager(model, labels, uri, detector=detector,
+        ...                            camera=worker)
+    """
+
+    thread_safe = True
+
+    def __init__(self, path2labels: str) -> None:
+        self._labels = load_labels(path2labels)
+
+    def detect(self, image: Any) -> List[Detection]:
+        """Detects objects within an image.
+
+        Args:
+            image: Frame taken from a detection worker.
+
+        Returns:
+            Detected objects.
+
+        Raises:
+            ValueError: If image was not taken from a detection worker.
+        """
+        if not isinstance(image, SharedFrame):
+            raise ValueError("Image was not captured by a detection worker")
+        return list(image.detections)
+
+    def class_desc(self, class_id: int) -> str:
+        return self._labels[class_id]
@@ -0,0 +1,450 @@
+"""Object detection backends.
+
+This module provides interchangeable object detectors, so that
+inventory analysis can run on a Jetson, on any CPU or in tests.
+
+Author:
+    Andrés Pérez
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import numpy as np
+from os.path import isfile
+import time
+from typing import Any, List, Sequence, Tuple
+
+
+@dataclass
+class Detection:
+    """Stores information about a detected object.
+
+    Attributes:
+        class_id: Index of object class within labels file.
+        confidence: Detection confidence [0, 1].
+        left: Left box coordinate, in pixels.
+        top: Top box coordinate, in pixels.
+        right: Right box coordinate, in pixels.
+        bottom: Bottom box coordinate, in pixels.
+    """
+
+    class_id: int
+    confidence: float = 1.0
+    left: float = 0.0
+    top: float = 0.0
+    right: float = 0.0
+    bottom: float = 0.0
+
+    @property
+    def area(self) -> float:
+        """Box area, in square pixels."""
+        return max(self.right - self.left, 0.0) * max(self.bottom - self.top, 0.0)
+
+
+DetectionArrays = Tuple[np.ndarray, np.ndarray, np.ndarray]
+"""Class indices, confidences and box corners (left, top, right, bottom),
+one row per detected object."""
+
+
+def detection_arrays(detections: Sequence[Detection]) -> DetectionArrays:
+    """Gathers fields of detected objects into arrays.
+
+    Only needed for backends that return lists, array outputs are
+    handed over as they are.
+
+    Args:
+        detections: Detected objects.
+
+    Returns:
+        Class indices, confidences and box corners, one row per object.
+    """
+    count = len(detections)
+    class_ids = np.fromiter((obj.class_id for obj in detections),
+                            dtype=np.int64, count=count)
+    confidences = np.fromiter((obj.confidence for obj in detections),
+                              dtype=np.float64, count=count)
+    boxes = np.array([(obj.left, obj.top, obj.right, obj.bottom) for obj in detections],
+                     dtype=np.float64).reshape(count, 4)
+    return class_ids, confidences, boxes
+
+
+def to_detections(arrays: DetectionArrays) -> List[Detection]:
+    """Builds detected objects from arrays, one per row.
+
+    Args:
+        arrays: Class indices, confidences and box corners.
+
+    Returns:
+        Detected objects.
+    """
+    class_ids, confidences, boxes = arrays
+    return [Detection(class_id, confidence, *box) for class_id, confidence, box
+            in zip(class_ids.tolist(), confidences.tolist(), boxes.tolist())]
+
+
+def box_areas(boxes: np.ndarray) -> np.ndarray:
+    """Area of each box, in square pixels.
+
+    Args:
+        boxes: Corner coordinates (left, top, right, bottom) per box.
+
+    Returns:
+        Box areas, 0 for boxes with no width or height.
+    """
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * \
+        np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+class Detector(ABC):
+    """Finds objects within images.
+
+    Attributes:
+        thread_safe: Whether `detect` can be called from several
+            threads at once.
+    """
+
+    thread_safe: bool = False
+
+    @abstractmethod
+    def detect(self, image: Any) -> List[Detection]:
+        """Detects objects within an image.
+
+        Args:
+            image: Image to analyze.
+
+        Returns:
+            Detected objects.
+        """
+
+    def detect_batch(self, images: Sequence[Any]) -> List[List[Detection]]:
+        """Detects objects within several images at once.
+
+        Backends that cannot run a batch through their model at once
+        detect one image after another.
+
+        Args:
+            images: Images to analyze.
+
+        Returns:
+            Detected objects, per image.
+        """
+        return [self.detect(image) for image in images]
+
+    def detect_arrays(self, image: Any) -> DetectionArrays:
+        """Detects objects within an image, as arrays.
+
+        Backends whose model outputs arrays hand them over without
+        building any `Detection`, others convert `detect` results.
+
+        Args:
+            image: Image to analyze.
+
+        Returns:
+            Class indices, confidences and box corners, one row per object.
+        """
+        return detection_arrays(self.detect(image))
+
+    @abstractmethod
+    def class_desc(self, class_id: int) -> str:
+        """Gets class name for a class index.
+
+        Args:
+            class_id: Index of object class within labels file.
+
+        Returns:
+            Class name, as written in labels file.
+        """
+
+
+def load_labels(path2labels: str) -> List[str]:
+    """Reads class labels, one per line, including BACKGROUND class.
+
+    Args:
+        path2labels: Path to a file that contains class labels.
+
+    Returns:
+        Class names, whose position matches model class indices.
+    """
+    with open(path2labels, "r") as labels_file:
+        return [line.rstrip("\n") for line in labels_file]
+
+
+def to_numpy(image: Any) -> np.ndarray:
+    """Gets pixels of an image as an array.
+
+    Args:
+        image: Either an array or a CUDA image from `jetson.utils`.
+
+    Returns:
+        Image array, which shares memory with CUDA images.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    from jetson.utils import cudaToNumpy
+    return cudaToNumpy(image)
+
+
+def crop_image(image: Any, box: Tuple[int, int, int, int]) -> Any:
+    """Gets part of an image.
+
+    Args:
+        image: Either an array or a CUDA image from `jetson.utils`.
+        box: Corner coordinates (left, top, right, bottom), in pixels.
+
+    Returns:
+        Array view of `image` pixels, or a new CUDA image.
+    """
+    left, top, right, bottom = box
+    if isinstance(image, np.ndarray):
+        return image[top:bottom, left:right]
+    from jetson.utils import cudaAllocMapped, cudaCrop
+    crop = cudaAllocMapped(width=right - left, height=bottom - top,
+                           format=image.format)
+    cudaCrop(image, crop, box)
+    return crop
+
+
+def non_max_suppression(boxes: np.ndarray,
+                        scores: np.ndarray,
+                        iou_threshold: float) -> np.ndarray:
+    """Discards boxes that overlap too much with a better scored one.
+
+    Args:
+        boxes: Corner coordinates (left, top, right, bottom) per box.
+        scores: Confidence per box.
+        iou_threshold: Maximum intersection over union of kept boxes.
+
+    Returns:
+        Indices of kept boxes, from highest to lowest score.
+    """
+    areas = box_areas(boxes)
+    order = np.argsort(-scores, kind="stable")
+    keep: List[int] = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(int(best))
+        # Intersection of best box with every remaining one.
+        left = np.maximum(boxes[best, 0], boxes[rest, 0])
+        top = np.maximum(boxes[best, 1], boxes[rest, 1])
+        right = np.minimum(boxes[best, 2], boxes[rest, 2])
+        bottom = np.minimum(boxes[best, 3], boxes[rest, 3])
+        inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+        iou = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class DetectNetDetector(Detector):
+    """Detector running on a Jetson GPU, via TensorRT.
+
+    Args:
+        path2model: Path to a file that contains a machine learning model.
+        path2labels: Path to a file that contains class labels to be recognized.
+        threshold: Minimum confidence for an object to be detected.
+
+    See Also:
+        https://github.com/dusty-nv/jetson-inference/blob/master/docs/detectnet-console-2.md
+    """
+
+    def __init__(self,
+                 path2model: str,
+                 path2labels: str,
+                 threshold: float = 0.5) -> None:
+        from jetson.inference import detectNet
+
+        self._network = detectNet(threshold=threshold, argv=[
+            "--model=" + path2model,
+            "--labels=" + path2labels,
+            "--input-blob=" + "input_0",
+            "--output-cvg=" + "scores",
+            "--output-bbox=" + "boxes",
+        ])
+
+    def detect(self, image: Any) -> List[Detection]:
+        if isinstance(image, np.ndarray):
+            # Network only takes CUDA images.
+            from jetson.utils import cudaFromNumpy
+            image = cudaFromNumpy(np.ascontiguousarray(image))
+        return [Detection(obj.ClassID, obj.Confidence,
+                          obj.Left, obj.Top, obj.Right, obj.Bottom)
+                for obj in self._network.Detect(image, overlay="none")]
+
+    def class_desc(self, class_id: int) -> str:
+        return self._network.GetClassDesc(class_id)
+
+
+class OnnxDetector(Detector):
+    """Detector running on CPU, via ONNX Runtime.
+
+    It expects an SSD-Mobilenet model exported by jetson-inference
+    training tools, whose outputs are softmax scores per class and
+    normalized corner coordinates per box.
+
+    Note:
+        This backend requires ``onnxruntime`` package.
+
+    Args:
+        path2model: Path to a file that contains a machine learning model.
+        path2labels: Path to a file that contains class labels to be recognized.
+        threshold: Minimum confidence for an object to be detected.
+        threads: Number of threads used to run each model operator.
+        iou_threshold: Maximum overlap between two objects of the same class.
+
+    Raises:
+        ImportError: If ``onnxruntime`` is not installed.
+
+    Example::
+
+        >>> detector = OnnxDetector("../models/model.onnx", "../models/labels.txt", threads=4)
+        >>> detector.detect(image)
+        [Detection(class_id=1, confidence=0.92, left=10.0, top=20.0, right=110.0, bottom=220.0)]
+    """
+
+    # ONNX Runtime sessions can be run concurrently.
+    thread_safe = True
+
+    def __init__(self,
+                 path2model: str,
+                 path2labels: str,
+                 threshold: float = 0.5,
+                 threads: int = 1,
+                 iou_threshold: float = 0.45) -> None:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(
+            path2model, options, providers=["CPUExecutionProvider"])
+        # Model expects a batch of band-sequential RGB images.
+        batch, _, height, width = self._session.get_inputs()[0].shape
+        # Models exported with a fixed batch size take one image at a time.
+        self._batched = not isinstance(batch, int)
+        # Dynamic dimensions fall back to SSD-Mobilenet's input size.
+        self._height = height if isinstance(height, int) else 300
+        self._width = width if isinstance(width, int) else 300
+        self._labels = load_labels(path2labels)
+        self._threshold = threshold
+        self._iou_threshold = iou_threshold
+
+    def detect(self, image: Any) -> List[Detection]:
+        return to_detections(self.detect_arrays(image))
+
+    def detect_batch(self, images: Sequence[Any]) -> List[List[Detection]]:
+        if not self._batched and len(images) > 1:
+            return super().detect_batch(images)
+        return [to_detections(arrays) for arrays in self._run(images)]
+
+    def detect_arrays(self, image: Any) -> DetectionArrays:
+        return self._run([image])[0]
+
+    def _run(self, images: Sequence[Any]) -> List[DetectionArrays]:
+        if not images:
+            return []
+
+        pixels = [to_numpy(image) for image in images]
+        blob = np.stack([self._preprocess(image) for image in pixels])
+        scores, boxes = self._session.run(["scores", "boxes"], {"input_0": blob})
+        return [self._postprocess(image_scores,
+                                  image_boxes * [width, height, width, height])
+                for image_scores, image_boxes, (height, width) in
+                zip(scores, boxes, (image.shape[:2] for image in pixels))]
+
+    def _preprocess(self, pixels: np.ndarray) -> np.ndarray:
+        height, width = pixels.shape[:2]
+        # Nearest neighbour resize, then scale pixels to [-1, 1].
+        rows = np.arange(self._height) * height // self._height
+        cols = np.arange(self._width) * width // self._width
+        resized = pixels[rows[:, None], cols, :3].astype(np.float32)
+        return (resized / 127.5 - 1.0).transpose(2, 0, 1)
+
+    def _postprocess(self, scores: np.ndarray, boxes: np.ndarray) -> DetectionArrays:
+        # Scores per class and pixel coordinates of every prior box.
+        class_ids: List[np.ndarray] = [np.empty(0, dtype=np.int64)]
+        confidences: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        kept_boxes: List[np.ndarray] = [np.empty((0, 4), dtype=np.float64)]
+        # Skip BACKGROUND class, whose index is always 0.
+        for class_id in range(1, scores.shape[1]):
+            candidates = np.flatnonzero(scores[:, class_id] >= self._threshold)
+            if not candidates.size:
+                continue
+            class_scores = scores[candidates, class_id]
+            class_boxes = boxes[candidates]
+            kept = non_max_suppression(class_boxes, class_scores, self._iou_threshold)
+            class_ids.append(np.full(kept.size, class_id, dtype=np.int64))
+            confidences.append(class_scores[kept].astype(np.float64))
+            kept_boxes.append(class_boxes[kept].astype(np.float64))
+        return np.concatenate(class_ids), np.concatenate(confidences), \
+            np.concatenate(kept_boxes)
+
+    def class_desc(self, class_id: int) -> str:
+        return self._labels[class_id]
+
+
+class FakeDetector(Detector):
+    """Deterministic detector, for testing and benchmarking purposes.
+
+    Args:
+        labels: Class names, including BACKGROUND class.
+        detections: Objects returned on every detection.
+        latency: Seconds each detection takes.
+
+    Example::
+
+        >>> detector = FakeDetector(["BACKGROUND", "honey"], [Detection(1)] * 3)
+        >>> len(detector.detect(None))
+        3
+    """
+
+    thread_safe = True
+
+    def __init__(self,
+                 labels: Sequence[str],
+                 detections: Sequence[Detection] = (),
+                 latency: float = 0.0) -> None:
+        self._labels = list(labels)
+        self.detections: List[Detection] = list(detections)
+        self._latency = latency
+
+    def detect(self, image: Any) -> List[Detection]:
+        if self._latency > 0:
+            time.sleep(self._latency)
+        return list(self.detections)
+
+    def class_desc(self, class_id: int) -> str:
+        return self._labels[class_id]
+
+
+def create_detector(backend: str,
+                    path2model: str,
+                    path2labels: str,
+                    threshold: float = 0.5,
+                    threads: int = 1) -> Detector:
+    """Creates a detector by backend name.
+
+    Args:
+        backend: Either ``"detectnet"``, ``"onnx"`` or ``"fake"``.
+        path2model: Path to a file that contains a machine learning model.
+        path2labels: Path to a file that contains class labels to be recognized.
+        threshold: Minimum confidence for an object to be detected.
+        threads: Number of CPU threads, only used by ONNX Runtime.
+
+    Returns:
+        New detector instance.
+
+    Raises:
+        ValueError: If `backend` is not supported.
+        FileNotFoundError: If model file does not exist.
+    """
+    if backend == "fake":
+        return FakeDetector(load_labels(path2labels))
+
+    if backend not in ("detectnet", "onnx"):
+        raise ValueError("Unknown detector backend " + backend)
+
+    if not isfile(path2model):
+        raise FileNotFoundError("Cannot find model file " + path2model)
+
+    if backend == "detectnet":
+        return DetectNetDetector(path2model, path2labels, threshold)
+    return OnnxDetector(path2model, path2labels, threshold, threads)
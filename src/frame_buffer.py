@@ -0,0 +1,146 @@
+"""Continuous image capture from a video source.
+
+This module grabs frames on a background thread, so that
+consumers never have to wait for a camera to deliver one.
+
+Author:
+    Andrés Pérez
+"""
+
+from collections import deque
+import numpy as np
+from threading import Thread, Condition, Event
+import logging
+import time
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+Frame = Tuple[float, Any]
+"""Capture time, as given by `time.monotonic`, and image."""
+
+
+def copy_image(image: Any) -> Any:
+    """Duplicates an image, so that its source can recycle the original.
+
+    Args:
+        image: Either an array or a CUDA image from `jetson.utils`.
+
+    Returns:
+        New image with the same contents.
+    """
+    if isinstance(image, np.ndarray):
+        return image.copy()
+    from jetson.utils import cudaMemcpy
+    return cudaMemcpy(image)
+
+
+class FrameBuffer:
+    """Keeps the latest frames captured from a video source.
+
+    Only `size` frames are kept at once, older ones are dropped.
+
+    Note:
+        Video sources usually recycle a few internal buffers, so
+        frames must be copied with `copy` if they are kept around
+        longer than a couple of captures.
+
+    Args:
+        camera: Video source with a `Capture()` method.
+        size: Maximum number of buffered frames.
+        interval: Seconds to wait between two captures.
+        copy: Function that duplicates a captured image.
+
+    Raises:
+        ValueError: If `size` is not a positive number.
+
+    Example::
+
+        >>> frames = FrameBuffer(videoSource("/dev/video0"), size=2)
+        >>> frames.start()
+        >>> timestamp, image = frames.get(max_age=1.0)
+        >>> frames.stop()
+    """
+
+    def __init__(self,
+                 camera: Any,
+                 size: int = 1,
+                 interval: float = 0.0,
+                 copy: Optional[Callable[[Any], Any]] = None) -> None:
+        if size < 1:
+            raise ValueError(f"Invalid buffer size: {size}")
+
+        self._camera = camera
+        self._interval = interval
+        self._copy = copy
+        self._frames: Deque[Frame] = deque(maxlen=size)
+        self._new_frame = Condition()
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, name="frame_buffer",
+                              daemon=True)
+
+    @property
+    def running(self) -> bool:
+        """Whether background thread is alive."""
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts capturing frames in background."""
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops capturing frames.
+
+        Args:
+            timeout: Seconds to wait for an ongoing capture to finish.
+        """
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def frames(self) -> List[Frame]:
+        """Buffered frames, from oldest to newest."""
+        with self._new_frame:
+            return list(self._frames)
+
+    def get(self, max_age: float, timeout: Optional[float] = None) -> Frame:
+        """Newest frame, waiting for a new one if it is too old.
+
+        Args:
+            max_age: Maximum seconds elapsed since frame capture.
+            timeout: Seconds to wait for a new frame, `None` waits forever.
+
+        Returns:
+            Capture time and image.
+
+        Raises:
+            TimeoutError: If no recent enough frame arrives in time.
+        """
+        # Frames captured before this moment are too old.
+        oldest = time.monotonic() - max_age
+
+        def fresh() -> bool:
+            return bool(self._frames) and self._frames[-1][0] >= oldest
+
+        with self._new_frame:
+            if not self._new_frame.wait_for(fresh, timeout):
+                raise TimeoutError(f"No frame captured within {timeout}s")
+            return self._frames[-1]
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                image = self._camera.Capture()
+            except Exception:
+                logging.warning("Frame capture failed", exc_info=True)
+                # Avoid spinning on a broken video source.
+                self._stop_event.wait(max(self._interval, 1.0))
+                continue
+
+            # Some video sources return nothing on capture timeouts.
+            if image is not None:
+                if self._copy is not None:
+                    image = self._copy(image)
+                with self._new_frame:
+                    self._frames.append((time.monotonic(), image))
+                    self._new_frame.notify_all()
+
+            self._stop_event.wait(self._interval)
@@ -0,0 +1,148 @@
+"""Long-lived HTTP session for scraping.
+
+This module keeps connections open across scrapes, bounds every
+request in time and avoids downloading unchanged pages again.
+
+Author:
+    Andrés Pérez
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from collections import OrderedDict
+from threading import Lock
+from metrics import METRICS
+from typing import Dict, Optional, Tuple, Union
+
+Timeout = Union[float, Tuple[float, float]]
+"""Seconds to wait for a request, or to connect and to read separately."""
+
+
+class HttpClient:
+    """Fetches web pages through a pooled, compressed and cached session.
+
+    Connections are reused by every request, instead of being opened
+    for each scrape. Responses are accepted gzip compressed, or brotli
+    compressed if a brotli package is installed.
+
+    Pages served with an `ETag` or `Last-Modified` header are kept in
+    memory and revalidated later on, so that unchanged pages are not
+    transferred again. Entries are evicted in least recently used order
+    once their total size exceeds `cache_bytes`.
+
+    Args:
+        connect_timeout: Seconds to wait for a connection to be made.
+        read_timeout: Seconds to wait for server to send any data.
+        pool_size: Maximum number of connections kept open per host.
+        cache_bytes: Maximum size of cached pages, in characters.
+
+    Attributes:
+        requests: Number of requests sent.
+        not_modified: Number of pages served from cache after revalidation.
+        bytes_received: Bytes transferred over the network, after
+            compression, for response bodies.
+
+    Example::
+
+        >>> client = HttpClient(connect_timeout=3.0, read_timeout=10.0)
+        >>> page = client.get_text("https://www.trolley.co.uk/search/?q=honey")
+        >>> page = client.get_text("https://www.trolley.co.uk/search/?q=honey")
+        >>> client.not_modified
+        1
+    """
+
+    def __init__(self,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 15.0,
+                 pool_size: int = 8,
+                 cache_bytes: int = 8388608) -> None:
+        self._timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self._cache_bytes = cache_bytes
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+        self._lock = Lock()
+        # Maps url to its validators and page contents.
+        self._cache: "OrderedDict[str, Tuple[Dict[str, str], str]]" = OrderedDict()
+        self._cached_size = 0
+
+        self.requests: int = 0
+        self.not_modified: int = 0
+        self.bytes_received: int = 0
+
+    def get_text(self, url: str, timeout: Optional[Timeout] = None) -> str:
+        """Downloads a page, unless a cached copy is still valid.
+
+        Args:
+            url: Page address.
+            timeout: If given, replaces default connect and read timeouts.
+
+        Returns:
+            Page contents.
+
+        Raises:
+            requests.ConnectionError: If server cannot be reached.
+            requests.Timeout: If server takes too long to connect or answer.
+            requests.HTTPError: If server answers with an error status.
+        """
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry is not None:
+                self._cache.move_to_end(url)
+
+        response = self._get(url, entry[0] if entry else {}, timeout)
+        if response.status_code == 304 and entry is not None:
+            METRICS.increment("http_not_modified")
+            with self._lock:
+                self.not_modified += 1
+            return entry[1]
+
+        response.raise_for_status()
+        text: str = response.text
+        self._store(url, response, text)
+        return text
+
+    def close(self) -> None:
+        """Closes every pooled connection."""
+        self._session.close()
+
+    def _get(self,
+             url: str,
+             headers: Dict[str, str],
+             timeout: Optional[Timeout]) -> requests.Response:
+        response = self._session.get(url, headers=headers,
+                                     timeout=timeout if timeout is not None
+                                     else self._timeout)
+        # Compressed bodies are counted as they came over the network.
+        raw = response.raw
+        size = raw.tell() if raw is not None else len(response.content or b"")
+        METRICS.increment("http_requests")
+        METRICS.increment("http_bytes", size)
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += size
+        return response
+
+    def _store(self, url: str, response: requests.Response, text: str) -> None:
+        validators: Dict[str, str] = {}
+        if "ETag" in response.headers:
+            validators["If-None-Match"] = response.headers["ETag"]
+        if "Last-Modified" in response.headers:
+            validators["If-Modified-Since"] = response.headers["Last-Modified"]
+
+        with self._lock:
+            old = self._cache.pop(url, None)
+            if old is not None:
+                self._cached_size -= len(old[1])
+            if not validators or len(text) > self._cache_bytes:
+                return
+
+            self._cache[url] = (validators, text)
+            self._cached_size += len(text)
+            while self._cached_size > self._cache_bytes:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cached_size -= len(evicted)
@@ -0,0 +1,276 @@
+"""Append-only log of past inventory states.
+
+This module stores every inventory snapshot as fixed-width binary
+records, so that consumption trends can be queried cheaply.
+
+Author:
+    Andrés Pérez
+"""
+
+from threading import Lock
+from os import replace, remove
+from os.path import isfile, dirname, getsize
+from tempfile import NamedTemporaryFile
+import json
+import struct
+import numpy as np
+import time
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+RECORD = np.dtype([("time", "<f8"),
+                   ("class_id", "<u2"),
+                   ("amount", "<i4"),
+                   ("constraint", "<i4"),
+                   ("price", "<f4")])
+"""Layout of a record: one product class within one snapshot."""
+
+
+class InventoryHistory:
+    """Keeps product counts, constraints and prices over time.
+
+    The log file starts with a fixed size header, which holds known
+    class names, followed by one fixed-width record per class and
+    snapshot, in time order. Reads go through a memory map, and time
+    ranges are located with a binary search, so queries do not need
+    to scan the whole file.
+
+    Once the log grows beyond `max_size` bytes, it gets compacted:
+    unchanged records between two equal ones are dropped first,
+    then oldest snapshots until half of the space for records is used.
+
+    Args:
+        path: Path to the binary log file, created if missing.
+        classes: Names of every product class to be logged.
+        max_size: Maximum log size in bytes before compaction.
+
+    Raises:
+        ValueError: If `max_size` is too small, class names do not fit
+            within header or file is not a valid log.
+
+    Example::
+
+        >>> history = InventoryHistory("../config/.history.bin", ["honey"])
+        >>> history.append({"honey": (3, 1, 0.69)})
+        >>> history.query(class_name="honey")["amount"]
+        array([3], dtype=int32)
+    """
+
+    _MAGIC = b"PANTRYHL"
+    _VERSION = 1
+    # Header layout: magic, version, header size, then class names as json.
+    _HEADER = struct.Struct("<8sII")
+    _HEADER_SIZE = 4096
+
+    def __init__(self,
+                 path: str,
+                 classes: Sequence[str],
+                 max_size: int = 4194304) -> None:
+        if max_size < self._HEADER_SIZE + 4 * RECORD.itemsize:
+            raise ValueError(f"Invalid history size: {max_size}")
+
+        self._path = path
+        self._max_size = max_size
+        self._lock = Lock()
+        # Memory map of records and file size it was created for.
+        self._records: Optional[np.ndarray] = None
+        self._mapped_size = -1
+
+        self._classes: List[str] = []
+        exists = isfile(self._path)
+        if exists:
+            self._classes = self._read_header()
+        known = set(self._classes)
+        missing = [name for name in classes if name not in known]
+        # An interrupted append may leave a partial record behind.
+        truncated = exists and \
+            (getsize(self._path) - self._HEADER_SIZE) % RECORD.itemsize != 0
+        if missing or truncated or not exists:
+            # New classes are added to header, existing records are kept.
+            self._classes.extend(missing)
+            self._rewrite(self._read_all() if exists else np.empty(0, RECORD))
+        self._class_ids: Dict[str, int] = {name: index for index, name
+                                           in enumerate(self._classes)}
+
+    @property
+    def classes(self) -> Tuple[str, ...]:
+        """Names of logged product classes."""
+        return tuple(self._classes)
+
+    def append(self,
+               products: Mapping[str, Tuple[int, int, float]],
+               timestamp: Optional[float] = None) -> None:
+        """Logs a new inventory snapshot.
+
+        Args:
+            products: Amount, constraint and price per class name.
+                Unknown class names are ignored.
+            timestamp: Snapshot time, as given by `time.time`. Defaults
+                to current time, it must not be older than last snapshot.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        records = np.array([(timestamp, self._class_ids[name], amount,
+                             constraint, price)
+                            for name, (amount, constraint, price) in products.items()
+                            if name in self._class_ids], dtype=RECORD)
+        with self._lock:
+            with open(self._path, "ab") as f:
+                f.write(records.tobytes())
+            if getsize(self._path) > self._max_size:
+                self._compact()
+
+    def query(self,
+              start: Optional[float] = None,
+              end: Optional[float] = None,
+              class_name: Optional[str] = None) -> np.ndarray:
+        """Gets logged records within a time range.
+
+        Args:
+            start: If given, oldest timestamp to include.
+            end: If given, newest timestamp to include.
+            class_name: If given, only records of such class are returned.
+
+        Returns:
+            Structured array of `RECORD` fields, in time order.
+        """
+        with self._lock:
+            records = self._mapped()
+            times = records["time"]
+            first = 0 if start is None else np.searchsorted(times, start, "left")
+            last = len(records) if end is None else np.searchsorted(times, end, "right")
+            selected = records[first:last]
+            if class_name is not None:
+                class_id = self._class_ids.get(class_name)
+                if class_id is None:
+                    return np.empty(0, RECORD)
+                selected = selected[selected["class_id"] == class_id]
+            # Copy, so that memory map can be closed later.
+            return np.array(selected)
+
+    def changes(self, class_name: str, since: Optional[float] = None) -> List[Tuple[float, int]]:
+        """Times at which the amount of a product changed.
+
+        Args:
+            class_name: Name of a product class.
+            since: If given, oldest timestamp to look at.
+
+        Returns:
+            Timestamp and new amount of each change, first record included.
+        """
+        records = self.query(since, None, class_name)
+        amounts = records["amount"]
+        changed = np.ones(len(records), dtype=bool)
+        changed[1:] = amounts[1:] != amounts[:-1]
+        return [(float(t), int(a)) for t, a in zip(records["time"][changed],
+                                                   amounts[changed])]
+
+    def depletion(self, class_name: str, window: float = 604800.0) -> Optional[float]:
+        """Estimates when a product runs out, given its recent consumption.
+
+        A line is fitted to amounts logged since last restock, within
+        `window` seconds before last snapshot.
+
+        Args:
+            class_name: Name of a product class.
+            window: Seconds of history to look at.
+
+        Returns:
+            Timestamp at which product ran out or is expected to do so,
+            `None` if it is not being consumed.
+        """
+        with self._lock:
+            records = self._mapped()
+            end = float(records["time"][-1]) if len(records) else 0.0
+        records = self.query(end - window, None, class_name)
+        if not len(records):
+            return None
+
+        times = records["time"]
+        amounts = records["amount"].astype(np.float64)
+        # Only look at consumption since last restock.
+        restocks = np.flatnonzero(amounts[1:] > amounts[:-1])
+        if restocks.size:
+            times, amounts = times[restocks[-1] + 1:], amounts[restocks[-1] + 1:]
+
+        if amounts[-1] <= 0:
+            # It already ran out, when amount first dropped to zero.
+            return float(times[np.flatnonzero(amounts <= 0)[0]])
+
+        if len(times) < 2 or times[-1] == times[0]:
+            return None
+        slope, intercept = np.polyfit(times - times[0], amounts, 1)
+        if slope >= 0:
+            return None
+        return float(times[0] - intercept / slope)
+
+    def _mapped(self) -> np.ndarray:
+        # Map file again only when it has grown.
+        size = getsize(self._path)
+        if size != self._mapped_size:
+            count = (size - self._HEADER_SIZE) // RECORD.itemsize
+            self._records = np.memmap(self._path, dtype=RECORD, mode="r",
+                                      offset=self._HEADER_SIZE, shape=(count,)) \
+                            if count else np.empty(0, RECORD)
+            self._mapped_size = size
+        return self._records
+
+    def _compact(self) -> None:
+        records = self._read_all()
+        keep = np.ones(len(records), dtype=bool)
+        fields = ["amount", "constraint", "price"]
+        for class_id in np.unique(records["class_id"]):
+            indices = np.flatnonzero(records["class_id"] == class_id)
+            values = records[indices][fields]
+            # Interior records of a run of equal values add nothing.
+            same_as_prev = values[1:-1] == values[:-2]
+            same_as_next = values[1:-1] == values[2:]
+            keep[indices[1:-1][same_as_prev & same_as_next]] = False
+        records = records[keep]
+
+        # Drop oldest snapshots if that was not enough.
+        limit = (self._max_size - self._HEADER_SIZE) // 2 // RECORD.itemsize
+        if len(records) > limit:
+            oldest = records["time"][len(records) - limit]
+            # Never split a snapshot.
+            records = records[np.searchsorted(records["time"], oldest, "left"):]
+            if len(records) > limit:
+                records = records[np.searchsorted(records["time"], oldest, "right"):]
+        self._rewrite(records)
+
+    def _read_header(self) -> List[str]:
+        with open(self._path, "rb") as f:
+            header = f.read(self._HEADER_SIZE)
+        try:
+            magic, version, size = self._HEADER.unpack_from(header)
+            if magic != self._MAGIC or version != self._VERSION or \
+               size != self._HEADER_SIZE:
+                raise ValueError
+            names = header[self._HEADER.size:].rstrip(b"\0")
+            return list(json.loads(names.decode("utf-8")))
+        except (ValueError, struct.error):
+            raise ValueError("Invalid inventory history file " + self._path)
+
+    def _read_all(self) -> np.ndarray:
+        with open(self._path, "rb") as f:
+            f.seek(self._HEADER_SIZE)
+            data = f.read()
+        usable = len(data) // RECORD.itemsize * RECORD.itemsize
+        return np.frombuffer(data[:usable], dtype=RECORD)
+
+    def _rewrite(self, records: np.ndarray) -> None:
+        names = json.dumps(self._classes, ensure_ascii=False).encode("utf-8")
+        header = self._HEADER.pack(self._MAGIC, self._VERSION, self._HEADER_SIZE) + names
+        if len(header) > self._HEADER_SIZE:
+            raise ValueError("Too many class names for inventory history header")
+
+        # Release memory map before replacing its file.
+        self._records, self._mapped_size = None, -1
+        # Write a whole new file and swap it in, so it never gets truncated.
+        with NamedTemporaryFile("wb", delete=False, dir=dirname(self._path),
+                                prefix=".history_", suffix=".tmp") as f:
+            f.write(header.ljust(self._HEADER_SIZE, b"\0"))
+            f.write(records.tobytes())
+        try:
+            replace(f.name, self._path)
+        except OSError:
+            remove(f.name)
+            raise
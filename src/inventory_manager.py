@@ -7,69 +7,49 @@ Author:
     Andrés Pérez
 """
 
-from jetson.inference import detectNet
-from jetson.utils import videoSource, cudaImage, saveImage
 from os.path import join, dirname, isfile, exists
-from tempfile import NamedTemporaryFile, _TemporaryFileWrapper
-import csv
-from price_scraper import scrape_prices
-from dataclasses import dataclass
-from typing import Tuple, Dict, List, Optional
-
-
-@dataclass
-class ProductType:
-    """Stores information about a certain type of product.
-
-    Attributes:
-        name: Common name for a type product.
-        amount: Number of available product units.
-        constraint: Minimum units that should be available constantly.
-        link: Purchase url.
-        price: Price value.
-        currency: Currency symbol.
-    """
-
-    name: str
-    amount: int = 0
-    constraint: int = 0
-    link: str = ""
-    price: float = 0.0
-    currency: str = ""
-
-    @property
-    def demand(self) -> int:
-        """Number of units needed to fulfill established contraint."""
-        dif = self.amount - self.constraint
-        return abs(dif) if dif < 0 else 0
-
-    @property
-    def total_cost(self) -> float:
-        """Total cost of demanded product units."""
-        return round(self.demand * self.price, 2)
-
-    def __str__(self) -> str:
-        return (f"{self.name.title()}\n"
-                f"Stored: {self.amount}\n"
-                f"Minimum units: {self.constraint}\n"
-                f"Needed: {self.demand}\n"
-                f"Current price: {self.price}{self.currency}\n"
-                f"Total cost: {self.total_cost}{self.currency}\n"
-                f"Purchase link: {self.link}\n")
-
-
-class UnkownClassNameError(Exception):
-    """Product class with such name is not supported."""
-
-
-class InvalidConstraintError(Exception):
-    """Product unit constraint value is wrong."""
+from price_cache import PriceCache, PriceRefresher
+from price_providers import PriceProvider, PriceAggregator, TrolleyProvider
+# Errors live along constraints, so that the bot can catch them without
+# loading detection and scraping modules.
+from constraint_store import ConstraintStore, UnkownClassNameError, InvalidConstraintError
+from scene_change import SceneChangeDetector
+from jpeg_encoder import JpegEncoder
+from camera_source import CameraSource
+from inventory_history import InventoryHistory
+from inventory_state import ProductType, InventoryState, Snapshot
+from metrics import METRICS
+from detectors import Detector, DetectNetDetector, box_areas, load_labels, to_numpy
+from detection_counter import DetectionCounter
+from tiled_detector import Region
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import partial
+from threading import Lock
+import time
+from typing import Any, Tuple, Dict, List, Optional, Sequence, Union
+
+
+class _NoLock:
+    # Stands for a lock where none is needed, like contextlib.nullcontext
+    # which is not available on Python 3.6.
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
 
 
 class InventoryManager:
     """Analyzes a food inventory with the help of object recognition.
     
-    Product data is collected from a real-time image.
+    Product data is collected from real-time images of one or several
+    cameras, each of them watching a different part of the pantry.
+    Cameras are captured and analyzed concurrently, and product counts
+    of every camera are added up.
+
+    A camera that fails or takes longer than `source_timeout` does not
+    block the others: its latest counts are used instead, if any.
 
     Note:
         You can get a deeper understsanding about
@@ -80,20 +60,73 @@ class InventoryManager:
     Args:
         path2model: Path to a file that contains a machine learning model.
         path2labels: Path to a file that contains class labels to be recognized.
-        input_uri: Resource id for an image/camera input.
+        input_uri: Resource id for an image/camera input, or a sequence
+            of them to watch several shelves.
         sensitivity: Minimum confidence for an object to be detected.
+        price_workers: Maximum number of price requests in flight.
+        price_timeout: Seconds to wait for each price request. By default,
+            requests give up after 5 seconds connecting or 15 seconds
+            without receiving any data.
+        price_ttl: Seconds a product price is reused before scraping it again.
+        price_cache_size: Maximum number of products with cached prices.
+        price_refresh_interval: If given, seconds between background price
+            refreshes, so that inventory requests never wait for the network.
+        frame_buffer_size: If positive, number of latest frames captured
+            continuously in background, so that requests never wait for
+            the camera. Otherwise, frames are captured on demand.
+        frame_max_age: Maximum seconds a buffered frame can be reused for.
+        capture_interval: Seconds between two background captures, or a
+            sequence with an interval per camera. When capturing on demand,
+            minimum seconds between two captures of a camera, requests in
+            between reuse its last frame.
+        change_area_threshold: If given, minimum fraction of image blocks
+            that must change for detection to run again. Otherwise,
+            detection runs on every frame.
+        change_block_threshold: Minimum brightness difference [0, 1] for
+            an image block to be considered changed.
+        jpeg_quality: JPEG quality of pictures, from 1 (smallest) to 95 (best).
+        picture_max_size: If given, maximum width and height of pictures,
+            in pixels. Larger frames are shrunk before being encoded.
+        detector: Object detection backend. By default, a `detectNet`
+            is loaded from `path2model`, hence a Jetson is required.
+        camera: Video source with a `Capture()` method, or a sequence with
+            one per `input_uri`. By default, a `videoSource` is opened from
+            each `input_uri`.
+        source_timeout: Seconds to wait for each camera to be captured and
+            analyzed before falling back to its latest counts.
+        history_max_size: Maximum size in bytes of inventory history log,
+            before its oldest entries get compacted.
+        price_providers: Shops queried at once for each product, cheapest
+            offer wins. By default, only Trolley is scraped, within
+            `price_timeout`.
+        class_thresholds: Minimum confidence of certain classes, by class
+            name, replacing `sensitivity` for them.
+        min_box_area: Minimum box area for an object to be counted, in
+            square pixels.
+        regions: Parts of each camera frame, such as shelves, whose
+            products are counted apart as well. Wrap `detector` in a
+            `TiledDetector` for it to look only within them.
 
     Raises:
         FileNotFoundError: If any of the given paths does not exist.
+        ValueError: If number of cameras or capture intervals does not
+            match number of input uris, or a class name in
+            `class_thresholds` is unknown.
 
     Attributes:
         classes: Names of each kind of product that might be detected.
+        price_cache: Stores product prices, including hit and miss counters.
+        sources: Each camera, named after its input uri, including its
+            latest counts, scene change counters and errors.
+        history: Log of every inventory update, to query past amounts.
+        state: Current record of every product, updated in place by each
+            inventory extraction. Subscribe to it to get notified of changes.
 
     Example::
 
         >>> man = InventoryManager("../models/model.onnx", "../models/labels.txt", "/dev/video0")
-        >>> print(man.inventory())
-        {'honey': ProductType(name='honey', amount=3, constraint=1, link='https://shop.com/honey', price=0.73, currency='$')}
+        >>> print(dict(man.inventory()))
+        {'honey': FrozenProductType(name='honey', amount=3, constraint=1, link='https://shop.com/honey', price=0.73, currency='$', price_time=1631112387.2)}
 
     See Also:
         https://github.com/dusty-nv/jetson-inference/blob/master/docs/aux-streaming.md#input-streams
@@ -103,72 +136,186 @@ class InventoryManager:
     _PATH2CONSTRAINTS: str = join(dirname(dirname(__file__)),
                                   "config", ".constraints.csv")
 
+    # A json file that stores recently scraped product prices.
+    _PATH2PRICES: str = join(dirname(dirname(__file__)),
+                             "config", ".prices.json")
+
+    # A binary file that logs every inventory update.
+    _PATH2HISTORY: str = join(dirname(dirname(__file__)),
+                              "config", ".history.bin")
+
+    # Seconds to wait for a buffered frame before giving up.
+    _CAPTURE_TIMEOUT: float = 5.0
+
     def __init__(self,
                  path2model: str,
                  path2labels: str,
-                 input_uri: str,
-                 sensitivity: float = 0.5) -> None:
-        if not isfile(path2model):
+                 input_uri: Union[str, Sequence[str]],
+                 sensitivity: float = 0.5,
+                 price_workers: int = 1,
+                 price_timeout: Optional[float] = None,
+                 price_ttl: float = 21600.0,
+                 price_cache_size: int = 256,
+                 price_refresh_interval: Optional[float] = None,
+                 frame_buffer_size: int = 0,
+                 frame_max_age: float = 1.0,
+                 capture_interval: Union[float, Sequence[float]] = 0.0,
+                 change_area_threshold: Optional[float] = None,
+                 change_block_threshold: float = 0.08,
+                 jpeg_quality: int = 85,
+                 picture_max_size: Optional[int] = None,
+                 detector: Optional[Detector] = None,
+                 camera: Optional[Any] = None,
+                 source_timeout: float = 10.0,
+                 history_max_size: int = 4194304,
+                 price_providers: Optional[Sequence[PriceProvider]] = None,
+                 class_thresholds: Optional[Dict[str, float]] = None,
+                 min_box_area: float = 0.0,
+                 regions: Sequence[Region] = ()) -> None:
+        input_uris: List[str] = [input_uri] if isinstance(input_uri, str) \
+                                else list(input_uri)
+        cameras: List[Optional[Any]] = [None] * len(input_uris) if camera is None \
+            else list(camera) if isinstance(camera, (list, tuple)) else [camera]
+        intervals: List[float] = list(capture_interval) \
+            if isinstance(capture_interval, (list, tuple)) \
+            else [capture_interval] * len(input_uris)
+        if not input_uris or len(cameras) != len(input_uris) or \
+           len(intervals) != len(input_uris):
+            raise ValueError("Need one camera and capture interval per input uri")
+
+        if detector is None and not isfile(path2model):
             raise FileNotFoundError("Cannot find model file " + path2model)
 
         if not isfile(path2labels):
             raise FileNotFoundError("Cannot find labels file " + path2labels)
 
-        if not exists(input_uri):
-            raise FileNotFoundError("Cannot find resource file " + input_uri)
-
-        self._network = detectNet(threshold=sensitivity, argv=[
-            "--model=" + path2model,
-            "--labels=" + path2labels,
-            "--input-blob=" + "input_0",
-            "--output-cvg=" + "scores",
-            "--output-bbox=" + "boxes",
-        ])
-
-        self._camera = videoSource(input_uri)
-        self._current_frame: Optional[cudaImage] = None
-
-        # Get available objects from labels file, skip BACKGROUND class.
-        with open(path2labels, "r") as labels_file:
-            classes: List[str] = []
-            for line in labels_file:
-                label: str = line.rstrip("\n")
-                if label != "BACKGROUND":
-                    classes.append(label.lower())
-
-        self.classes: Tuple[str, ...] = tuple(classes)
-
-        if not isfile(self._PATH2CONSTRAINTS):
-            # Create default constraints for each object class.
-            with open(self._PATH2CONSTRAINTS, "w", newline="") as csv_file:
-                csv_writer = csv.writer(csv_file)
-                csv_writer.writerow(["Class", "Constraint"])
-                csv_writer.writerows([[class_name, 0]
-                                      for class_name in self.classes])
-
-    def inventory(self) -> Dict[str, ProductType]:
+        for uri, cam in zip(input_uris, cameras):
+            if cam is None and not exists(uri):
+                raise FileNotFoundError("Cannot find resource file " + uri)
+
+        # Objects are filtered by class after detection, which must keep
+        # those any class would accept.
+        self._counter = DetectionCounter(load_labels(path2labels), sensitivity,
+                                         class_thresholds, min_box_area)
+        if detector is None:
+            detector = DetectNetDetector(path2model, path2labels,
+                                         min([sensitivity, *(class_thresholds or {}).values()]))
+        self._detector = detector
+        # Cameras are analyzed concurrently, only if detector allows so.
+        self._detector_lock = _NoLock() if detector.thread_safe else Lock()
+
+        if price_providers is None:
+            price_providers = [TrolleyProvider(timeout=price_timeout)]
+        self._price_aggregator = PriceAggregator(price_providers, price_workers)
+        self.price_cache = PriceCache(self._PATH2PRICES,
+                                      ttl=price_ttl,
+                                      max_size=price_cache_size,
+                                      scraper=self._price_aggregator.scrape_prices)
+
+        self._regions = list(regions)
+        # Product counts per region of each camera, from its last detection.
+        # Replaced as a whole on each update, so readers never see it change.
+        self._region_counts: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self._region_lock = Lock()
+
+        self.sources: Tuple[CameraSource, ...] = tuple(
+            CameraSource(uri,
+                         cam if cam is not None else self._open_camera(uri),
+                         partial(self._detect, uri),
+                         encoder=JpegEncoder(jpeg_quality, picture_max_size),
+                         frame_buffer_size=frame_buffer_size,
+                         frame_max_age=frame_max_age,
+                         capture_interval=interval,
+                         capture_timeout=self._CAPTURE_TIMEOUT,
+                         scene_change=None if change_area_threshold is None
+                         else SceneChangeDetector(change_block_threshold,
+                                                  change_area_threshold))
+            for uri, cam, interval in zip(input_uris, cameras, intervals))
+        for source in self.sources:
+            source.start()
+
+        self._source_timeout = source_timeout
+        self._source_executor = ThreadPoolExecutor(max_workers=len(self.sources),
+                                                   thread_name_prefix="camera")
+        # Ongoing update per source, a stalled camera keeps its own.
+        self._source_updates: Dict[str, Future] = {}
+
+        self._inventory_lock = Lock()
+        # Ongoing inventory extraction, and last result with its time.
+        self._pending: Optional[Future] = None
+        self._snapshot: Optional[Tuple[float, Snapshot]] = None
+
+        # Available objects come from labels file, without BACKGROUND class.
+        self.classes: Tuple[str, ...] = self._counter.classes
+
+        # Default constraints are created for each class, if missing.
+        self._constraints = ConstraintStore(self._PATH2CONSTRAINTS,
+                                            self.classes)
+
+        self.history = InventoryHistory(self._PATH2HISTORY, self.classes,
+                                        history_max_size)
+
+        self.state = InventoryState(self.classes)
+        # Versions of constraints and prices last applied to state.
+        self._constraints_version = -1
+        self._prices_version = -1
+
+        self._price_refresher: Optional[PriceRefresher] = None
+        if price_refresh_interval is not None:
+            self._price_refresher = PriceRefresher(self.price_cache,
+                                                   list(self.classes),
+                                                   price_refresh_interval)
+            self._price_refresher.start()
+
+    def inventory(self,
+                  force_refresh: bool = False,
+                  max_age: Optional[float] = None) -> Snapshot:
         """Extracts inventory information from a real-time image.
 
+        Concurrent callers share a single ongoing extraction, instead
+        of capturing and analyzing a new image each.
+
+        Args:
+            force_refresh: If `True`, scrape every product price before
+                answering instead of using cached ones.
+            max_age: If given, maximum seconds since last extraction for its
+                result to be returned again, without any new extraction.
+
         Returns:
             Information about products which can be accessed by their name.
+            It is read-only and shared by every caller, `ProductType.copy`
+            gives records that can be modified.
 
         Raises:
             InvalidConstraintError: If internal constraints loading fails.
         """
-        result: Dict[str, ProductType] = {class_name:ProductType(class_name)
-                                          for class_name in self.classes}
-        try:
-            self._load_constraints(result)
-        except KeyError:
-            raise InvalidConstraintError("Invalid class name on file.")
-        
-        self._update_prices(result)
-        self._current_frame = self._camera.Capture()
-
-        # Count occurrences of each type within list of detected objects.
-        for obj in self._network.Detect(self._current_frame, overlay="none"):
-            result[self._network.GetClassDesc(obj.ClassID).lower()].amount += 1
-        return result
+        with self._inventory_lock:
+            if not force_refresh and max_age is not None and \
+               self._snapshot is not None and \
+               time.monotonic() - self._snapshot[0] <= max_age:
+                return self._snapshot[1]
+
+            # Join an ongoing extraction, unless fresh prices are required.
+            owner = force_refresh or self._pending is None
+            if owner:
+                self._pending = Future()
+            pending: Future = self._pending
+
+        if owner:
+            try:
+                result = self._extract_inventory(force_refresh)
+                with self._inventory_lock:
+                    self._snapshot = (time.monotonic(), result)
+                pending.set_result(result)
+            except BaseException as e:
+                pending.set_exception(e)
+                raise
+            finally:
+                with self._inventory_lock:
+                    if self._pending is pending:
+                        self._pending = None
+
+        return pending.result()
 
     def update_constraint(self, class_name: str, constraint: int = 0) -> None:
         """Sets a new number of units that should be available constantly.
@@ -181,52 +328,191 @@ class InventoryManager:
             UnkownClassNameError: If `product_name` is not from `self.classes`.
             InvalidConstraintError: If `constraint` value is negative.
         """
-        if class_name not in self.classes:
-            raise UnkownClassNameError("Unexpected type of object " + class_name)
-
-        if constraint < 0:
-            raise InvalidConstraintError(f"Negative constraint: {constraint}")
-
-        # Read content from connstraints file, but replace new value.
-        with open(self._PATH2CONSTRAINTS, "r", newline="") as csv_file:
-            csv_reader = csv.reader(csv_file)
-            target: List[str] = [class_name, str(constraint)]
-            new_data: List[List[str]] = []
-            for row in csv_reader:
-                new_data.append(target if target[0] == row[0] else row)
-        # Overwrite constraints file.
-        with open(self._PATH2CONSTRAINTS, "w", newline="") as csv_file:
-            csv.writer(csv_file).writerows(new_data)
-
-    def picture(self, previous: bool = False) -> _TemporaryFileWrapper:
+        self.update_constraints({class_name: constraint})
+
+    def update_constraints(self, constraints: Dict[str, int]) -> None:
+        """Sets new numbers of units for several products at once.
+
+        Either every constraint is updated or none of them is.
+
+        Args:
+            constraints: New unit constraint values by product class name.
+
+        Raises:
+            UnkownClassNameError: If any name is not from `self.classes`.
+            InvalidConstraintError: If any constraint value is negative.
+        """
+        for class_name, constraint in constraints.items():
+            if class_name not in self.classes:
+                raise UnkownClassNameError("Unexpected type of object " + class_name)
+
+            if constraint < 0:
+                raise InvalidConstraintError(f"Negative constraint: {constraint}")
+
+        self._constraints.update(constraints)
+
+    def picture(self, previous: bool = False, source: int = 0) -> bytes:
         """Picture of current inventory state.
 
         Args:
             previous: If `True` and `self.inventory` has been called at least
                 once, get picture from last inventory update.
+            source: Index of camera within `self.sources`.
+
+        Returns:
+            JPEG image contents, encoded in memory. A frame is only
+            encoded once, however many pictures are taken from it.
+        """
+        return self.sources[source].picture(previous)
+
+    def photo(self, previous: bool = False, source: int = 0) -> Tuple[bytes, str]:
+        """Picture of current inventory state, along with a key of its scene.
+
+        Args:
+            previous: If `True` and `self.inventory` has been called at least
+                once, get picture from last inventory update.
+            source: Index of camera within `self.sources`.
+
+        Returns:
+            JPEG image contents, and a key that stays the same for every
+            picture of an unchanged scene, despite sensor noise.
+        """
+        return self.sources[source].photo(previous)
+
+    def breakdown(self) -> Dict[str, Dict[str, int]]:
+        """Product counts of each camera, from latest inventory update.
+
+        Returns:
+            Number of units per product class, by source name. Cameras
+            that were never analyzed successfully are left out.
+        """
+        return {source.name: dict(source.counts) for source in self.sources
+                if source.counts is not None}
+
+    def region_breakdown(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """Product counts within each region of each camera.
 
         Returns:
-            Opened temporary jpg image file that will get deleted if closed.
+            Number of units per product class, by region name, by
+            source name. Cameras that were never analyzed successfully
+            are left out, as well as every camera if there are no regions.
         """
-        if not previous or self._current_frame is None:
-            self._current_frame = self._camera.Capture()
-        
-        temp = NamedTemporaryFile(prefix="inventory_picture_", suffix=".jpg")
-        saveImage(temp.name, self._current_frame)
-        temp.seek(0)
-        return temp
-
-    def _load_constraints(self, inventory_data: Dict[str, ProductType]) -> None:
-        with open(self._PATH2CONSTRAINTS, "r", newline="") as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            # Get column headers and update constraint field for each product.
-            class_h, constraint_h = csv_reader.fieldnames
-            for row in csv_reader:
-                inventory_data[row[class_h]].constraint = int(row[constraint_h])
+        region_counts = self._region_counts
+        return {source.name: {region: dict(counts) for region, counts in
+                              region_counts[source.name].items()}
+                for source in self.sources if source.name in region_counts}
+
+    def _load_constraints(self) -> None:
+        # Update constraint field for each product, only if any changed.
+        version, constraints = self._constraints.changed_since(self._constraints_version)
+        if constraints is not None:
+            self.state.set_constraints(constraints)
+            self._constraints_version = version
+
+    def close(self) -> None:
+        """Stops every background task."""
+        if self._price_refresher is not None:
+            self._price_refresher.stop()
+        for source in self.sources:
+            source.stop()
+            if source.scene_change is not None:
+                logging.info(f"{source.name}: {source.scene_change.report()}")
+        self._source_executor.shutdown(wait=False)
+        self._price_aggregator.close()
+
+    def _extract_inventory(self, force_refresh: bool) -> Snapshot:
+        start = time.perf_counter()
+        try:
+            with METRICS.timer("constraints"):
+                self._load_constraints()
+        except KeyError:
+            raise InvalidConstraintError("Invalid class name on file.")
+
+        with METRICS.timer("prices"):
+            self._update_prices(force_refresh)
+
+        self.state.set_amounts(self._count_sources())
+        _, result = self.state.commit()
+
+        try:
+            with METRICS.timer("history"):
+                self.history.append({name: (product.amount, product.constraint,
+                                            product.price)
+                                     for name, product in result.items()})
+        except OSError:
+            # Losing history must never prevent answering.
+            logging.warning("Cannot log inventory history", exc_info=True)
+        METRICS.observe("inventory", time.perf_counter() - start)
+        return result
+
+    def _count_sources(self) -> Dict[str, int]:
+        # Update every camera at once, joining those still in progress.
+        futures: Dict[str, Future] = {}
+        with self._inventory_lock:
+            for source in self.sources:
+                future = self._source_updates.get(source.name)
+                if future is None or future.done():
+                    future = self._source_executor.submit(source.update)
+                    self._source_updates[source.name] = future
+                futures[source.name] = future
+        wait(futures.values(), timeout=self._source_timeout)
+
+        totals: Dict[str, int] = {}
+        errors: List[BaseException] = []
+        for source in self.sources:
+            future = futures[source.name]
+            if future.done() and future.exception() is None:
+                counts = future.result()
+            else:
+                error = future.exception() if future.done() else \
+                        TimeoutError(f"{source.name} took too long")
+                errors.append(error)
+                logging.warning(f"Camera {source.name} failed, using its latest "
+                                f"counts: {error}")
+                counts = source.counts or {}
+            for class_name, amount in counts.items():
+                totals[class_name] = totals.get(class_name, 0) + amount
+
+        # Nothing can be reported if every camera failed.
+        if len(errors) == len(self.sources):
+            raise errors[0]
+        return totals
+
+    def _detect(self, source_name: str, frame: Any) -> Dict[str, int]:
+        with self._detector_lock, METRICS.timer("detect"):
+            class_ids, confidences, boxes = self._detector.detect_arrays(frame)
+        # Count occurrences of each type among detected objects, at once.
+        with METRICS.timer("count"):
+            if self._regions:
+                height, width = to_numpy(frame).shape[:2]
+                counts = self._counter.count_regions_arrays(
+                    class_ids, confidences, boxes,
+                    {region.name: region.box(width, height) for region in self._regions})
+                with self._region_lock:
+                    self._region_counts = {**self._region_counts, source_name: counts}
+            return self._counter.count_arrays(class_ids, confidences, box_areas(boxes))
 
     @staticmethod
-    def _update_prices(inventory_data: Dict[str, ProductType]) -> None:
-        # Get real-time prices and purchase links for each product.
-        for name, *data in scrape_prices(list(inventory_data.keys())):
-            product: ProductType = inventory_data[name]
-            product.link, product.price, product.currency = data
+    def _open_camera(input_uri: str) -> Any:
+        # Only load Jetson libraries when they are really needed.
+        from jetson.utils import videoSource
+        return videoSource(input_uri)
+
+    def _update_prices(self, force_refresh: bool = False) -> None:
+        names: List[str] = list(self.classes)
+        version = self.price_cache.version
+        if force_refresh:
+            prices = self.price_cache.refresh(names)
+        elif self._price_refresher is not None:
+            if version == self._prices_version:
+                # Nothing was fetched since prices were last applied.
+                return
+            # Never wait for the network, refresher keeps prices current.
+            prices = self.price_cache.peek(names)
+        else:
+            prices = self.price_cache.get_prices(names)
+
+        # Get recent prices and purchase links for each product.
+        for name, *data in prices:
+            self.state.set_price(name, *data, self.price_cache.fetched(name))
+        self._prices_version = version
@@ -0,0 +1,148 @@
+"""Background watcher which reports pantry changes on its own.
+
+This module analyzes inventory periodically, more often while the
+pantry is being used, and tells when a product starts or stops
+being needed.
+
+Author:
+    Andrés Pérez
+"""
+
+from inventory_manager import InventoryManager
+from inventory_state import Changes, Snapshot
+from metrics import METRICS
+from threading import Thread, Event, Lock
+import logging
+from typing import Callable, List, Optional
+
+
+class InventoryMonitor:
+    """Updates inventory in background, on an adaptive schedule.
+
+    After an update where any product amount changed, next one runs
+    `min_interval` seconds later. Otherwise, interval grows `backoff`
+    times per update, up to `max_interval`, so that a static pantry
+    is hardly analyzed at all.
+
+    Every inventory update is watched, including those requested by
+    users: an alert is sent whenever a product's demand goes from
+    zero to non-zero or back. The very first update only sets a
+    reference, since nothing is known about previous state.
+
+    Args:
+        manager: Inventory manager to be updated.
+        alert: Function that delivers an alert message, such as a
+            Telegram chat. It is called from the updating thread.
+        min_interval: Seconds between updates while pantry changes.
+        max_interval: Maximum seconds between updates.
+        backoff: Growth factor of interval after each unchanged update.
+
+    Raises:
+        ValueError: If `min_interval` is not a positive number,
+            `max_interval` is smaller than it, or `backoff` is below 1.
+
+    Attributes:
+        interval: Seconds until next update.
+
+    Example::
+
+        >>> monitor = InventoryMonitor(manager, telebot.notify, 30.0, 600.0)
+        >>> monitor.start()
+        >>> # Honey runs out, then telebot sends:
+        >>> # Honey is running low, 2 more needed.
+        >>> monitor.stop()
+    """
+
+    def __init__(self,
+                 manager: InventoryManager,
+                 alert: Callable[[str], None],
+                 min_interval: float = 30.0,
+                 max_interval: float = 600.0,
+                 backoff: float = 2.0) -> None:
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(f"Invalid monitor intervals: {min_interval}, {max_interval}")
+
+        if backoff < 1:
+            raise ValueError(f"Invalid monitor backoff: {backoff}")
+
+        self._manager = manager
+        self._alert = alert
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self.interval: float = min_interval
+
+        self._lock = Lock()
+        # Whether any amount changed since last scheduled update.
+        self._active = False
+        # Demand of earlier updates is unknown until one is seen.
+        self._ready = manager.state.version > 0
+        manager.state.subscribe(self._on_changes)
+
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, name="inventory_monitor",
+                              daemon=True)
+
+    @property
+    def running(self) -> bool:
+        """Whether background thread is alive."""
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts updating in background."""
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops updating in background.
+
+        Args:
+            timeout: Seconds to wait for an ongoing update to finish.
+        """
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def check(self) -> None:
+        """Updates inventory once, then schedules next update."""
+        try:
+            # An update requested by users a moment ago is just as good.
+            self._manager.inventory(max_age=self._min_interval)
+        except Exception:
+            logging.warning("Inventory monitor update failed", exc_info=True)
+
+        with self._lock:
+            active, self._active = self._active, False
+        if active:
+            self.interval = self._min_interval
+        else:
+            self.interval = min(self.interval * self._backoff, self._max_interval)
+        METRICS.increment("monitor_check")
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def _on_changes(self, changes: Changes, products: Snapshot) -> None:
+        messages: List[str] = []
+        for name, fields in changes.items():
+            if "amount" in fields:
+                with self._lock:
+                    self._active = True
+            if "amount" not in fields and "constraint" not in fields:
+                continue
+
+            product = products[name]
+            amount = fields.get("amount", (product.amount,))[0]
+            constraint = fields.get("constraint", (product.constraint,))[0]
+            was_needed = amount < constraint
+            if was_needed and product.demand == 0:
+                messages.append(f"{name.title()} is stocked again.")
+            elif not was_needed and product.demand > 0:
+                messages.append(f"{name.title()} is running low, "
+                                f"{product.demand} more needed.")
+
+        with self._lock:
+            ready, self._ready = self._ready, True
+        if messages and ready:
+            METRICS.increment("monitor_alert", len(messages))
+            self._alert("\n".join(messages))
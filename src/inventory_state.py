@@ -0,0 +1,285 @@
+"""Long-lived inventory state, updated in place.
+
+This module keeps one record per product for the whole application
+lifetime, and tells which of their fields changed on each update.
+
+Author:
+    Andrés Pérez
+"""
+
+from threading import Lock
+from types import MappingProxyType
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+Changes = Dict[str, Dict[str, Tuple[Any, Any]]]
+"""Previous and new value of each changed field, by product name."""
+
+
+class ProductType:
+    """Stores information about a certain type of product.
+
+    Records only reserve room for their fields, so that large label
+    sets stay compact in memory.
+
+    Attributes:
+        name: Common name for a type product.
+        amount: Number of available product units.
+        constraint: Minimum units that should be available constantly.
+        link: Purchase url.
+        price: Price value.
+        currency: Currency symbol.
+        price_time: Time price was scraped at, as given by `time.time`.
+            `None` if unknown.
+    """
+
+    __slots__ = ("name", "amount", "constraint", "link",
+                 "price", "currency", "price_time")
+
+    def __init__(self,
+                 name: str,
+                 amount: int = 0,
+                 constraint: int = 0,
+                 link: str = "",
+                 price: float = 0.0,
+                 currency: str = "",
+                 price_time: Optional[float] = None) -> None:
+        self.name = name
+        self.amount = amount
+        self.constraint = constraint
+        self.link = link
+        self.price = price
+        self.currency = currency
+        self.price_time = price_time
+
+    @property
+    def demand(self) -> int:
+        """Number of units needed to fulfill established contraint."""
+        dif = self.amount - self.constraint
+        return abs(dif) if dif < 0 else 0
+
+    @property
+    def total_cost(self) -> float:
+        """Total cost of demanded product units."""
+        return round(self.demand * self.price, 2)
+
+    @property
+    def price_age(self) -> Optional[float]:
+        """Seconds since price was scraped, `None` if unknown."""
+        return None if self.price_time is None else time.time() - self.price_time
+
+    def copy(self) -> "ProductType":
+        """Independent record with the same field values."""
+        return ProductType(self.name, self.amount, self.constraint, self.link,
+                           self.price, self.currency, self.price_time)
+
+    def frozen(self) -> "FrozenProductType":
+        """Read-only record with the same field values."""
+        record = FrozenProductType.__new__(FrozenProductType)
+        for field in self.__slots__:
+            object.__setattr__(record, field, getattr(self, field))
+        return record
+
+    # Records are mutable, hence they cannot be hashed.
+    __hash__ = None
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ProductType):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field)
+                   for field in self.__slots__)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{field}={getattr(self, field)!r}"
+                           for field in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+    def __str__(self) -> str:
+        price_str = f"{self.price}{self.currency}"
+        price_age = self.price_age
+        if price_age is not None:
+            price_str += f" ({int(price_age // 60)} min ago)"
+        return (f"{self.name.title()}\n"
+                f"Stored: {self.amount}\n"
+                f"Minimum units: {self.constraint}\n"
+                f"Needed: {self.demand}\n"
+                f"Current price: {price_str}\n"
+                f"Total cost: {self.total_cost}{self.currency}\n"
+                f"Purchase link: {self.link}\n")
+
+
+class FrozenProductType(ProductType):
+    """Product record whose fields cannot be modified.
+
+    Inventory snapshots are made of these, so that a single snapshot
+    can be handed out to every caller. Use `copy` to get a mutable one.
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"Read-only product record: cannot set {name}")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"Read-only product record: cannot delete {name}")
+
+
+Snapshot = Mapping[str, ProductType]
+"""Read-only records of every product, by product name."""
+
+
+class InventoryState:
+    """Current record of every product, with changes since last commit.
+
+    Records are created once and their fields are overwritten by each
+    update, instead of building a whole new inventory every time. Only
+    fields whose value is really different are tracked as changes.
+
+    Note:
+        Price fetch times are updated, but never reported as changes.
+
+    Args:
+        classes: Names of every product class.
+
+    Attributes:
+        version: Number of commits that changed anything.
+
+    Example::
+
+        >>> state = InventoryState(["honey", "water"])
+        >>> state.set_amounts({"honey": 3})
+        >>> state.commit()[0]
+        {'honey': {'amount': (0, 3)}}
+        >>> state.set_amounts({"honey": 3})
+        >>> state.commit()[0]
+        {}
+    """
+
+    def __init__(self, classes: Iterable[str]) -> None:
+        self._lock = Lock()
+        self._products: Dict[str, ProductType] = {name: ProductType(name)
+                                                  for name in classes}
+        # Changes not committed yet.
+        self._changes: Changes = {}
+        # Products whose committed record is outdated, including price times.
+        self._dirty: Set[str] = set()
+        self._frozen: Dict[str, ProductType] = {name: product.frozen() for name, product
+                                                in self._products.items()}
+        self._snapshot: Optional[Snapshot] = None
+        self._listeners: List[Callable[[Changes, Snapshot], None]] = []
+        self.version: int = 0
+
+    def subscribe(self, listener: Callable[[Changes, Snapshot], None]) -> None:
+        """Calls a function with changes of each commit that has any.
+
+        Args:
+            listener: Function called from the committing thread with
+                changes and committed records.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def set_amounts(self, counts: Mapping[str, int]) -> None:
+        """Sets number of units of every product.
+
+        Args:
+            counts: Units per product name. Missing products have no
+                units, unknown ones are ignored.
+        """
+        with self._lock:
+            for name, product in self._products.items():
+                self._set(product, "amount", counts.get(name, 0))
+
+    def set_constraints(self, constraints: Mapping[str, int]) -> None:
+        """Sets minimum number of units of given products.
+
+        Args:
+            constraints: Unit constraint per product name.
+
+        Raises:
+            KeyError: If a product name is unknown, nothing is set then.
+        """
+        with self._lock:
+            products = [self._products[name] for name in constraints]
+            for product, constraint in zip(products, constraints.values()):
+                self._set(product, "constraint", constraint)
+
+    def set_price(self,
+                  name: str,
+                  link: str,
+                  price: float,
+                  currency: str,
+                  price_time: Optional[float] = None) -> None:
+        """Sets purchase information of a product.
+
+        Args:
+            name: Product name.
+            link: Purchase url.
+            price: Price value.
+            currency: Currency symbol.
+            price_time: Time price was scraped at, `None` if unknown.
+
+        Raises:
+            KeyError: If product name is unknown.
+        """
+        with self._lock:
+            product = self._products[name]
+            self._set(product, "link", link)
+            self._set(product, "price", price)
+            self._set(product, "currency", currency)
+            if product.price_time != price_time:
+                product.price_time = price_time
+                self._dirty.add(name)
+
+    def commit(self) -> Tuple[Changes, Snapshot]:
+        """Ends an update.
+
+        Returns:
+            Changes since previous commit, and a read-only copy of every
+            record, which can be shared without copying it again. Such
+            copy is the same object as long as no record changes.
+        """
+        with self._lock:
+            changes, self._changes = self._changes, {}
+            if self._dirty or self._snapshot is None:
+                # Only records that changed are copied again.
+                for name in self._dirty:
+                    self._frozen[name] = self._products[name].frozen()
+                self._dirty.clear()
+                self._snapshot = MappingProxyType(dict(self._frozen))
+            snapshot = self._snapshot
+            if changes:
+                self.version += 1
+            listeners = list(self._listeners) if changes else []
+
+        for listener in listeners:
+            try:
+                listener(changes, snapshot)
+            except Exception:
+                # A broken listener must never prevent an update.
+                logging.exception("Inventory change listener failed")
+        return changes, snapshot
+
+    def snapshot(self) -> Dict[str, ProductType]:
+        """Copy of every record, including uncommitted changes."""
+        with self._lock:
+            return {name: product.copy() for name, product in self._products.items()}
+
+    def _set(self, product: ProductType, field: str, value: Any) -> None:
+        old = getattr(product, field)
+        if old == value:
+            return
+        setattr(product, field, value)
+        self._dirty.add(product.name)
+
+        # Keep value from last commit, if it changed several times since then.
+        fields = self._changes.setdefault(product.name, {})
+        first = fields.get(field, (old,))[0]
+        if first == value:
+            # It went back to committed value.
+            del fields[field]
+            if not fields:
+                del self._changes[product.name]
+        else:
+            fields[field] = (first, value)
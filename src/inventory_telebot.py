@@ -14,13 +14,25 @@ from telegram.ext import (Updater,
                           CallbackContext,
                           Filters)
 from telegram import Update, ParseMode
-from inventory_manager import (InventoryManager,
-                               ProductType,
-                               UnkownClassNameError,
-                               InvalidConstraintError)
+from telegram.error import TelegramError
+from constraint_store import UnkownClassNameError, InvalidConstraintError
+from inventory_state import ProductType, Snapshot
+from worker_pool import WorkerPool
+from photo_cache import PhotoCache
+from metrics import METRICS
 from os import kill, getpid
+from os.path import join, dirname
 from signal import SIGABRT
-from typing import List
+from urllib.parse import urlparse
+import socket
+from datetime import datetime
+import logging
+import time
+from typing import Any, Callable, List, Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Loading manager pulls in detection and scraping, bot starts without them.
+    from inventory_manager import InventoryManager
 
 
 class InventoryTelebot:
@@ -30,10 +42,33 @@ class InventoryTelebot:
         You can get a deeper understsanding about
         class settings format under `CONFIG.md`.
 
+    Commands that capture images or scrape prices run on a bounded
+    worker pool, so cheap ones such as /help are answered at once.
+
     Args:
         token: Bot token obtained by Telegram's BotFather.
         chat_id: Numeric id for a chat the bot will participate in.
         manager: `InventoryManager` instance to handle inventory in real-time.
+            If `None`, bot answers inventory commands with a warming up
+            message until `set_manager` is called.
+        snapshot_max_age: If given, seconds an inventory result can be
+            reused for by later commands.
+        workers: Number of threads running slow commands.
+        max_queue: Maximum number of slow commands waiting for a thread,
+            further ones are rejected.
+        photo_cache_size: Maximum number of uploaded photos whose
+            Telegram `file_id` is remembered, so they are not uploaded again.
+        base_url: If given, Bot API url to use instead of Telegram's, such
+            as a self-hosted Bot API server.
+        webhook_url: If given, public url Telegram sends updates to, instead
+            of being polled for them. It must reach the local listener,
+            such as through a reverse proxy, with the same path.
+        webhook_listen: Address the local webhook listener binds to.
+        webhook_port: Port the local webhook listener binds to.
+
+    Attributes:
+        mode: How updates are received, either ``"webhook"`` or
+            ``"polling"``. Polling is used whenever webhook cannot start.
 
     Example::
 
@@ -63,14 +98,44 @@ class InventoryTelebot:
         "buy",
     }
 
+    # A json file that stores Telegram file_id of uploaded photos.
+    _PATH2PHOTOS: str = join(dirname(dirname(__file__)),
+                             "config", ".photos.json")
+
+    # Maximum number of amount changes shown by /history.
+    _HISTORY_LINES = 10
+
+    # Maximum number of concurrent runs per slow command.
+    _COMMAND_LIMITS = {
+        "inventory": 2,
+        "list": 2,
+        "picture": 1,
+    }
+
     def __init__(self,
                  token: str,
                  chat_id: int,
-                 manager: InventoryManager) -> None:        
+                 manager: Optional["InventoryManager"] = None,
+                 snapshot_max_age: Optional[float] = None,
+                 workers: int = 4,
+                 max_queue: int = 16,
+                 photo_cache_size: int = 128,
+                 base_url: Optional[str] = None,
+                 webhook_url: Optional[str] = None,
+                 webhook_listen: str = "127.0.0.1",
+                 webhook_port: int = 8443) -> None:
         self._token = token
         self._chat_id = chat_id
         self._manager = manager
-        self._updater = Updater(token=self._token, use_context=True)
+        self._snapshot_max_age = snapshot_max_age
+        self._workers = WorkerPool(workers, max_queue, self._COMMAND_LIMITS)
+        self._photos = PhotoCache(self._PATH2PHOTOS, photo_cache_size)
+        self._updater = Updater(token=self._token, base_url=base_url,
+                                use_context=True)
+        self._webhook_url = webhook_url
+        self._webhook_listen = webhook_listen
+        self._webhook_port = webhook_port
+        self.mode: str = "polling"
 
     def run(self) -> None:
         """Starts bot's process.
@@ -79,17 +144,62 @@ class InventoryTelebot:
             This is a blocking method until one of these
             signals is received: SIGINT, SIGTERM, SIGABRT.
         """
+        self.start()
+        self.idle()
+
+    def set_manager(self, manager: "InventoryManager") -> None:
+        """Provides an inventory manager once it is ready.
+
+        Args:
+            manager: `InventoryManager` instance to handle inventory in real-time.
+        """
+        self._manager = manager
+
+    def notify(self, text: str) -> None:
+        """Sends a message to the chat on bot's own initiative.
+
+        Message is sent in background, so it never delays its caller.
+
+        Args:
+            text: Message contents.
+        """
+        if not self._workers.submit("notify", self._send_notification, text):
+            logging.warning("Too busy to send notification: " + text)
+
+    def start(self) -> None:
+        """Connects to Telegram and starts answering commands in background."""
         disp: Dispatcher = self._updater.dispatcher
         disp.add_handler(CommandHandler("start", self._start))
         disp.add_handler(CommandHandler("help", self._help))
-        disp.add_handler(CommandHandler("inventory", self._inventory))
-        disp.add_handler(CommandHandler("list", self._list))
+        disp.add_handler(CommandHandler("inventory",
+                                        self._in_background("inventory", self._inventory)))
+        disp.add_handler(CommandHandler("list",
+                                        self._in_background("list", self._list)))
         disp.add_handler(CommandHandler("setmin", self._setmin))
-        disp.add_handler(CommandHandler("picture", self._picture))
+        disp.add_handler(CommandHandler("history", self._history))
+        disp.add_handler(CommandHandler("shelves",
+                                        self._in_background("shelves", self._shelves)))
+        disp.add_handler(CommandHandler("picture",
+                                        self._in_background("picture", self._picture)))
         disp.add_handler(MessageHandler(Filters.text, self._find_keywords))
         disp.add_error_handler(self._error_handler)
-        self._updater.start_polling()
+        self._workers.start()
+        if self._webhook_url is not None and self._start_webhook():
+            self.mode = "webhook"
+        else:
+            self.mode = "polling"
+            self._updater.start_polling()
+        logging.info(f"Receiving Telegram updates through {self.mode}")
+
+    def stop(self) -> None:
+        """Disconnects from Telegram."""
+        self._updater.stop()
+        self._workers.stop()
+
+    def idle(self) -> None:
+        """Blocks until one of these signals is received: SIGINT, SIGTERM, SIGABRT."""
         self._updater.idle()
+        self._workers.stop()
 
     def _start(self, update: Update, _: CallbackContext) -> None:
         # Ignore incoming messages from other chats.
@@ -109,29 +219,55 @@ class InventoryTelebot:
                                   "/help -> Help message\n"
                                   "/inventory -> Returns all products\n"
                                   "/list -> Makes a shopping list\n"
+                                  "Add \"refresh\" to any of them to get\n"
+                                  "up to date prices\n"
                                   "/setmin PRODUCT UNITS -> UNITS\n"
                                   "units of PRODUCT should be available\n"
-                                  "constantly. Use \"-\" as spacers\n"
+                                  "constantly. Use \"-\" as spacers.\n"
+                                  "Several PRODUCT UNITS pairs can be\n"
+                                  "given at once\n"
                                   "/picture -> Take a picture of the pantry\n"
+                                  "/history PRODUCT [DAYS] -> Recent\n"
+                                  "amounts of PRODUCT, 7 days by default,\n"
+                                  "and when it will run out\n"
+                                  "/shelves -> Returns products on\n"
+                                  "each shelf\n"
                                   "\nCertain keywords such as shopping list\n"
                                   "may trigger some of the above commands.\n")
 
-    def _inventory(self, update: Update, context: CallbackContext) -> None:
+    def _inventory(self,
+                   update: Update,
+                   context: CallbackContext,
+                   inventory: Optional[Snapshot] = None) -> None:
         # Ignore incoming messages from other chats.
         if update.effective_chat.id != self._chat_id:
             return
 
-        l = [str(product) for product in self._manager.inventory().values()]
-        context.bot.send_photo(chat_id=self._chat_id,
-                               photo=self._manager.picture(previous=True))
-        update.message.reply_text("\n\n".join(l), disable_web_page_preview=True)
+        if self._warming_up(update):
+            return
 
-    def _list(self, update: Update, _: CallbackContext) -> None:
+        if inventory is None:
+            inventory = self._get_inventory(context)
+        l = [str(product) for product in inventory.values()]
+        self._photos.send_photo(context.bot, self._chat_id,
+                                *self._manager.photo(previous=True))
+        with METRICS.timer("telegram_send"):
+            update.message.reply_text("\n\n".join(l), disable_web_page_preview=True)
+
+    def _list(self,
+              update: Update,
+              context: CallbackContext,
+              inventory: Optional[Snapshot] = None) -> None:
         # Ignore incoming messages from other chats.
         if update.effective_chat.id != self._chat_id:
             return
 
-        products: List[ProductType] = list(self._manager.inventory().values())
+        if self._warming_up(update):
+            return
+
+        if inventory is None:
+            inventory = self._get_inventory(context)
+        products: List[ProductType] = list(inventory.values())
         shopping_list: List[str] = ["*Shopping list*\n"]
         list_cost: float = 0.0
 
@@ -146,25 +282,34 @@ class InventoryTelebot:
             str_cost = str(round(list_cost, 2)).replace(".", "\\.")
             shopping_list.append(f"\nCost: {str_cost}{products[0].currency}\n")
 
-        update.message.reply_text("\n".join(shopping_list),
-                                  parse_mode=ParseMode.MARKDOWN_V2)
+        with METRICS.timer("telegram_send"):
+            update.message.reply_text("\n".join(shopping_list),
+                                      parse_mode=ParseMode.MARKDOWN_V2)
     
     def _setmin(self, update: Update, context: CallbackContext) -> None:
         # Ignore incoming messages from other chats.
         if update.effective_chat.id != self._chat_id:
             return
 
-        if not context.args:
+        if self._warming_up(update):
+            return
+
+        # Arguments must come in PRODUCT UNITS pairs.
+        if not context.args or len(context.args) % 2 != 0:
             update.message.reply_text("Invalid command syntax.")
             return
-        
-        product, units, *_ = context.args
-        product = product.replace("-", " ").lower()
-        units = int(units)
+
+        constraints: Dict[str, int] = {}
+        for product, units in zip(context.args[::2], context.args[1::2]):
+            try:
+                constraints[product.replace("-", " ").lower()] = int(units)
+            except ValueError:
+                update.message.reply_text("Invalid value for UNITS.")
+                return
 
         try:
-            # Update minimum units for product.
-            self._manager.update_constraint(product, units)
+            # Update minimum units for every product in a single write.
+            self._manager.update_constraints(constraints)
         except UnkownClassNameError:
             update.message.reply_text("Invalid value for PRODUCT.")
             return
@@ -172,26 +317,198 @@ class InventoryTelebot:
             update.message.reply_text("Invalid value for UNITS.")
             return
 
-        update.message.reply_text(f"Ok, you need at least {units} {product}.")
+        summary = ", ".join(f"{units} {product}"
+                            for product, units in constraints.items())
+        update.message.reply_text(f"Ok, you need at least {summary}.")
+
+    def _history(self, update: Update, context: CallbackContext) -> None:
+        # Ignore incoming messages from other chats.
+        if update.effective_chat.id != self._chat_id:
+            return
+
+        if self._warming_up(update):
+            return
+
+        if not context.args or len(context.args) > 2:
+            update.message.reply_text("Invalid command syntax.")
+            return
+
+        product = context.args[0].replace("-", " ").lower()
+        if product not in self._manager.classes:
+            update.message.reply_text("Invalid value for PRODUCT.")
+            return
+
+        try:
+            days = float(context.args[1]) if len(context.args) > 1 else 7.0
+        except ValueError:
+            update.message.reply_text("Invalid value for DAYS.")
+            return
+
+        # Only records within requested days are read from history log.
+        window = days * 86400
+        history = self._manager.history
+        changes = history.changes(product, since=time.time() - window)
+        if not changes:
+            update.message.reply_text(f"No {product} history yet.")
+            return
+
+        lines: List[str] = [f"{product.title()} history:"]
+        lines.extend(f"{datetime.fromtimestamp(timestamp):%d/%m %H:%M} -> {amount}"
+                     for timestamp, amount in changes[-self._HISTORY_LINES:])
+
+        depletion = history.depletion(product, window)
+        if depletion is None:
+            lines.append("\nIt is not running out.")
+        elif depletion <= time.time():
+            lines.append(f"\nIt ran out on {datetime.fromtimestamp(depletion):%d/%m %H:%M}.")
+        else:
+            lines.append(f"\nIt will run out around "
+                         f"{datetime.fromtimestamp(depletion):%d/%m %H:%M}.")
+        update.message.reply_text("\n".join(lines))
+
+    def _shelves(self, update: Update, context: CallbackContext) -> None:
+        # Ignore incoming messages from other chats.
+        if update.effective_chat.id != self._chat_id:
+            return
+
+        if self._warming_up(update):
+            return
+
+        # Region counts are updated along with inventory.
+        self._get_inventory(context)
+        breakdown = self._manager.region_breakdown()
+        if not breakdown:
+            update.message.reply_text("No shelves have been set up.")
+            return
+
+        sections: List[str] = []
+        for source, regions in breakdown.items():
+            for region, counts in regions.items():
+                # Shelves are only told apart by camera if there are several.
+                title = region.title() if len(breakdown) == 1 else f"{source} {region}"
+                lines = [f"{name.title()}: {amount}" for name, amount in sorted(counts.items())]
+                sections.append(f"{title}:\n" + ("\n".join(lines) or "Empty"))
+        with METRICS.timer("telegram_send"):
+            update.message.reply_text("\n\n".join(sections))
 
     def _picture(self, update: Update, context: CallbackContext) -> None:
         # Ignore incoming messages from other chats.
         if update.effective_chat.id != self._chat_id:
             return
 
-        context.bot.send_photo(chat_id=self._chat_id,
-                               photo=self._manager.picture())
+        if self._warming_up(update):
+            return
 
-    def _find_keywords(self, update: Update, _: CallbackContext) -> None:
-        # Let other methods check chat id. 
-        
-        input_text = str(update.message.text).lower()
+        self._photos.send_photo(context.bot, self._chat_id,
+                                *self._manager.photo())
+
+    def _find_keywords(self, update: Update, context: CallbackContext) -> None:
+        # Ignore incoming messages from other chats.
+        if update.effective_chat.id != self._chat_id:
+            return
 
-        if any(keyword in input_text for keyword in self._INVENTORY_KEYWORDS):
-            self._inventory(update, _)
+        input_text = str(update.message.text).lower()
+        wants_inventory = any(keyword in input_text
+                              for keyword in self._INVENTORY_KEYWORDS)
+        wants_list = any(keyword in input_text for keyword in self._LIST_KEYWORDS)
+        if not (wants_inventory or wants_list) or self._warming_up(update):
+            return
 
-        if any(keyword in input_text for keyword in self._LIST_KEYWORDS):
-            self._list(update, _)
+        self._submit("inventory" if wants_inventory else "list",
+                     self._answer_keywords, update, context,
+                     wants_inventory, wants_list)
+
+    def _answer_keywords(self,
+                         update: Update,
+                         context: CallbackContext,
+                         wants_inventory: bool,
+                         wants_list: bool) -> None:
+        # Every answer to this message comes from the same inventory.
+        inventory = self._get_inventory(context)
+        if wants_inventory:
+            self._inventory(update, context, inventory)
+
+        if wants_list:
+            self._list(update, context, inventory)
+
+    def _in_background(self, command: str, handler: Callable[..., None]) -> Callable:
+        # Wraps a slow command handler, so that it runs on worker pool.
+        def callback(update: Update, context: CallbackContext) -> None:
+            # Ignore incoming messages from other chats.
+            if update.effective_chat.id != self._chat_id:
+                return
+
+            if self._warming_up(update):
+                return
+
+            self._submit(command, handler, update, context)
+        return callback
+
+    def _submit(self,
+                command: str,
+                handler: Callable[..., None],
+                update: Update,
+                context: CallbackContext,
+                *args: Any) -> None:
+        # Queue a slow handler, acknowledging or rejecting it right away.
+        if not self._workers.submit(command, self._run_handler, command,
+                                    time.perf_counter(), handler,
+                                    update, context, *args):
+            METRICS.increment("command_rejected")
+            update.message.reply_text("I am busy, try again in a few seconds.")
+            return
+        update.message.reply_text("Working on it...")
+
+    def _run_handler(self,
+                     command: str,
+                     queued: float,
+                     handler: Callable[..., None],
+                     update: Update,
+                     context: CallbackContext,
+                     *args: Any) -> None:
+        METRICS.observe("command_queue_wait", time.perf_counter() - queued)
+        # Errors in background must reach the dispatcher's error handler.
+        try:
+            with METRICS.timer("command_" + command):
+                handler(update, context, *args)
+        except Exception as e:
+            self._updater.dispatcher.dispatch_error(update, e)
+
+    def _start_webhook(self) -> bool:
+        # Updater waits forever for a webhook that cannot start, so check first.
+        family = socket.AF_INET6 if ":" in self._webhook_listen else socket.AF_INET
+        try:
+            probe = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                probe.bind((self._webhook_listen, self._webhook_port))
+            finally:
+                probe.close()
+            self._updater.bot.set_webhook(url=self._webhook_url)
+        except (OSError, TelegramError) as e:
+            logging.warning(f"Cannot receive updates through webhook, polling instead: {e}")
+            return False
+
+        self._updater.start_webhook(listen=self._webhook_listen,
+                                    port=self._webhook_port,
+                                    url_path=urlparse(self._webhook_url).path,
+                                    webhook_url=self._webhook_url)
+        return True
+
+    def _send_notification(self, text: str) -> None:
+        with METRICS.timer("telegram_send"):
+            self._updater.bot.send_message(chat_id=self._chat_id, text=text)
+
+    def _warming_up(self, update: Update) -> bool:
+        # Inventory manager may still be loading.
+        if self._manager is None:
+            update.message.reply_text("I am warming up, try again in a few seconds.")
+            return True
+        return False
+
+    def _get_inventory(self, context: CallbackContext) -> Snapshot:
+        # Only commands have arguments, such as "/list refresh".
+        force_refresh = bool(context.args) and "refresh" in context.args
+        return self._manager.inventory(force_refresh, self._snapshot_max_age)
 
     def _error_handler(self, update: object, context: CallbackContext) -> None:
         # Stop bot's process and log exception message.
@@ -0,0 +1,105 @@
+"""In-memory JPEG encoding of camera frames.
+
+This module compresses frames straight into memory, so that
+pictures can be uploaded without touching the disk.
+
+Note:
+    This module requires ``Pillow`` package.
+
+Author:
+    Andrés Pérez
+"""
+
+from detectors import to_numpy
+from io import BytesIO
+from threading import Lock
+import numpy as np
+from typing import Any, Optional, Tuple
+
+
+def encode_jpeg(image: Any, quality: int = 85, max_size: Optional[int] = None) -> bytes:
+    """Compresses an image as JPEG.
+
+    Args:
+        image: Either an RGB(A) array or a CUDA image from `jetson.utils`.
+        quality: JPEG quality, from 1 (smallest) to 95 (best).
+        max_size: If given, maximum width and height in pixels. Larger
+            images are shrunk keeping their aspect ratio.
+
+    Returns:
+        JPEG file contents.
+    """
+    from PIL import Image
+
+    pixels = to_numpy(image)
+    if pixels.dtype != np.uint8:
+        # CUDA float images already range from 0 to 255.
+        pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+    if pixels.ndim == 3:
+        # JPEG has no alpha channel.
+        pixels = pixels[..., :3]
+
+    picture = Image.fromarray(np.ascontiguousarray(pixels))
+    if max_size is not None:
+        picture.thumbnail((max_size, max_size))
+
+    buffer = BytesIO()
+    picture.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class JpegEncoder:
+    """Encodes frames as JPEG, remembering last result.
+
+    The same frame object is never encoded twice in a row, so
+    that several pictures of one inventory update are cheap.
+
+    Args:
+        quality: JPEG quality, from 1 (smallest) to 95 (best).
+        max_size: If given, maximum width and height in pixels.
+
+    Raises:
+        ValueError: If `quality` or `max_size` are out of range.
+
+    Attributes:
+        encodes: Number of frames actually encoded.
+
+    Example::
+
+        >>> encoder = JpegEncoder(quality=80, max_size=1280)
+        >>> data = encoder.encode(frame)
+        >>> encoder.encode(frame) is data
+        True
+    """
+
+    def __init__(self, quality: int = 85, max_size: Optional[int] = None) -> None:
+        if not 1 <= quality <= 95:
+            raise ValueError(f"Invalid JPEG quality: {quality}")
+        if max_size is not None and max_size < 1:
+            raise ValueError(f"Invalid maximum picture size: {max_size}")
+
+        self.quality = quality
+        self.max_size = max_size
+        self._lock = Lock()
+        # Last encoded frame with its JPEG contents.
+        self._last: Optional[Tuple[Any, bytes]] = None
+
+        self.encodes: int = 0
+
+    def encode(self, frame: Any) -> bytes:
+        """Compresses a frame as JPEG, unless it was the last one encoded.
+
+        Args:
+            frame: Either an RGB(A) array or a CUDA image from `jetson.utils`.
+
+        Returns:
+            JPEG file contents.
+        """
+        with self._lock:
+            if self._last is not None and self._last[0] is frame:
+                return self._last[1]
+
+            data = encode_jpeg(frame, self.quality, self.max_size)
+            self._last = (frame, data)
+            self.encodes += 1
+            return data
@@ -9,12 +9,16 @@ Author:
     Andrés Pérez
 """
 
-from inventory_telebot import InventoryTelebot
-from inventory_manager import InventoryManager
 from dotenv import dotenv_values
-from os.path import join, dirname, isfile
+from os.path import join, dirname, isfile, exists
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from importlib import import_module
 import logging
-from typing import Dict, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
 
 PATH2ENV: str = join(dirname(dirname(__file__)), "config", ".env")
 """Path to program settings file."""
@@ -23,6 +27,134 @@ PATH2LOG: str = join(dirname(dirname(__file__)), "log", "app.log")
 """Path to program log file."""
 
 
+def timed(timings: Dict[str, float], phase: str, func: Callable[..., T], *args) -> T:
+    """Calls a function and records how long it takes.
+
+    Args:
+        timings: Elapsed seconds by phase name, to be updated.
+        phase: Name of startup phase.
+        func: Function to be called with `args`.
+
+    Returns:
+        Whatever `func` returns.
+    """
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timings[phase] = time.perf_counter() - start
+
+
+def open_cameras(input_uris: List[str]) -> List[Any]:
+    """Opens video sources, loading Jetson libraries on demand."""
+    for input_uri in input_uris:
+        if not exists(input_uri):
+            raise FileNotFoundError("Cannot find resource file " + input_uri)
+
+    from jetson.utils import videoSource
+    with ThreadPoolExecutor(max_workers=len(input_uris)) as executor:
+        return list(executor.map(videoSource, input_uris))
+
+
+def detector_factory(backend: str,
+                     path2model: str,
+                     path2labels: str,
+                     threshold: float,
+                     threads: int,
+                     regions: List[Any],
+                     tile_size: Optional[int],
+                     tile_overlap: float) -> Callable[[], Any]:
+    """Gets a picklable function which creates an object detector."""
+    if not regions and tile_size is None:
+        from detectors import create_detector
+        return partial(create_detector, backend, path2model, path2labels,
+                       threshold, threads)
+    from tiled_detector import create_tiled_detector
+    return partial(create_tiled_detector, regions, tile_size, tile_overlap,
+                   backend, path2model, path2labels, threshold, threads)
+
+
+def load_detector(make_detector: Callable[[], Any]) -> Any:
+    """Creates an object detector, loading its backend on demand."""
+    return make_detector()
+
+
+def start_workers(input_uris: List[str],
+                  make_detector: Callable[[], Any],
+                  intervals: List[float],
+                  frame_max_age: float,
+                  max_resolution: List[int]) -> List[Any]:
+    """Captures and detects on each camera within its own process."""
+    for input_uri in input_uris:
+        if not exists(input_uri):
+            raise FileNotFoundError("Cannot find resource file " + input_uri)
+
+    from detection_worker import DetectionWorker, open_video_source
+    workers = [DetectionWorker(input_uri,
+                               partial(open_video_source, input_uri),
+                               make_detector,
+                               max_width=max_resolution[0],
+                               max_height=max_resolution[1],
+                               interval=interval,
+                               frame_max_age=frame_max_age)
+               for input_uri, interval in zip(input_uris, intervals)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def load_worker_detector(path2labels: str) -> Any:
+    """Creates a detector which hands out detections made by workers."""
+    from detection_worker import WorkerDetector
+    return WorkerDetector(path2labels)
+
+
+def start_metrics(port: Optional[int], log_interval: float) -> List[Any]:
+    """Exposes stage latencies on localhost and summarizes them in log."""
+    from metrics import METRICS, MetricsServer, MetricsReporter
+    services: List[Any] = []
+    if port is not None:
+        services.append(MetricsServer(METRICS, port))
+    if log_interval > 0:
+        services.append(MetricsReporter(METRICS, log_interval))
+    for service in services:
+        service.start()
+    return services
+
+
+def start_monitor(manager: Any,
+                  telebot: Any,
+                  min_interval: float,
+                  max_interval: float) -> Any:
+    """Watches inventory in background, alerting through the chatbot."""
+    from inventory_monitor import InventoryMonitor
+    monitor = InventoryMonitor(manager, telebot.notify, min_interval,
+                               max(min_interval, max_interval))
+    monitor.start()
+    return monitor
+
+
+def start_telebot(token: str,
+                  chat_id: int,
+                  snapshot_max_age: Optional[float],
+                  workers: int,
+                  max_queue: int,
+                  photo_cache_size: int,
+                  webhook_url: Optional[str],
+                  webhook_listen: str,
+                  webhook_port: int) -> Any:
+    """Connects a chatbot which answers while inventory manager loads."""
+    from inventory_telebot import InventoryTelebot
+    telebot = InventoryTelebot(token, chat_id, snapshot_max_age=snapshot_max_age,
+                               workers=workers, max_queue=max_queue,
+                               photo_cache_size=photo_cache_size,
+                               webhook_url=webhook_url,
+                               webhook_listen=webhook_listen,
+                               webhook_port=webhook_port)
+    telebot.start()
+    return telebot
+
+
 def main() -> None:
     """Performs main program functionality"""
     # Set up logging system, to notify several situations during execution.
@@ -39,16 +171,141 @@ def main() -> None:
         else:
             raise FileNotFoundError("Need a .env file under config folder.")
 
-        manager = InventoryManager(str(config["AI_MODEL"]),
-                                   str(config["CLASS_LABELS"]),
-                                   str(config["INPUT_URI"]),
-                                   float(config["SENSITIVITY"]))
+        # Optional settings fall back to defaults when missing.
+        price_timeout: Optional[str] = config.get("PRICE_TIMEOUT")
+        refresh_interval: Optional[str] = config.get("PRICE_REFRESH_INTERVAL")
+        change_area: Optional[str] = config.get("CHANGE_AREA_THRESHOLD")
+        snapshot_max_age: Optional[str] = config.get("SNAPSHOT_MAX_AGE")
+        picture_max_size: Optional[str] = config.get("PICTURE_MAX_SIZE")
+        source_timeout: Optional[str] = config.get("SOURCE_TIMEOUT")
+        metrics_port: Optional[str] = config.get("METRICS_PORT")
+        monitor_interval: Optional[str] = config.get("MONITOR_INTERVAL")
+        # Several cameras are given as comma separated values.
+        input_uris: List[str] = [uri.strip() for uri in
+                                 str(config["INPUT_URI"]).split(",")]
+        intervals: List[float] = [float(interval) for interval in
+                                  str(config.get("CAPTURE_INTERVAL") or 0.0).split(",")]
+        # Per-class confidences are given as comma separated name:value pairs.
+        class_thresholds: Dict[str, float] = {
+            name.strip(): float(value) for name, value in
+            (pair.split(":") for pair in str(config.get("CLASS_THRESHOLDS") or "").split(",")
+             if pair.strip())}
+        sensitivity = float(config["SENSITIVITY"])
+        # Detectors must keep objects of every class, they are filtered later on.
+        detector_threshold = min([sensitivity, *class_thresholds.values()])
+        # Shelves are given as semicolon separated name:left,top,right,bottom regions.
+        regions: List[Any] = []
+        if config.get("REGIONS"):
+            from tiled_detector import parse_regions
+            regions = parse_regions(str(config["REGIONS"]))
+        tile_size: Optional[str] = config.get("TILE_SIZE")
+        make_detector = detector_factory(str(config.get("DETECTOR") or "detectnet"),
+                                         str(config["AI_MODEL"]),
+                                         str(config["CLASS_LABELS"]),
+                                         detector_threshold,
+                                         int(config.get("DETECTOR_THREADS") or 1),
+                                         regions,
+                                         int(tile_size) if tile_size else None,
+                                         float(config.get("TILE_OVERLAP") or 0.25))
+        use_workers: bool = str(config.get("DETECTION_WORKER") or "0").lower() in ("1", "true")
+        workers: List[Any] = []
+
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        # Load network, camera and bot at the same time, heavy
+        # libraries get imported by the phase that needs them.
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            if use_workers:
+                # Network and cameras get loaded by worker processes.
+                detector = executor.submit(timed, timings, "detector",
+                                           load_worker_detector,
+                                           str(config["CLASS_LABELS"]))
+                cameras = executor.submit(timed, timings, "workers", start_workers,
+                                          input_uris,
+                                          make_detector,
+                                          intervals * len(input_uris)
+                                          if len(intervals) == 1 else intervals,
+                                          float(config.get("FRAME_MAX_AGE") or 1.0),
+                                          [int(size) for size in str(
+                                              config.get("WORKER_MAX_RESOLUTION")
+                                              or "1920x1080").lower().split("x")])
+            else:
+                detector = executor.submit(timed, timings, "detector", load_detector,
+                                           make_detector)
+                cameras = executor.submit(timed, timings, "camera", open_cameras,
+                                          input_uris)
+            telebot = executor.submit(timed, timings, "telebot", start_telebot,
+                                      str(config["BOT_TOKEN"]),
+                                      int(config["CHAT_ID"]),
+                                      float(snapshot_max_age) if snapshot_max_age else None,
+                                      int(config.get("BOT_WORKERS") or 4),
+                                      int(config.get("BOT_MAX_QUEUE") or 16),
+                                      int(config.get("PHOTO_CACHE_SIZE") or 128),
+                                      config.get("WEBHOOK_URL") or None,
+                                      str(config.get("WEBHOOK_LISTEN") or "127.0.0.1"),
+                                      int(config.get("WEBHOOK_PORT") or 8443)
+                                      ).result()
+
+            try:
+                if use_workers:
+                    workers = cameras.result()
+                manager_module = timed(timings, "imports", import_module,
+                                       "inventory_manager")
+                manager = timed(timings, "manager", partial(
+                    manager_module.InventoryManager,
+                    str(config["AI_MODEL"]),
+                    str(config["CLASS_LABELS"]),
+                    input_uris,
+                    sensitivity,
+                    price_workers=int(config.get("PRICE_WORKERS") or 1),
+                    price_timeout=float(price_timeout) if price_timeout else None,
+                    price_ttl=float(config.get("PRICE_TTL") or 21600.0),
+                    price_cache_size=int(config.get("PRICE_CACHE_SIZE") or 256),
+                    price_refresh_interval=float(refresh_interval) if refresh_interval else None,
+                    frame_buffer_size=int(config.get("FRAME_BUFFER_SIZE") or 0),
+                    frame_max_age=float(config.get("FRAME_MAX_AGE") or 1.0),
+                    capture_interval=intervals if len(intervals) > 1 else intervals[0],
+                    change_area_threshold=float(change_area) if change_area else None,
+                    change_block_threshold=float(config.get("CHANGE_BLOCK_THRESHOLD") or 0.08),
+                    jpeg_quality=int(config.get("JPEG_QUALITY") or 85),
+                    picture_max_size=int(picture_max_size) if picture_max_size else None,
+                    detector=detector.result(),
+                    camera=cameras.result(),
+                    source_timeout=float(source_timeout) if source_timeout else 10.0,
+                    history_max_size=int(config.get("HISTORY_MAX_SIZE") or 4194304),
+                    class_thresholds=class_thresholds,
+                    min_box_area=float(config.get("MIN_BOX_AREA") or 0.0),
+                    regions=regions,
+                ))
+            except Exception:
+                # Do not leave a bot running without anything to manage.
+                telebot.stop()
+                for worker in workers:
+                    worker.stop(timeout=5.0)
+                raise
+
+        # Bot stops warming up and starts handling inventory.
+        telebot.set_manager(manager)
+        timings["total"] = time.perf_counter() - start
+        logging.info("Startup timing: " + ", ".join(f"{phase} {seconds:.2f}s"
+                                                    for phase, seconds in timings.items()))
+
+        metrics = start_metrics(int(metrics_port) if metrics_port else None,
+                                float(config.get("METRICS_LOG_INTERVAL") or 3600.0))
+
+        monitor = start_monitor(manager, telebot, float(monitor_interval),
+                                float(config.get("MONITOR_MAX_INTERVAL") or 600.0)) \
+                  if monitor_interval else None
 
-        telebot = InventoryTelebot(str(config["BOT_TOKEN"]),
-                                   int(config["CHAT_ID"]),
-                                   manager)
-        # Start interactive chatbot.
-        telebot.run()
+        # Keep interactive chatbot running.
+        telebot.idle()
+        if monitor is not None:
+            monitor.stop()
+        manager.close()
+        for worker in workers:
+            worker.stop(timeout=5.0)
+        for service in metrics:
+            service.stop()
     except Exception as e:
         logging.critical(f"Exception caught by main: {e}", exc_info=True)
     
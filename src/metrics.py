@@ -0,0 +1,293 @@
+"""Latency and event metrics of every processing stage.
+
+This module measures how long each stage of a request takes, such
+as camera capture, detection, scraping or Telegram sends, and
+exposes such measurements to logs and Prometheus.
+
+Author:
+    Andrés Pérez
+"""
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from contextlib import contextmanager
+from bisect import bisect_left
+from threading import Thread, Event, Lock
+import logging
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                              0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+"""Upper bounds, in seconds, of latency histogram buckets."""
+
+
+class Histogram:
+    """Counts observed latencies within fixed buckets.
+
+    Args:
+        buckets: Sorted upper bounds of each bucket, in seconds.
+            Larger values fall into an implicit infinite bucket.
+
+    Attributes:
+        count: Number of observations.
+        total: Sum of observed values, in seconds.
+    """
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS) -> None:
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        # Non cumulative count per bucket, last one is infinite.
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+
+    def observe(self, value: float) -> None:
+        """Adds an observation.
+
+        Args:
+            value: Observed latency, in seconds.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile, as upper bound of the bucket holding it.
+
+        Args:
+            q: Quantile, from 0 to 1.
+
+        Returns:
+            Latency upper bound in seconds, infinite if it falls beyond
+            the last bucket, 0 if nothing was observed.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """Thread-safe registry of latency histograms and event counters.
+
+    Example::
+
+        >>> metrics = Metrics()
+        >>> with metrics.timer("capture"):
+        ...     frame = camera.Capture()
+        >>> metrics.increment("price_cache_hit")
+        >>> metrics.summary()
+        'capture: 1 calls, mean 31.2ms, p95 <= 50.0ms; price_cache_hit: 1'
+    """
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS) -> None:
+        self._buckets = tuple(buckets)
+        self._lock = Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Records how long a stage took.
+
+        Args:
+            stage: Stage name, such as ``"detect"``.
+            seconds: Elapsed time.
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self._buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Measures the enclosed block as a stage, even if it raises.
+
+        Args:
+            stage: Stage name, such as ``"detect"``.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def increment(self, event: str, amount: int = 1) -> None:
+        """Counts an event.
+
+        Args:
+            event: Event name, such as ``"photo_upload"``.
+            amount: Number of occurrences.
+        """
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + amount
+
+    def histogram(self, stage: str) -> Optional[Histogram]:
+        """Latency histogram of a stage, `None` if it was never observed."""
+        with self._lock:
+            return self._histograms.get(stage)
+
+    def counter(self, event: str) -> int:
+        """Number of occurrences of an event."""
+        with self._lock:
+            return self._counters.get(event, 0)
+
+    def reset(self) -> None:
+        """Forgets every observation."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def summary(self) -> str:
+        """One line description of every stage and event."""
+        with self._lock:
+            stages = [f"{stage}: {h.count} calls, mean {1000 * h.total / h.count:.1f}ms, "
+                      f"p95 <= {1000 * h.quantile(0.95):.1f}ms"
+                      for stage, h in sorted(self._histograms.items())]
+            events = [f"{event}: {count}"
+                      for event, count in sorted(self._counters.items())]
+        return "; ".join(stages + events) or "No metrics recorded"
+
+    def render(self) -> str:
+        """Every metric in Prometheus text exposition format."""
+        lines: List[str] = ["# HELP deeppantry_stage_seconds Latency of each processing stage.",
+                            "# TYPE deeppantry_stage_seconds histogram"]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets + (float("inf"),), h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'deeppantry_stage_seconds_bucket{{stage="{stage}",'
+                                 f'le="{le}"}} {cumulative}')
+                lines.append(f'deeppantry_stage_seconds_sum{{stage="{stage}"}} {h.total!r}')
+                lines.append(f'deeppantry_stage_seconds_count{{stage="{stage}"}} {h.count}')
+
+            lines.extend(["# HELP deeppantry_events_total Number of occurrences of each event.",
+                          "# TYPE deeppantry_events_total counter"])
+            for event, count in sorted(self._counters.items()):
+                lines.append(f'deeppantry_events_total{{event="{event}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+"""Registry shared by every module of the application."""
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # Same as http.server.ThreadingHTTPServer, which needs Python 3.7.
+    daemon_threads = True
+
+
+class MetricsServer:
+    """Serves metrics over HTTP for Prometheus to scrape them.
+
+    Note:
+        Server only listens on localhost by default, metrics are
+        not meant to be reachable from other machines.
+
+    Args:
+        metrics: Registry to be served.
+        port: TCP port to listen on, 0 picks a free one.
+        host: Address to listen on.
+
+    Attributes:
+        url: Address metrics can be fetched from.
+
+    Example::
+
+        >>> server = MetricsServer(METRICS, 9100)
+        >>> server.start()
+        >>> requests.get(server.url).text
+        '# HELP deeppantry_stage_seconds ...'
+        >>> server.stop()
+    """
+
+    def __init__(self, metrics: Metrics, port: int, host: str = "127.0.0.1") -> None:
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_) -> None:
+                # Scrapes must not flood application log.
+                pass
+
+        self._server = _ThreadingHTTPServer((host, port), MetricsHandler)
+        self._thread = Thread(target=self._server.serve_forever,
+                              name="metrics_server", daemon=True)
+        host, port = self._server.server_address[:2]
+        self.url: str = f"http://{host}:{port}/metrics"
+
+    @property
+    def running(self) -> bool:
+        """Whether background thread is alive."""
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts serving in background."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops serving and releases its port."""
+        if self._thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsReporter:
+    """Writes a metrics summary to log periodically.
+
+    Args:
+        metrics: Registry to be summarized.
+        interval: Seconds between two summaries.
+
+    Raises:
+        ValueError: If `interval` is not a positive number.
+    """
+
+    def __init__(self, metrics: Metrics, interval: float) -> None:
+        if interval <= 0:
+            raise ValueError(f"Invalid report interval: {interval}")
+
+        self._metrics = metrics
+        self._interval = interval
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, name="metrics_reporter",
+                              daemon=True)
+
+    @property
+    def running(self) -> bool:
+        """Whether background thread is alive."""
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts reporting in background."""
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops reporting, writing a last summary.
+
+        Args:
+            timeout: Seconds to wait for background thread to finish.
+        """
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            logging.info("Metrics: " + self._metrics.summary())
+        logging.info("Metrics: " + self._metrics.summary())
@@ -0,0 +1,148 @@
+"""Persistent cache of photos already uploaded to Telegram.
+
+This module remembers the Telegram `file_id` of each sent image,
+so that an unchanged pantry picture is never uploaded twice.
+
+Author:
+    Andrés Pérez
+"""
+
+from telegram import Bot, Message
+from telegram.error import BadRequest
+from collections import OrderedDict
+from threading import Lock
+from os import replace, remove
+from os.path import isfile, dirname
+from tempfile import NamedTemporaryFile
+from hashlib import sha256
+from metrics import METRICS
+import json
+import logging
+from typing import Dict, Optional
+
+
+class PhotoCache:
+    """Sends photos through Telegram, reusing previous uploads.
+
+    Photos are identified by a given key, such as a key of the scene
+    they show, or otherwise by a hash of their contents. Entries are
+    evicted in least recently used order once `max_size` is exceeded,
+    and they get stored on disk after each upload.
+
+    Note:
+        If Telegram rejects a cached `file_id`, photo is uploaded
+        again and its entry replaced.
+
+    Args:
+        path: Path to a json file to persist entries, `None` disables it.
+        max_size: Maximum number of cached photos.
+
+    Raises:
+        ValueError: If `max_size` is not a positive number.
+
+    Attributes:
+        hits: Number of photos sent by `file_id`.
+        uploads: Number of photos uploaded.
+
+    Example::
+
+        >>> photos = PhotoCache("../config/.photos.json")
+        >>> first = photos.send_photo(bot, 123456789, *manager.photo())
+        >>> again = photos.send_photo(bot, 123456789, *manager.photo(previous=True))
+        >>> photos.hits, photos.uploads
+        (1, 1)
+    """
+
+    def __init__(self, path: Optional[str] = None, max_size: int = 128) -> None:
+        if max_size < 1:
+            raise ValueError(f"Invalid cache size: {max_size}")
+
+        self._path = path
+        self._max_size = max_size
+        self._lock = Lock()
+        # Maps photo key to its Telegram file_id.
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+        self.hits: int = 0
+        self.uploads: int = 0
+
+        if self._path is not None and isfile(self._path):
+            self._load()
+
+    def send_photo(self,
+                   bot: Bot,
+                   chat_id: int,
+                   photo: bytes,
+                   key: Optional[str] = None) -> Message:
+        """Sends a photo to a chat, uploading it only if never sent before.
+
+        Args:
+            bot: Bot used to send the photo.
+            chat_id: Numeric id of destination chat.
+            photo: Image file contents.
+            key: Identifies what the photo shows, so that photos with the
+                same key are sent as the first one. By default, SHA-256
+                digest of `photo`, which only matches identical contents.
+
+        Returns:
+            Sent message.
+        """
+        if key is None:
+            key = sha256(photo).hexdigest()
+        with self._lock:
+            file_id = self._entries.get(key)
+            if file_id is not None:
+                self._entries.move_to_end(key)
+
+        if file_id is not None:
+            try:
+                with METRICS.timer("telegram_photo"):
+                    message = bot.send_photo(chat_id=chat_id, photo=file_id)
+                METRICS.increment("photo_cache_hit")
+                with self._lock:
+                    self.hits += 1
+                return message
+            except BadRequest:
+                logging.warning("Telegram rejected a cached photo, uploading it again")
+
+        with METRICS.timer("telegram_upload"):
+            message = bot.send_photo(chat_id=chat_id, photo=photo)
+        METRICS.increment("photo_upload")
+        with self._lock:
+            self.uploads += 1
+            # Largest size is the original photo, any of them can be resent.
+            self._entries[key] = message.photo[-1].file_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+            self._save()
+        return message
+
+    def _load(self) -> None:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data: Dict[str, str] = json.load(f)
+            for key, file_id in data.items():
+                self._entries[key] = str(file_id)
+        except (ValueError, TypeError, AttributeError):
+            # A corrupted cache just means photos get uploaded again.
+            logging.warning("Ignoring invalid photo cache " + self._path)
+            self._entries.clear()
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def _save(self) -> None:
+        if self._path is None:
+            return
+
+        # Write a whole new file and swap it in, so it never gets truncated.
+        with NamedTemporaryFile("w", encoding="utf-8", delete=False,
+                                dir=dirname(self._path),
+                                prefix=".photos_", suffix=".tmp") as f:
+            json.dump(self._entries, f)
+        try:
+            replace(f.name, self._path)
+        except OSError:
+            remove(f.name)
+            raise
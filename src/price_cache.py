@@ -0,0 +1,350 @@
+"""Persistent cache for product price information.
+
+This module keeps recently scraped prices around, so that
+most inventory requests do not need any network access.
+
+Author:
+    Andrés Pérez
+"""
+
+from price_scraper import scrape_prices
+from metrics import METRICS
+from collections import OrderedDict
+from threading import Thread, Lock, Event
+from os import replace, remove
+from os.path import isfile, dirname
+from tempfile import NamedTemporaryFile
+import json
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+PriceInfo = Tuple[str, str, float, str]
+"""Product name, purchase link, price and currency."""
+
+
+class PriceCache:
+    """Serves product prices while they are fresh enough.
+
+    Entries are evicted in least recently used order once
+    `max_size` is exceeded, and they get stored on disk after
+    each update so that a restarted program starts warm.
+
+    An entry older than `ttl` is stale: it is still served right
+    away, while a background thread fetches a fresh price for it.
+    After `ttl + max_stale` seconds, it gets fetched synchronously.
+
+    Note:
+        Failed lookups are never cached, but a stale entry
+        survives a failed refresh.
+
+    Args:
+        path: Path to a json file to persist entries, `None` disables it.
+        ttl: Seconds a price is considered up to date.
+        max_stale: Extra seconds a stale price can be served for.
+        max_size: Maximum number of cached products.
+        scraper: Function used to fetch prices of missing products.
+
+    Raises:
+        ValueError: If `max_size` is not a positive number.
+
+    Attributes:
+        hits: Number of fresh prices served from cache.
+        stale_hits: Number of stale prices served from cache.
+        misses: Number of prices that were not available in cache.
+        version: Increased whenever any cached price gets fetched.
+
+    Example::
+
+        >>> cache = PriceCache("../config/.prices.json", ttl=3600.0)
+        >>> cache.get_prices(["honey"])
+        [('honey', 'https://www.trolley.co.uk/product/morrisons-savers-honey/IBN007', 0.69, '£')]
+        >>> cache.hits, cache.misses
+        (0, 1)
+    """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 ttl: float = 21600.0,
+                 max_stale: float = 86400.0,
+                 max_size: int = 256,
+                 scraper: Callable[[List[str]], List[PriceInfo]] = scrape_prices) -> None:
+        if max_size < 1:
+            raise ValueError(f"Invalid cache size: {max_size}")
+
+        self._path = path
+        self._ttl = ttl
+        self._max_stale = max_stale
+        self._max_size = max_size
+        self._scraper = scraper
+        self._lock = Lock()
+        # Serializes writes, so that an older copy never replaces a newer one.
+        self._save_lock = Lock()
+        # Maps product name to its price information and fetch time.
+        self._entries: "OrderedDict[str, Tuple[PriceInfo, float]]" = OrderedDict()
+        self._revalidating: Set[str] = set()
+
+        self.hits: int = 0
+        self.stale_hits: int = 0
+        self.misses: int = 0
+        self.version: int = 0
+
+        if self._path is not None and isfile(self._path):
+            self._load()
+
+    def get_prices(self, product_names: List[str]) -> List[PriceInfo]:
+        """Retrieves price information for given products.
+
+        Args:
+            product_names: Common names for products.
+
+        Returns:
+            Product name, purchase link, price and currency, in input order.
+        """
+        now = time.time()
+        found: Dict[str, PriceInfo] = {}
+        missing: List[str] = []
+        stale: List[str] = []
+        with self._lock:
+            for name in product_names:
+                entry = self._entries.get(name)
+                age = now - entry[1] if entry else None
+                if entry is None or age > self._ttl + self._max_stale:
+                    missing.append(name)
+                    self._count_miss()
+                    continue
+
+                self._entries.move_to_end(name)
+                found[name] = entry[0]
+                if age > self._ttl:
+                    self._count_stale_hit()
+                    if name not in self._revalidating:
+                        stale.append(name)
+                else:
+                    self._count_hit()
+            self._revalidating.update(stale)
+
+        if missing:
+            found.update(self._fetch(missing))
+
+        if stale:
+            # Serve stale prices now, but have them fetched again.
+            Thread(target=self._revalidate, args=(stale,),
+                   name="price_cache", daemon=True).start()
+
+        return [found[name] for name in product_names]
+
+    def peek(self, product_names: List[str]) -> List[PriceInfo]:
+        """Retrieves cached price information, without any network access.
+
+        Args:
+            product_names: Common names for products.
+
+        Returns:
+            Product name, purchase link, price and currency, in input order.
+
+            Default values are returned for products that are not cached.
+        """
+        now = time.time()
+        result: List[PriceInfo] = []
+        with self._lock:
+            for name in product_names:
+                entry = self._entries.get(name)
+                if entry is None:
+                    self._count_miss()
+                    result.append((name, "", 0.0, ""))
+                    continue
+
+                self._entries.move_to_end(name)
+                if now - entry[1] > self._ttl:
+                    self._count_stale_hit()
+                else:
+                    self._count_hit()
+                result.append(entry[0])
+        return result
+
+    def refresh(self, product_names: List[str]) -> List[PriceInfo]:
+        """Fetches given products, no matter how fresh their prices are.
+
+        Args:
+            product_names: Common names for products.
+
+        Returns:
+            Product name, purchase link, price and currency, in input order.
+        """
+        found = self._fetch(product_names)
+        return [found[name] for name in product_names]
+
+    def age(self, product_name: str) -> Optional[float]:
+        """Seconds elapsed since a product's price was fetched.
+
+        Args:
+            product_name: Common name for a product.
+
+        Returns:
+            Price age, or `None` if such product is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(product_name)
+        return time.time() - entry[1] if entry else None
+
+    def fetched(self, product_name: str) -> Optional[float]:
+        """Time a product's price was fetched at, as given by `time.time`.
+
+        Args:
+            product_name: Common name for a product.
+
+        Returns:
+            Fetch time, or `None` if such product is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(product_name)
+        return entry[1] if entry else None
+
+    def _count_hit(self) -> None:
+        self.hits += 1
+        METRICS.increment("price_cache_hit")
+
+    def _count_stale_hit(self) -> None:
+        self.stale_hits += 1
+        METRICS.increment("price_cache_stale_hit")
+
+    def _count_miss(self) -> None:
+        self.misses += 1
+        METRICS.increment("price_cache_miss")
+
+    def _fetch(self, product_names: List[str]) -> Dict[str, PriceInfo]:
+        result: Dict[str, PriceInfo] = {}
+        now = time.time()
+        # Readers must not wait for the network, only for entries to merge.
+        scraped = self._scraper(product_names)
+        with self._lock:
+            for info in scraped:
+                name = info[0]
+                # Empty links mean that such lookup failed.
+                if info[1]:
+                    self._entries[name] = (info, now)
+                    self._entries.move_to_end(name)
+                    self.version += 1
+                elif name in self._entries:
+                    info = self._entries[name][0]
+                result[name] = info
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        self._save()
+        return result
+
+    def _revalidate(self, product_names: List[str]) -> None:
+        try:
+            self._fetch(product_names)
+        except Exception:
+            logging.warning("Price revalidation failed", exc_info=True)
+        finally:
+            with self._lock:
+                self._revalidating.difference_update(product_names)
+
+    def _load(self) -> None:
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data: Dict[str, list] = json.load(f)
+            for name, (link, price, currency, fetched) in data.items():
+                self._entries[name] = ((name, link, float(price), currency),
+                                       float(fetched))
+        except (ValueError, TypeError):
+            # A corrupted cache just means a cold start.
+            logging.warning("Ignoring invalid price cache " + self._path)
+            self._entries.clear()
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def _save(self) -> None:
+        if self._path is None:
+            return
+
+        with self._save_lock:
+            # Readers only wait for entries to be copied, not for the disk.
+            with self._lock:
+                data = {name: [link, price, currency, fetched]
+                        for (name, link, price, currency), fetched
+                        in self._entries.values()}
+            try:
+                # Write a whole new file and swap it in, so it never gets truncated.
+                with NamedTemporaryFile("w", encoding="utf-8", delete=False,
+                                        dir=dirname(self._path),
+                                        prefix=".prices_", suffix=".tmp") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                try:
+                    replace(f.name, self._path)
+                except OSError:
+                    remove(f.name)
+                    raise
+            except OSError:
+                # Prices are still served from memory, only a warm restart is lost.
+                logging.warning("Cannot save price cache " + self._path, exc_info=True)
+
+
+class PriceRefresher:
+    """Keeps cached prices current from a background thread.
+
+    Every product is fetched once on start and then once per
+    `interval`, so that readers can just peek at the cache.
+
+    Args:
+        cache: Cache to be refreshed.
+        product_names: Common names for products.
+        interval: Seconds between two refreshes.
+
+    Raises:
+        ValueError: If `interval` is not a positive number.
+
+    Example::
+
+        >>> refresher = PriceRefresher(cache, ["honey"], 3600.0)
+        >>> refresher.start()
+        >>> cache.peek(["honey"])
+        [('honey', 'https://www.trolley.co.uk/product/morrisons-savers-honey/IBN007', 0.69, '£')]
+        >>> refresher.stop()
+    """
+
+    def __init__(self,
+                 cache: PriceCache,
+                 product_names: List[str],
+                 interval: float) -> None:
+        if interval <= 0:
+            raise ValueError(f"Invalid refresh interval: {interval}")
+
+        self._cache = cache
+        self._product_names = list(product_names)
+        self._interval = interval
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, name="price_refresher",
+                              daemon=True)
+
+    @property
+    def running(self) -> bool:
+        """Whether background thread is alive."""
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        """Starts refreshing prices in background."""
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops refreshing prices.
+
+        Args:
+            timeout: Seconds to wait for an ongoing refresh to finish.
+        """
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self._cache.refresh(self._product_names)
+            except Exception:
+                logging.warning("Price refresh failed", exc_info=True)
+            self._stop_event.wait(self._interval)
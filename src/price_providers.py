@@ -0,0 +1,351 @@
+"""Interchangeable sources of product prices.
+
+This module queries several shops at once for each product, keeping
+the cheapest offer, and stops asking shops that keep failing.
+
+Author:
+    Andrés Pérez
+"""
+
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock
+from price_scraper import search_cheapest
+from price_cache import PriceInfo
+from http_client import HttpClient, Timeout
+from metrics import METRICS
+import requests
+import logging
+import time
+from typing import List, Optional, Sequence, Tuple
+
+
+class ProviderError(Exception):
+    """Price provider could not be queried."""
+
+
+class RateLimiter:
+    """Spaces out requests with a token bucket.
+
+    Args:
+        rate: Requests allowed per second, on average.
+        burst: Requests that can be made at once after a quiet period.
+
+    Raises:
+        ValueError: If `rate` is not a positive number or `burst` is below 1.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Invalid rate limit: {rate}/s, burst {burst}")
+
+        self._rate = rate
+        self._burst = burst
+        self._lock = Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def acquire(self) -> None:
+        """Blocks until another request is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst,
+                               self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            # Take a token in advance, later callers wait for the next ones.
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while.
+
+    After `failure_threshold` consecutive failures, the circuit opens
+    and no call is allowed for `reset_timeout` seconds. Then a single
+    trial call is allowed: its success closes the circuit again, while
+    its failure keeps it open for another `reset_timeout`.
+
+    Args:
+        failure_threshold: Consecutive failures that open the circuit.
+        reset_timeout: Seconds to wait before a trial call.
+
+    Raises:
+        ValueError: If `failure_threshold` is below 1.
+
+    Example::
+
+        >>> breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60.0)
+        >>> if breaker.allow():
+        ...     try:
+        ...         call_service()
+        ...         breaker.record_success()
+        ...     except ConnectionError:
+        ...         breaker.record_failure()
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0) -> None:
+        if failure_threshold < 1:
+            raise ValueError(f"Invalid failure threshold: {failure_threshold}")
+
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = Lock()
+        self._failures = 0
+        # Time circuit opened at, `None` while it is closed.
+        self._opened: Optional[float] = None
+        self._trial = False
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are being rejected."""
+        with self._lock:
+            return self._opened is not None
+
+    def allow(self) -> bool:
+        """Tells whether a call can be made now."""
+        with self._lock:
+            if self._opened is None:
+                return True
+            if self._trial or time.monotonic() - self._opened < self._reset_timeout:
+                return False
+            # Only one trial call at a time.
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        """Reports a successful call, closing the circuit."""
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        """Reports a failed call."""
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self._failure_threshold:
+                self._opened = time.monotonic()
+            self._trial = False
+
+
+class PriceProvider(ABC):
+    """Looks up product prices on a certain shop.
+
+    Each provider has its own rate limit and circuit breaker, which
+    are used by `PriceAggregator`.
+
+    Args:
+        name: Provider identifier, such as shop name.
+        rate_limit: If given, maximum requests per second.
+        failure_threshold: Consecutive failures before provider is skipped.
+        reset_timeout: Seconds provider is skipped for, before trying again.
+
+    Attributes:
+        name: Provider identifier.
+        limiter: Spaces out requests, `None` if unlimited.
+        breaker: Decides whether provider is healthy enough to be queried.
+    """
+
+    def __init__(self,
+                 name: str,
+                 rate_limit: Optional[float] = None,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 60.0) -> None:
+        self.name = name
+        self.limiter: Optional[RateLimiter] = None if rate_limit is None \
+                                              else RateLimiter(rate_limit)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    @abstractmethod
+    def search(self, product_name: str) -> Optional[PriceInfo]:
+        """Looks for the cheapest offer of a product.
+
+        Args:
+            product_name: Common name for a product.
+
+        Returns:
+            Product name, purchase link, price and currency, or `None`
+            if provider does not sell such product.
+
+        Raises:
+            ProviderError: If provider could not be queried.
+        """
+
+
+class TrolleyProvider(PriceProvider):
+    """Scrapes prices from Trolley search pages.
+
+    Args:
+        name: Provider identifier.
+        source_url: Base website url, `price_scraper.SOURCE_URL` by default.
+        parser: HTML parser used by the scraper.
+        timeout: Seconds to wait for each request, `None` uses `client`
+            default timeouts.
+        client: HTTP session to use, `price_scraper.HTTP_CLIENT` by default.
+        rate_limit: If given, maximum requests per second.
+        failure_threshold: Consecutive failures before provider is skipped.
+        reset_timeout: Seconds provider is skipped for, before trying again.
+    """
+
+    def __init__(self,
+                 name: str = "trolley",
+                 source_url: Optional[str] = None,
+                 parser: str = "lxml",
+                 timeout: Optional[Timeout] = None,
+                 client: Optional[HttpClient] = None,
+                 rate_limit: Optional[float] = None,
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 60.0) -> None:
+        super().__init__(name, rate_limit, failure_threshold, reset_timeout)
+        self._source_url = source_url
+        self._parser = parser
+        self._timeout = timeout
+        self._client = client
+
+    def search(self, product_name: str) -> Optional[PriceInfo]:
+        try:
+            return search_cheapest(product_name, self._parser, self._timeout,
+                                   self._client, self._source_url)
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            raise ProviderError(f"{self.name}: {e}") from e
+
+
+class PriceAggregator:
+    """Queries every provider at once, keeping the cheapest offer.
+
+    Providers whose circuit is open are skipped right away, instead
+    of having each product wait for them to fail. Rate limited
+    providers wait for their turn on a thread of their own, so that
+    they never hold workers needed by other providers.
+
+    Note:
+        Prices are compared as given, so every provider should
+        quote them in the same currency.
+
+    Args:
+        providers: Price providers, in order of preference for ties.
+        max_workers: Maximum number of requests in flight at the same time.
+
+    Raises:
+        ValueError: If there are no providers or `max_workers` is
+            not a positive number.
+
+    Example::
+
+        >>> aggregator = PriceAggregator([TrolleyProvider(rate_limit=5.0)], max_workers=4)
+        >>> cache = PriceCache(scraper=aggregator.scrape_prices)
+        >>> aggregator.scrape_prices(["honey"])
+        [('honey', 'https://www.trolley.co.uk/product/morrisons-savers-honey/IBN007', 0.69, '£')]
+    """
+
+    def __init__(self, providers: Sequence[PriceProvider], max_workers: int = 1) -> None:
+        if not providers:
+            raise ValueError("Need at least one price provider")
+
+        if max_workers < 1:
+            raise ValueError(f"Invalid number of workers: {max_workers}")
+
+        self.providers: Tuple[PriceProvider, ...] = tuple(providers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="price_provider")
+        # Requests of each rate limited provider are released in turn.
+        self._dispatchers: List[Optional[ThreadPoolExecutor]] = [
+            None if provider.limiter is None else
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="price_limiter")
+            for provider in self.providers]
+
+    def scrape_prices(self, product_names: List[str]) -> List[PriceInfo]:
+        """Retrieves price information for given products.
+
+        Args:
+            product_names: Common names for products.
+
+        Returns:
+            Product name, purchase link, price and currency, in input order.
+
+            Default values are returned for products no provider found.
+        """
+        # Every product is asked to every provider at once.
+        futures: List[List[Future]] = [
+            [self._submit(provider, dispatcher, name)
+             for provider, dispatcher in zip(self.providers, self._dispatchers)]
+            for name in product_names]
+
+        result: List[PriceInfo] = []
+        for name, searches in zip(product_names, futures):
+            offers = [offer for offer in (future.result() for future in searches)
+                      if offer is not None and offer[1]]
+            result.append(min(offers, key=lambda offer: offer[2],
+                              default=(name, "", 0.0, "")))
+        return result
+
+    def close(self) -> None:
+        """Stops background threads, once ongoing requests finish."""
+        for dispatcher in self._dispatchers:
+            if dispatcher is not None:
+                dispatcher.shutdown(wait=False)
+        self._executor.shutdown(wait=False)
+
+    def _submit(self,
+                provider: PriceProvider,
+                dispatcher: Optional[ThreadPoolExecutor],
+                name: str) -> Future:
+        # Search on shared workers, once rate limit allows it.
+        if dispatcher is None:
+            return self._executor.submit(self._search, provider, name)
+
+        result: Future = Future()
+
+        def dispatch() -> None:
+            try:
+                provider.limiter.acquire()
+                search = self._executor.submit(self._search, provider, name)
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            search.add_done_callback(lambda done: _copy_result(done, result))
+
+        dispatcher.submit(dispatch)
+        return result
+
+    @staticmethod
+    def _search(provider: PriceProvider, name: str) -> Optional[PriceInfo]:
+        # Breaker is checked as late as possible, it may open meanwhile.
+        if not provider.breaker.allow():
+            METRICS.increment("provider_skipped")
+            return None
+
+        succeeded = False
+        error: BaseException = RuntimeError("Search interrupted")
+        try:
+            offer = provider.search(name)
+            succeeded = True
+        except ProviderError as e:
+            error = e
+            return None
+        except Exception as e:
+            # Unexpected errors count as failures too, but they need a trace.
+            logging.exception(f"Price provider {provider.name} failed unexpectedly")
+            error = e
+            return None
+        finally:
+            # Every outcome ends a trial call, so that it never stays pending.
+            if succeeded:
+                provider.breaker.record_success()
+            else:
+                METRICS.increment("provider_failed")
+                provider.breaker.record_failure()
+                if provider.breaker.is_open:
+                    logging.warning(f"Price provider {provider.name} is failing, "
+                                    f"skipping it for a while: {error}")
+        return offer
+
+
+def _copy_result(source: Future, target: Future) -> None:
+    # Settle a future with the outcome of another one.
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -7,22 +7,39 @@ Author:
     Andrés Pérez
 """
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
 import requests
-from typing import Tuple, List
+from concurrent.futures import ThreadPoolExecutor
+from http_client import HttpClient, Timeout
+from metrics import METRICS
+from typing import Tuple, List, Optional, Iterator
 
 
 SOURCE_URL: str = "https://www.trolley.co.uk"
 """Base website url to scrape data from."""
 
+HTTP_CLIENT: HttpClient = HttpClient()
+"""Session shared by every scrape, so that connections and pages are reused."""
+
+# Number of characters fed to the streaming parser at once.
+_CHUNK_SIZE: int = 8192
+
 
 def scrape_prices(product_names: List[str],
-                  parser: str = "lxml") -> List[Tuple[str, str, float, str]]:
+                  parser: str = "lxml",
+                  max_workers: int = 1,
+                  timeout: Optional[Timeout] = None,
+                  client: Optional[HttpClient] = None) -> List[Tuple[str, str, float, str]]:
     """Retrieves price information for given products.
 
     Args:
         product_names: Common names for products.
         parser: HTML parser used by the scraper.
+        max_workers: Maximum number of requests in flight at the same time.
+        timeout: Seconds to wait for each request, or to connect and to read
+            separately. `None` uses `client` default timeouts.
+        client: HTTP session to use, `HTTP_CLIENT` by default.
 
     Returns:
         Product name, purchase link, price and currency.
@@ -30,6 +47,11 @@ def scrape_prices(product_names: List[str],
         Default values will be returned if such gathering
         process fails, as shown in the example.
 
+        Results keep the same order as `product_names`.
+
+    Raises:
+        ValueError: If `max_workers` is not a positive number.
+
     Example::
 
         >>> scrape_prices(["soda"])
@@ -37,30 +59,156 @@ def scrape_prices(product_names: List[str],
         
         >>> scrape_prices(["?"])
         ('?', '', 0.0, '')
+
+        >>> scrape_prices(["soda", "honey"], max_workers=2, timeout=5.0)
+        [('soda', ...), ('honey', ...)]
     """
-    result: List[Tuple[str, str, float, str]] = []
-    with requests.Session() as s:
-        for name in product_names:
-            # Make a complete url to fetch data for current product.
-            url: str = f"{SOURCE_URL}/search/?q={name.lower()}"
+    if max_workers < 1:
+        raise ValueError(f"Invalid number of workers: {max_workers}")
+
+    client = client if client is not None else HTTP_CLIENT
+    if max_workers == 1:
+        return [_scrape_product(client, name, parser, timeout)
+                for name in product_names]
+
+    with ThreadPoolExecutor(max_workers=max_workers,
+                            thread_name_prefix="price_scraper") as executor:
+        # Mapping preserves input order, no matter which request ends first.
+        return list(executor.map(
+            lambda name: _scrape_product(client, name, parser, timeout),
+            product_names))
+
+
+def _scrape_product(client: HttpClient,
+                    name: str,
+                    parser: str,
+                    timeout: Optional[Timeout]) -> Tuple[str, str, float, str]:
+    try:
+        cheapest = search_cheapest(name, parser, timeout, client)
+    except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+        METRICS.increment("scrape_failed")
+        return (name, "", 0.0, "")
+    return cheapest if cheapest is not None else (name, "", 0.0, "")
+
+
+def search_cheapest(name: str,
+                    parser: str = "lxml",
+                    timeout: Optional[Timeout] = None,
+                    client: Optional[HttpClient] = None,
+                    source_url: Optional[str] = None) -> Optional[Tuple[str, str, float, str]]:
+    """Looks for the cheapest offer of a single product.
+
+    Args:
+        name: Common name for a product.
+        parser: HTML parser used by the scraper.
+        timeout: Seconds to wait for the request, or to connect and to
+            read separately. `None` uses `client` default timeouts.
+        client: HTTP session to use, `HTTP_CLIENT` by default.
+        source_url: Base website url, `SOURCE_URL` by default.
+
+    Returns:
+        Product name, purchase link, price and currency, or `None` if
+        no product was found.
+
+    Raises:
+        requests.ConnectionError: If website cannot be reached.
+        requests.Timeout: If website takes too long to answer.
+        requests.HTTPError: If website answers with an error status.
+    """
+    client = client if client is not None else HTTP_CLIENT
+    source_url = source_url if source_url is not None else SOURCE_URL
+    # Make a complete url to fetch data for current product.
+    url: str = f"{source_url}/search/?q={name.lower()}"
+    with METRICS.timer("scrape_http"):
+        html: str = client.get_text(url, timeout)
+
+    product_data: List[Tuple[str, str, float, str]] = []
+    # Extract data from all product entries.
+    with METRICS.timer("scrape_parse"):
+        for href, price_str in extract_listings(html, parser):
+            link: str = source_url + href
             try:
-                response: requests.Response = s.get(url)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.text, parser)
-            except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
-                result.append((name, "", 0.0, ""))
+                price = float(price_str[1:])
+            except ValueError:
+                # Skip entries whose price cannot be read, such as "Sold out".
                 continue
+            currency = price_str[0]
+            product_data.append((name, link, price, currency))
+    # Find product with lowest price.
+    return min(product_data, key=lambda data: data[2], default=None)
 
-            product_data: List[Tuple[str, str, float, str]] = []
-            # Find all product entries and extract data from their child tags.
-            for product in soup.find_all("div", class_="product-listing"):
-                link: str = SOURCE_URL + product.a["href"]
-                # Ignore extra price data from descendent tags.
-                price_str = str(product.a.find("div", class_="_price").contents[0])
-                price = float(price_str[1:])
-                currency = price_str[0]
-                product_data.append((name, link, price, currency))
-            # Find product with lowest price.
-            result.append(min(product_data, key=lambda data: data[2],
-                              default=(name, "", 0.0, "")))
-    return result
+
+def extract_listings(html: str, parser: str = "lxml") -> Iterator[Tuple[str, str]]:
+    """Extracts product entries from a search page.
+
+    Only product entries get materialised. With lxml, the page is
+    parsed incrementally and each entry is freed as soon as it has
+    been read, instead of building a whole document tree.
+
+    Args:
+        html: Search page content.
+        parser: HTML parser used by the scraper.
+
+    Returns:
+        Relative purchase link and price text, such as ``"£1.35"``,
+        for every product entry in page order. Entries without any
+        link or price are skipped.
+    """
+    if parser == "lxml":
+        return _stream_listings(html)
+    return _strain_listings(html, parser)
+
+
+def _strain_listings(html: str, parser: str) -> Iterator[Tuple[str, str]]:
+    # Skip building any node outside product entries.
+    strainer = SoupStrainer("div", class_="product-listing")
+    soup = BeautifulSoup(html, parser, parse_only=strainer)
+    for product in soup.find_all("div", class_="product-listing"):
+        anchor = product.a
+        href = anchor.get("href") if anchor is not None else None
+        price_div = anchor.find("div", class_="_price") if href else None
+        # Ignore extra price data from descendent tags.
+        price = str(price_div.contents[0]).strip() \
+            if price_div is not None and price_div.contents else ""
+        if price:
+            yield href, price
+
+
+def _stream_listings(html: str) -> Iterator[Tuple[str, str]]:
+    pull_parser = etree.HTMLPullParser(events=("end",))
+    closed = False
+    try:
+        for start in range(0, len(html), _CHUNK_SIZE):
+            pull_parser.feed(html[start:start + _CHUNK_SIZE])
+            yield from _read_listings(pull_parser)
+        # Entries might span several blocks, until the very end of the page.
+        closed = True
+        pull_parser.close()
+        yield from _read_listings(pull_parser)
+    finally:
+        if not closed:
+            # Callers may stop reading before the end of the page.
+            try:
+                pull_parser.close()
+            except etree.XMLSyntaxError:
+                pass
+
+
+def _read_listings(pull_parser: etree.HTMLPullParser) -> Iterator[Tuple[str, str]]:
+    # Product entries among elements parsed so far.
+    for _, element in pull_parser.read_events():
+        if element.tag != "div" or \
+           "product-listing" not in element.get("class", "").split():
+            continue
+
+        anchor = element.find(".//a")
+        href = None if anchor is None else anchor.get("href")
+        price_div = None if not href else \
+            next((div for div in anchor.iter("div")
+                  if "_price" in div.get("class", "").split()), None)
+        # Ignore extra price data from descendent tags.
+        price = (price_div.text or "").strip() if price_div is not None else ""
+        if price:
+            yield href, price
+        # Free entries as soon as they are processed.
+        element.clear()
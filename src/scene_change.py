@@ -0,0 +1,153 @@
+"""Cheap change detection between camera frames.
+
+This module compares tiny summaries of two images, so that
+expensive object detection can be skipped on unchanged scenes.
+
+Author:
+    Andrés Pérez
+"""
+
+import numpy as np
+from hashlib import sha256
+from typing import Optional, Tuple
+
+
+class SceneChangeDetector:
+    """Tells whether a scene differs from the last reference frame.
+
+    Each frame is reduced to a grid of mean brightness values. A block
+    changes if its brightness moves more than `block_threshold`, and a
+    scene changes if more than `area_threshold` of its blocks do so,
+    hence lighting noise is ignored but a single moved product is not.
+
+    Whenever a change is reported, the new frame becomes the reference.
+
+    Args:
+        block_threshold: Minimum brightness difference [0, 1] per block.
+        area_threshold: Minimum fraction [0, 1] of changed blocks.
+        grid: Number of blocks per row and column.
+        stride: Only one out of `stride` pixels per axis is sampled.
+
+    Attributes:
+        checks: Number of compared frames.
+        skips: Number of frames found unchanged.
+
+    Example::
+
+        >>> scene = SceneChangeDetector(block_threshold=0.08, area_threshold=0.002)
+        >>> scene.has_changed(image)
+        True
+        >>> scene.has_changed(image)
+        False
+        >>> scene.report()
+        'Inference skipped 1/2 times (50.0%), block threshold 0.08, area threshold 0.002'
+    """
+
+    def __init__(self,
+                 block_threshold: float = 0.08,
+                 area_threshold: float = 0.002,
+                 grid: Tuple[int, int] = (32, 32),
+                 stride: int = 4) -> None:
+        self.block_threshold = block_threshold
+        self.area_threshold = area_threshold
+        self._grid = grid
+        self._stride = stride
+        self._reference: Optional[np.ndarray] = None
+
+        self.checks: int = 0
+        self.skips: int = 0
+
+    def signature(self, image: np.ndarray) -> np.ndarray:
+        """Summarizes an image as a grid of mean brightness values.
+
+        Args:
+            image: Grayscale or color image, with values from 0 to 255.
+
+        Returns:
+            Normalized [0, 1] brightness per block, at most one per pixel.
+        """
+        image = np.asarray(image)
+        # Images smaller than the grid get a block per pixel.
+        rows, cols = min(self._grid[0], image.shape[0]), min(self._grid[1], image.shape[1])
+        # Small images must still provide a pixel per block.
+        stride = max(1, min(self._stride, image.shape[0] // rows,
+                            image.shape[1] // cols))
+        sample = image[::stride, ::stride]
+        if sample.ndim == 3:
+            # Ignore alpha channel, if any.
+            sample = sample[..., :3].mean(axis=2)
+        height = sample.shape[0] // rows * rows
+        width = sample.shape[1] // cols * cols
+        blocks = sample[:height, :width].reshape(rows, height // rows,
+                                                 cols, width // cols)
+        return blocks.mean(axis=(1, 3), dtype=np.float32) / 255.0
+
+    def difference(self, image: np.ndarray) -> float:
+        """Fraction of blocks that changed since the reference frame.
+
+        Args:
+            image: Grayscale or color image, with values from 0 to 255.
+
+        Returns:
+            Changed block fraction, 1 if there is no reference yet.
+        """
+        reference = self._reference
+        if reference is None:
+            return 1.0
+        return self._changed_fraction(self.signature(image), reference)
+
+    def has_changed(self, image: np.ndarray) -> bool:
+        """Compares an image with the reference frame.
+
+        Args:
+            image: Grayscale or color image, with values from 0 to 255.
+
+        Returns:
+            `True` if scene changed, then `image` becomes the new reference.
+        """
+        self.checks += 1
+        signature = self.signature(image)
+        if self._reference is not None and \
+           self._changed_fraction(signature, self._reference) <= self.area_threshold:
+            self.skips += 1
+            return False
+
+        self._reference = signature
+        return True
+
+    def reference_key(self, image: np.ndarray) -> Optional[str]:
+        """Identifies the reference frame, if an image looks the same.
+
+        Unlike a hash of image contents, such key is not affected by
+        sensor noise: it stays the same until the scene changes.
+
+        Args:
+            image: Grayscale or color image, with values from 0 to 255.
+
+        Returns:
+            SHA-256 digest of the reference frame summary, or `None` if
+            there is no reference or `image` differs from it.
+        """
+        reference = self._reference
+        if reference is None or \
+           self._changed_fraction(self.signature(image), reference) > self.area_threshold:
+            return None
+        return sha256(reference.tobytes()).hexdigest()
+
+    def _changed_fraction(self, signature: np.ndarray, reference: np.ndarray) -> float:
+        # Frames of another size cannot be the same scene.
+        if signature.shape != reference.shape:
+            return 1.0
+        changed = np.abs(signature - reference) > self.block_threshold
+        return float(changed.mean())
+
+    def reset(self) -> None:
+        """Forgets the reference frame, so next one is always a change."""
+        self._reference = None
+
+    def report(self) -> str:
+        """Summary of skipped frames and thresholds in use."""
+        ratio = 100 * self.skips / self.checks if self.checks else 0.0
+        return (f"Inference skipped {self.skips}/{self.checks} times ({ratio:.1f}%), "
+                f"block threshold {self.block_threshold}, "
+                f"area threshold {self.area_threshold}")
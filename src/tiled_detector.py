@@ -0,0 +1,249 @@
+"""Detection restricted to regions of interest, in overlapping tiles.
+
+This module looks for objects only where shelves are, and splits
+high resolution frames into tiles, so that small products are not
+lost when a whole frame is shrunk down to network input size.
+
+Author:
+    Andrés Pérez
+"""
+
+from dataclasses import dataclass
+import numpy as np
+from detectors import Detection, Detector, create_detector, crop_image, to_numpy
+from metrics import METRICS
+from typing import Any, List, Optional, Sequence, Tuple
+
+Box = Tuple[int, int, int, int]
+"""Corner coordinates (left, top, right, bottom), in pixels."""
+
+
+@dataclass
+class Region:
+    """Part of a frame, such as a shelf.
+
+    Coordinates are fractions [0, 1] of frame size, so that regions
+    hold for any camera resolution.
+
+    Attributes:
+        name: Region identifier.
+        left: Left edge, as a fraction of frame width.
+        top: Top edge, as a fraction of frame height.
+        right: Right edge, as a fraction of frame width.
+        bottom: Bottom edge, as a fraction of frame height.
+    """
+
+    name: str
+    left: float = 0.0
+    top: float = 0.0
+    right: float = 1.0
+    bottom: float = 1.0
+
+    def box(self, width: int, height: int) -> Box:
+        """Gets region coordinates within a frame.
+
+        Args:
+            width: Frame width, in pixels.
+            height: Frame height, in pixels.
+
+        Returns:
+            Region corners, in pixels.
+        """
+        return (int(round(self.left * width)), int(round(self.top * height)),
+                int(round(self.right * width)), int(round(self.bottom * height)))
+
+
+def parse_regions(text: str) -> List[Region]:
+    """Reads regions written as ``name:left,top,right,bottom``.
+
+    Args:
+        text: Semicolon separated regions, such as
+            ``"top:0,0,1,0.5;bottom:0,0.5,1,1"``.
+
+    Returns:
+        Regions, in given order.
+
+    Raises:
+        ValueError: If a region is malformed, empty or out of frame bounds.
+    """
+    regions: List[Region] = []
+    for item in filter(None, (item.strip() for item in text.split(";"))):
+        name, _, coords = item.partition(":")
+        values = [float(value) for value in coords.split(",")]
+        if len(values) != 4:
+            raise ValueError(f"Region needs four coordinates: {item}")
+        region = Region(name.strip(), *values)
+        if not region.name or \
+           not 0 <= region.left < region.right <= 1 or \
+           not 0 <= region.top < region.bottom <= 1:
+            raise ValueError(f"Invalid region: {item}")
+        regions.append(region)
+    return regions
+
+
+class TiledDetector(Detector):
+    """Runs a detector on regions of interest, split into tiles.
+
+    Each region, or the whole frame if there are none, is split into
+    square tiles of `tile_size` pixels, which overlap so that objects
+    on a tile border are whole within another tile. Tiles are run
+    through the detector in batches, then their boxes are merged:
+    boxes of the same class that overlap, or that lie within another
+    one as parts of an object cut by a tile border, become their union.
+
+    Args:
+        detector: Object detection backend, run on each tile.
+        regions: Parts of frames to look at, the whole frame by default.
+        tile_size: If given, width and height of tiles, in pixels.
+            Otherwise, each region is analyzed as a single tile.
+        overlap: Fraction [0, 1) of tile size shared by adjacent tiles.
+        iou_threshold: Minimum intersection over union of merged boxes.
+        containment: Minimum fraction of a box covered by another one
+            for them to be merged.
+        batch_size: Maximum number of tiles run at once.
+
+    Raises:
+        ValueError: If `tile_size`, `overlap` or `batch_size` are out of range.
+
+    Example::
+
+        >>> detector = TiledDetector(create_detector("onnx", model, labels),
+        ...                          [Region("top", 0, 0, 1, 0.5)], tile_size=640)
+        >>> detector.windows(1920, 1080)
+        [(0, 0, 640, 540), (427, 0, 1067, 540), (853, 0, 1493, 540), (1280, 0, 1920, 540)]
+    """
+
+    def __init__(self,
+                 detector: Detector,
+                 regions: Sequence[Region] = (),
+                 tile_size: Optional[int] = None,
+                 overlap: float = 0.25,
+                 iou_threshold: float = 0.5,
+                 containment: float = 0.8,
+                 batch_size: int = 8) -> None:
+        if tile_size is not None and tile_size < 1:
+            raise ValueError(f"Invalid tile size: {tile_size}")
+
+        if not 0 <= overlap < 1:
+            raise ValueError(f"Invalid tile overlap: {overlap}")
+
+        if batch_size < 1:
+            raise ValueError(f"Invalid tile batch size: {batch_size}")
+
+        self._detector = detector
+        self._regions = list(regions)
+        self._tile_size = tile_size
+        self._overlap = overlap
+        self._iou_threshold = iou_threshold
+        self._containment = containment
+        self._batch_size = batch_size
+        self.thread_safe = detector.thread_safe
+
+    def windows(self, width: int, height: int) -> List[Box]:
+        """Gets parts of a frame the detector runs on.
+
+        Args:
+            width: Frame width, in pixels.
+            height: Frame height, in pixels.
+
+        Returns:
+            Tile corners, in pixels.
+        """
+        areas = [region.box(width, height) for region in self._regions] or \
+                [(0, 0, width, height)]
+        if self._tile_size is None:
+            return [area for area in areas if area[0] < area[2] and area[1] < area[3]]
+
+        windows: List[Box] = []
+        for left, top, right, bottom in areas:
+            windows.extend((x, y, min(x + self._tile_size, right),
+                            min(y + self._tile_size, bottom))
+                           for y in self._starts(top, bottom)
+                           for x in self._starts(left, right))
+        return windows
+
+    def detect(self, image: Any) -> List[Detection]:
+        height, width = to_numpy(image).shape[:2]
+        windows = self.windows(width, height)
+        if windows == [(0, 0, width, height)]:
+            return self._detector.detect(image)
+
+        crops = [crop_image(image, window) for window in windows]
+        results: List[List[Detection]] = []
+        for start in range(0, len(crops), self._batch_size):
+            results.extend(self._detector.detect_batch(crops[start:start + self._batch_size]))
+        METRICS.increment("detect_tiles", len(crops))
+
+        # Tile boxes are moved back to frame coordinates.
+        rows = [(obj.class_id, obj.confidence, obj.left + left, obj.top + top,
+                 obj.right + left, obj.bottom + top)
+                for (left, top, _, _), detections in zip(windows, results)
+                for obj in detections]
+        if not rows:
+            return []
+        table = np.array(rows, dtype=np.float64)
+
+        # Boxes of different classes are shifted apart, so they never overlap.
+        shift = table[:, :1] * (max(width, height) + 1)
+        table[:, 2:] = self._merge(table[:, 2:] + shift, table[:, 1]) - shift
+        return [Detection(int(class_id), *values)
+                for class_id, *values in table[~np.isnan(table[:, 2])].tolist()]
+
+    def class_desc(self, class_id: int) -> str:
+        return self._detector.class_desc(class_id)
+
+    def _merge(self, boxes: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        # Best scored boxes grow into the union of those they overlap,
+        # until no other box overlaps them. Merged boxes become NaN.
+        merged = np.full_like(boxes, np.nan)
+        areas = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * \
+                np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+        order = np.argsort(-scores, kind="stable")
+        while order.size:
+            best, order = order[0], order[1:]
+            box = boxes[best].copy()
+            while order.size:
+                others = boxes[order]
+                width = np.minimum(box[2], others[:, 2]) - np.maximum(box[0], others[:, 0])
+                height = np.minimum(box[3], others[:, 3]) - np.maximum(box[1], others[:, 1])
+                inter = np.clip(width, 0, None) * np.clip(height, 0, None)
+                area = (box[2] - box[0]) * (box[3] - box[1])
+                overlapping = (inter / np.maximum(area + areas[order] - inter, 1e-9)
+                               > self._iou_threshold) | \
+                              (inter / np.maximum(np.minimum(area, areas[order]), 1e-9)
+                               > self._containment)
+                if not overlapping.any():
+                    break
+                box[:2] = np.minimum(box[:2], others[overlapping, :2].min(axis=0))
+                box[2:] = np.maximum(box[2:], others[overlapping, 2:].max(axis=0))
+                order = order[~overlapping]
+            merged[best] = box
+        return merged
+
+    def _starts(self, start: int, end: int) -> List[int]:
+        # Tile offsets along one axis: fewest evenly spread tiles that
+        # overlap enough, first and last ones aligned with area edges.
+        assert self._tile_size is not None
+        if end - start <= self._tile_size:
+            return [start] if start < end else []
+        stride = max(1.0, self._tile_size * (1 - self._overlap))
+        count = int(np.ceil((end - start - self._tile_size) / stride)) + 1
+        return np.linspace(start, end - self._tile_size, count).round().astype(int).tolist()
+
+
+def create_tiled_detector(regions: Sequence[Region],
+                          tile_size: Optional[int],
+                          overlap: float,
+                          *args: Any) -> Detector:
+    """Creates a detector by backend name, which runs on regions and tiles.
+
+    Args:
+        regions: Parts of frames to look at, the whole frame if empty.
+        tile_size: If given, width and height of tiles, in pixels.
+        overlap: Fraction [0, 1) of tile size shared by adjacent tiles.
+        *args: Arguments for `detectors.create_detector`.
+
+    Returns:
+        New detector instance.
+    """
+    return TiledDetector(create_detector(*args), regions, tile_size, overlap)
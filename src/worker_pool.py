@@ -0,0 +1,147 @@
+"""Bounded background execution of slow tasks.
+
+This module runs tasks on a fixed number of threads, limiting
+how many tasks of each kind run at once and how many wait.
+
+Author:
+    Andrés Pérez
+"""
+
+from collections import deque
+from threading import Condition, Thread
+import logging
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+
+
+_Task = Tuple[str, Callable[..., Any], Tuple[Any, ...]]
+
+
+class WorkerPool:
+    """Runs tasks on background threads, rejecting excess work.
+
+    Tasks are grouped by kind. A task waits in queue while its kind
+    already runs as many tasks as its limit allows, but other kinds
+    can still overtake it, so one slow kind cannot block the others.
+
+    Args:
+        workers: Number of background threads.
+        max_queue: Maximum number of waiting tasks.
+        limits: Maximum number of running tasks per kind. Kinds
+            without a limit may use every thread.
+
+    Raises:
+        ValueError: If `workers` or `max_queue` is not positive.
+
+    Example::
+
+        >>> pool = WorkerPool(workers=2, max_queue=8, limits={"picture": 1})
+        >>> pool.start()
+        >>> pool.submit("picture", print, "Say cheese!")
+        True
+        Say cheese!
+        >>> pool.stop()
+    """
+
+    def __init__(self,
+                 workers: int = 4,
+                 max_queue: int = 16,
+                 limits: Optional[Mapping[str, int]] = None) -> None:
+        if workers < 1:
+            raise ValueError(f"Invalid number of workers: {workers}")
+        if max_queue < 1:
+            raise ValueError(f"Invalid queue size: {max_queue}")
+
+        self._max_queue = max_queue
+        self._limits: Dict[str, int] = dict(limits or {})
+        self._queue: Deque[_Task] = deque()
+        self._running: Dict[str, int] = {}
+        self._stopping = False
+        self._condition = Condition()
+        self._threads: List[Thread] = [Thread(target=self._run,
+                                              name=f"worker_pool_{index}",
+                                              daemon=True)
+                                       for index in range(workers)]
+
+    @property
+    def running(self) -> bool:
+        """Whether any background thread is alive."""
+        return any(thread.is_alive() for thread in self._threads)
+
+    @property
+    def pending(self) -> int:
+        """Number of tasks waiting for a thread."""
+        with self._condition:
+            return len(self._queue)
+
+    def start(self) -> None:
+        """Starts background threads."""
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops background threads, discarding waiting tasks.
+
+        Args:
+            timeout: Seconds to wait for each running task to finish.
+        """
+        with self._condition:
+            self._stopping = True
+            self._queue.clear()
+            self._condition.notify_all()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout)
+
+    def submit(self, kind: str, func: Callable[..., Any], *args: Any) -> bool:
+        """Queues a task to be run in background.
+
+        Args:
+            kind: Task group, such as a command name.
+            func: Function to be run.
+            *args: Arguments for `func`.
+
+        Returns:
+            `False` if the task was rejected because queue is full
+            or pool is stopped.
+        """
+        with self._condition:
+            if self._stopping or len(self._queue) >= self._max_queue:
+                return False
+            self._queue.append((kind, func, args))
+            self._condition.notify()
+            return True
+
+    def _allowed(self, kind: str) -> bool:
+        # Caller must hold the condition lock.
+        limit = self._limits.get(kind)
+        return limit is None or self._running.get(kind, 0) < limit
+
+    def _next_task(self) -> Optional[_Task]:
+        # Oldest task whose kind is below its limit, if any.
+        for task in self._queue:
+            if self._allowed(task[0]):
+                self._queue.remove(task)
+                return task
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                task = self._next_task()
+                while task is None and not self._stopping:
+                    self._condition.wait()
+                    task = self._next_task()
+                if task is None:
+                    return
+                kind, func, args = task
+                self._running[kind] = self._running.get(kind, 0) + 1
+
+            try:
+                func(*args)
+            except Exception:
+                logging.exception("Background %s task failed", kind)
+            finally:
+                with self._condition:
+                    self._running[kind] -= 1
+                    # Waiting tasks of this kind may be allowed now.
+                    self._condition.notify_all()
@@ -0,0 +1,104 @@
+"""Unit Testing for constraint_store module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+from unittest.mock import patch
+import csv
+import sys
+from os.path import join, dirname, isfile
+from os import remove, listdir, utime, stat, chmod, umask
+from stat import S_IMODE
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from constraint_store import ConstraintStore
+
+
+class TestConstraintStore(unittest.TestCase):
+    """Tests constraint_store module functionality"""
+
+    path2constraints: str = join(dirname(__file__), ".store_constraints.csv")
+    classes = ("honey", "water")
+
+    def setUp(self) -> None:
+        self.addCleanup(self._remove_file)
+        self.store = ConstraintStore(self.path2constraints, self.classes)
+
+    def _remove_file(self) -> None:
+        if isfile(self.path2constraints):
+            remove(self.path2constraints)
+
+    def test_default_constraints(self) -> None:
+        # Check if a default constraints file was created.
+        self.assertTrue(isfile(self.path2constraints))
+        with open(self.path2constraints, "r", newline="") as csv_file:
+            self.assertListEqual([["Class", "Constraint"], ["honey", "0"], ["water", "0"]],
+                                 list(csv.reader(csv_file)))
+        self.assertDictEqual({"honey": 0, "water": 0}, self.store.constraints())
+
+    def test_update(self) -> None:
+        self.store.update({"honey": 2, "water": 3})
+        self.assertDictEqual({"honey": 2, "water": 3}, self.store.constraints())
+
+        # Check if other stores read the new file contents.
+        other = ConstraintStore(self.path2constraints)
+        self.assertDictEqual({"honey": 2, "water": 3}, other.constraints())
+
+        # No temporary file must be left behind.
+        self.assertFalse([name for name in listdir(dirname(self.path2constraints))
+                          if name.endswith(".tmp")])
+
+    def test_permissions(self) -> None:
+        # New files get usual permissions, instead of private temporary ones.
+        mask = umask(0)
+        umask(mask)
+        self.assertEqual(0o666 & ~mask, S_IMODE(stat(self.path2constraints).st_mode))
+
+        # Replaced files keep their permissions.
+        chmod(self.path2constraints, 0o640)
+        self.store.update({"honey": 2})
+        self.assertEqual(0o640, S_IMODE(stat(self.path2constraints).st_mode))
+
+    def test_changed_since(self) -> None:
+        version, constraints = self.store.changed_since(-1)
+        self.assertDictEqual({"honey": 0, "water": 0}, constraints)
+        # Nothing is returned while constraints stay the same.
+        self.assertEqual((version, None), self.store.changed_since(version))
+
+        self.store.update({"honey": 2})
+        version, constraints = self.store.changed_since(version)
+        self.assertDictEqual({"honey": 2, "water": 0}, constraints)
+
+    def test_reload_on_change(self) -> None:
+        self.store.constraints()
+        with patch("constraint_store.open", side_effect=open) as mocked_open:
+            # Unchanged files must not be read again.
+            self.store.constraints()
+            mocked_open.assert_not_called()
+
+            # Manual edits must be noticed.
+            with open(self.path2constraints, "w", newline="") as csv_file:
+                csv.writer(csv_file).writerows([["Class", "Constraint"],
+                                                ["honey", 5], ["water", 1]])
+            file_stat = stat(self.path2constraints)
+            utime(self.path2constraints, ns=(file_stat.st_atime_ns,
+                                             file_stat.st_mtime_ns + 1))
+            self.assertDictEqual({"honey": 5, "water": 1}, self.store.constraints())
+            mocked_open.assert_called_once()
+
+    def test_failed_write(self) -> None:
+        self.store.update({"honey": 1})
+        with patch("constraint_store.replace", side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.store.update({"honey": 4})
+        # Original file must remain untouched.
+        self.assertDictEqual({"honey": 1, "water": 0},
+                             ConstraintStore(self.path2constraints).constraints())
+
+
+if __name__ == "__main__":
+    unittest.main()
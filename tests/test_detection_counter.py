@@ -0,0 +1,83 @@
+"""Unit Testing for detection_counter module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import numpy as np
+import sys
+from os.path import join, dirname
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from detection_counter import DetectionCounter
+from detectors import Detection
+
+
+class TestDetectionCounter(unittest.TestCase):
+    """Tests detection_counter module functionality"""
+
+    def setUp(self) -> None:
+        self.labels = ["BACKGROUND", "Honey", "Water", "Rice"]
+
+    def test_count(self) -> None:
+        counter = DetectionCounter(self.labels)
+        self.assertTupleEqual(("honey", "water", "rice"), counter.classes)
+        self.assertDictEqual({}, counter.count([]))
+        # BACKGROUND and unknown class indices are never counted.
+        detections = [Detection(1), Detection(3), Detection(1),
+                      Detection(0), Detection(7), Detection(-1)]
+        self.assertDictEqual({"honey": 2, "rice": 1}, counter.count(detections))
+
+    def test_thresholds(self) -> None:
+        with self.assertRaises(ValueError):
+            DetectionCounter(self.labels, class_thresholds={"bread": 0.5})
+
+        counter = DetectionCounter(self.labels, threshold=0.5,
+                                   class_thresholds={"Water": 0.8, "rice": 0.3})
+        detections = [Detection(1, 0.4), Detection(1, 0.5),
+                      Detection(2, 0.7), Detection(2, 0.9),
+                      Detection(3, 0.3), Detection(3, 0.1)]
+        self.assertDictEqual({"honey": 1, "water": 1, "rice": 1},
+                             counter.count(detections))
+
+    def test_min_area(self) -> None:
+        counter = DetectionCounter(self.labels, min_area=100.0)
+        detections = [Detection(1, 1.0, 0, 0, 10, 10),
+                      Detection(1, 1.0, 0, 0, 5, 10),
+                      Detection(2, 1.0, 10, 10, 40, 40)]
+        self.assertDictEqual({"honey": 1, "water": 1}, counter.count(detections))
+
+        # Arrays are counted the same way as detection lists.
+        self.assertDictEqual({"honey": 1, "water": 1}, counter.count_arrays(
+            np.array([1, 1, 2]), np.ones(3), np.array([100.0, 50.0, 900.0])))
+
+    def test_count_regions(self) -> None:
+        counter = DetectionCounter(self.labels, threshold=0.5)
+        regions = {"top": (0, 0, 100, 50), "bottom": (0, 50, 100, 100)}
+        self.assertDictEqual({"top": {}, "bottom": {}}, counter.count_regions([], regions))
+
+        # Objects belong to the region their box center lies in.
+        detections = [Detection(1, 0.9, 10, 10, 20, 20),
+                      Detection(1, 0.9, 10, 40, 20, 70),
+                      Detection(2, 0.9, 30, 45, 40, 50),
+                      Detection(2, 0.4, 30, 10, 40, 20),
+                      Detection(3, 0.9, 110, 10, 120, 20)]
+        self.assertDictEqual({"top": {"honey": 1, "water": 1}, "bottom": {"honey": 1}},
+                             counter.count_regions(detections, regions))
+
+        # Arrays are counted the same way as detection lists.
+        self.assertDictEqual({"top": {"honey": 1, "water": 1}, "bottom": {"honey": 1}},
+                             counter.count_regions_arrays(
+                                 np.array([1, 1, 2, 2, 3]),
+                                 np.array([0.9, 0.9, 0.9, 0.4, 0.9]),
+                                 np.array([[10, 10, 20, 20], [10, 40, 20, 70],
+                                           [30, 45, 40, 50], [30, 10, 40, 20],
+                                           [110, 10, 120, 20]], dtype=np.float64),
+                                 regions))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+"""Unit Testing for detection_worker module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import gc
+import os
+import sys
+import time
+from functools import partial
+from os.path import join, dirname
+from tempfile import TemporaryDirectory
+import numpy as np
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from detection_worker import DetectionWorker, FrameRing, SharedFrame, WorkerDetector
+from detectors import Detection, FakeDetector
+
+LABELS = ["BACKGROUND", "honey", "water"]
+
+
+class CountingCamera:
+    """Captures frames filled with their sequence number.
+
+    Worker process exits on purpose after `crash_after` captures, if given.
+    """
+
+    def __init__(self, crash_after: int = 0, shape: tuple = (4, 6, 3)) -> None:
+        self._captured = 0
+        self._crash_after = crash_after
+        self._shape = shape
+
+    def Capture(self) -> np.ndarray:
+        self._captured += 1
+        if self._captured == self._crash_after:
+            os._exit(1)
+        time.sleep(0.01)
+        return np.full(self._shape, self._captured % 256, np.uint8)
+
+
+def make_detector() -> FakeDetector:
+    return FakeDetector(LABELS, [Detection(1, 0.9, 1, 2, 3, 4), Detection(2)])
+
+
+class TestFrameRing(unittest.TestCase):
+    """Tests FrameRing class functionality"""
+
+    def setUp(self) -> None:
+        self.ring = FrameRing(slots=3, max_width=6, max_height=4)
+
+    def test_publish(self) -> None:
+        with self.assertRaises(ValueError):
+            FrameRing(slots=2, max_width=6, max_height=4)
+
+        with self.assertRaises(TimeoutError):
+            self.ring.acquire(max_age=1.0, timeout=0.01)
+
+        image = np.arange(72, dtype=np.uint8).reshape(4, 6, 3)
+        self.assertTrue(self.ring.publish(image, [Detection(1, 0.5, 1, 2, 3, 4)]))
+        self.assertEqual(self.ring.published, 1)
+
+        frame = self.ring.acquire(max_age=1.0, timeout=0.01)
+        self.assertIsInstance(frame, SharedFrame)
+        np.testing.assert_array_equal(frame, image)
+        self.assertEqual(frame.detections, [Detection(1, 0.5, 1, 2, 3, 4)])
+        self.assertFalse(frame.flags.writeable)
+
+        # Smaller and grayscale frames fit as well.
+        self.ring.publish(image[:2, :3, 0], [])
+        frame = self.ring.acquire(max_age=1.0, timeout=0.01)
+        np.testing.assert_array_equal(frame, image[:2, :3, 0])
+        self.assertEqual(frame.detections, [])
+
+        with self.assertRaises(ValueError):
+            self.ring.publish(np.zeros((5, 6, 3), np.uint8), [])
+        with self.assertRaises(ValueError):
+            self.ring.publish(image.astype(np.float32), [])
+
+        # Frames published too long ago are not reused.
+        self.ring.publish(image, [], timestamp=time.monotonic() - 2.0)
+        with self.assertRaises(TimeoutError):
+            self.ring.acquire(max_age=1.0, timeout=0.01)
+
+    def test_fit(self) -> None:
+        image = np.zeros((4, 6, 3), np.uint8)
+        detections = [Detection(1, 0.5, 2, 2, 4, 4)]
+        fitted, kept = self.ring.fit(image, detections)
+        self.assertIs(image, fitted)
+        self.assertEqual(detections, kept)
+
+        # Larger frames are downscaled along with their boxes.
+        fitted, scaled = self.ring.fit(np.zeros((9, 12, 4), np.uint8), detections)
+        self.assertTupleEqual((3, 4, 3), fitted.shape)
+        self.assertEqual([Detection(1, 0.5, 2 / 3, 2 / 3, 4 / 3, 4 / 3)], scaled)
+        self.assertTrue(self.ring.publish(fitted, scaled))
+
+    def test_held_lock(self) -> None:
+        self.ring.publish(np.zeros((4, 6, 3), np.uint8), [])
+        # A writer terminated while holding the lock never releases it.
+        self.ring._lock.acquire()
+        self.addCleanup(self.ring._lock.release)
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            self.ring.acquire(max_age=1.0, timeout=0.1)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_pins(self) -> None:
+        self.ring.publish(np.zeros((4, 6, 3), np.uint8), [])
+        held = self.ring.acquire(max_age=1.0, timeout=0.01)
+        view = np.asarray(held)[1:].view(np.ndarray)
+        del held
+
+        # Slot of a referenced frame is never overwritten.
+        for value in range(1, 5):
+            self.assertTrue(self.ring.publish(np.full((4, 6, 3), value, np.uint8), []))
+        np.testing.assert_array_equal(view, 0)
+
+        latest = self.ring.acquire(max_age=1.0, timeout=0.01)
+        np.testing.assert_array_equal(latest, 4)
+        self.assertTrue(self.ring.publish(np.zeros((4, 6, 3), np.uint8), []))
+        # Every slot is either pinned or latest one.
+        self.assertFalse(self.ring.publish(np.zeros((4, 6, 3), np.uint8), []))
+
+        del view, latest
+        gc.collect()
+        self.ring.acquire(max_age=1.0, timeout=0.01)
+        gc.collect()
+        self.ring.acquire(max_age=1.0, timeout=0.01)
+        self.assertTrue(self.ring.publish(np.zeros((4, 6, 3), np.uint8), []))
+
+
+class TestDetectionWorker(unittest.TestCase):
+    """Tests DetectionWorker and WorkerDetector classes functionality"""
+
+    def test_capture(self) -> None:
+        worker = DetectionWorker("fake", CountingCamera, make_detector,
+                                 max_width=6, max_height=4, frame_max_age=0.5,
+                                 capture_timeout=30.0)
+        worker.start()
+        try:
+            self.assertTrue(worker.running)
+            # Nothing is captured until a frame is requested.
+            time.sleep(0.5)
+            first = worker.Capture()
+            self.assertEqual(1, first[0, 0, 0])
+            second = worker.Capture()
+            self.assertEqual(first.shape, (4, 6, 3))
+            # Frames are still recent, hence they are reused.
+            self.assertLessEqual(first[0, 0, 0], second[0, 0, 0])
+
+            with TemporaryDirectory() as workdir:
+                path2labels = join(workdir, "labels.txt")
+                with open(path2labels, "w") as labels_file:
+                    labels_file.write("\n".join(LABELS))
+                detector = WorkerDetector(path2labels)
+
+            self.assertEqual(detector.detect(second), make_detector().detections)
+            self.assertEqual(detector.class_desc(2), "water")
+            with self.assertRaises(ValueError):
+                detector.detect(np.zeros((4, 6, 3), np.uint8))
+        finally:
+            worker.stop(timeout=5.0)
+        self.assertFalse(worker.running)
+        self.assertFalse(worker.alive)
+
+    def test_oversized_frames(self) -> None:
+        worker = DetectionWorker("large", partial(CountingCamera, shape=(8, 12, 3)),
+                                 make_detector, max_width=6, max_height=4,
+                                 capture_timeout=30.0, restart_delay=0.1)
+        worker.start()
+        try:
+            frame = worker.Capture()
+            # Frames are downscaled, instead of crashing worker.
+            self.assertEqual((4, 6, 3), frame.shape)
+            self.assertEqual(Detection(1, 0.9, 0.5, 1, 1.5, 2), frame.detections[0])
+            self.assertEqual(0, worker.restarts)
+        finally:
+            worker.stop(timeout=5.0)
+
+    def test_restart(self) -> None:
+        worker = DetectionWorker("crashing", partial(CountingCamera, crash_after=5),
+                                 make_detector, max_width=6, max_height=4,
+                                 frame_max_age=0.0, capture_timeout=0.5,
+                                 restart_delay=0.1)
+        worker.start()
+        try:
+            # Worker only captures, hence crashes, when frames are requested.
+            deadline = time.monotonic() + 60.0
+            while worker.restarts < 2 and time.monotonic() < deadline:
+                try:
+                    worker.Capture()
+                except TimeoutError:
+                    pass
+            self.assertGreaterEqual(worker.restarts, 2)
+            # Frames keep coming after each restart.
+            frame = None
+            while frame is None and time.monotonic() < deadline:
+                try:
+                    frame = worker.Capture()
+                except TimeoutError:
+                    pass
+            self.assertIsNotNone(frame)
+            self.assertEqual(frame.shape, (4, 6, 3))
+        finally:
+            worker.stop(timeout=5.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
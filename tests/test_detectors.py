@@ -0,0 +1,137 @@
+"""Unit Testing for detectors module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import numpy as np
+import sys
+from os.path import join, dirname, isfile
+from os import remove
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from detectors import (Detection,
+                       FakeDetector,
+                       OnnxDetector,
+                       create_detector,
+                       detection_arrays,
+                       load_labels,
+                       non_max_suppression,
+                       to_detections)
+
+try:
+    import onnx
+    from onnx import helper, numpy_helper, TensorProto
+    import onnxruntime
+except ImportError:
+    onnx = None
+
+
+class TestDetectors(unittest.TestCase):
+    """Tests detectors module functionality"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.labels = ["BACKGROUND", "Honey", "Water"]
+        cls.path2labels: str = join(dirname(__file__), "detector_labels.txt")
+        with open(cls.path2labels, "w", newline="") as labels_file:
+            labels_file.write("\n".join(cls.labels))
+        cls.path2model: str = join(dirname(__file__), "detector_sample.onnx")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for path in (cls.path2labels, cls.path2model):
+            if isfile(path):
+                remove(path)
+
+    def test_fake_detector(self) -> None:
+        self.assertListEqual(self.labels, load_labels(self.path2labels))
+        detector = FakeDetector(self.labels, [Detection(1), Detection(2)])
+        self.assertListEqual([1, 2], [obj.class_id for obj in detector.detect(None)])
+        self.assertEqual("Water", detector.class_desc(2))
+
+        detector = create_detector("fake", "", self.path2labels)
+        self.assertListEqual([], detector.detect(None))
+        self.assertEqual("Honey", detector.class_desc(1))
+
+        with self.assertRaises(ValueError):
+            create_detector("unknown", "", self.path2labels)
+        with self.assertRaises(FileNotFoundError):
+            create_detector("onnx", self.path2model + ".missing", self.path2labels)
+
+    def test_detection_arrays(self) -> None:
+        detections = [Detection(1, 0.5, 1, 2, 3, 4), Detection(2)]
+        class_ids, confidences, boxes = detection_arrays(detections)
+        self.assertListEqual([1, 2], class_ids.tolist())
+        self.assertListEqual([[1, 2, 3, 4], [0, 0, 0, 0]], boxes.tolist())
+        self.assertListEqual(detections, to_detections((class_ids, confidences, boxes)))
+        self.assertTupleEqual((0, 4), detection_arrays([])[2].shape)
+
+        # Backends that return lists get them converted.
+        detector = FakeDetector(["BACKGROUND", "honey", "water"], detections)
+        self.assertListEqual([0.5, 1.0], detector.detect_arrays(None)[1].tolist())
+
+    def test_non_max_suppression(self) -> None:
+        boxes = np.array([[0, 0, 10, 10],
+                          [1, 1, 11, 11],
+                          [20, 20, 30, 30]], dtype=np.float32)
+        scores = np.array([0.6, 0.9, 0.7], dtype=np.float32)
+        # Overlapping boxes collapse into the best scored one.
+        self.assertListEqual([1, 2], non_max_suppression(boxes, scores, 0.5).tolist())
+        self.assertListEqual([1, 2, 0], non_max_suppression(boxes, scores, 0.9).tolist())
+
+    def test_onnx_detector(self) -> None:
+        if onnx is None:
+            self.skipTest("onnxruntime is not installed")
+
+        # Four prior boxes with constant scores, as an SSD export would give.
+        scores = np.array([[[0.1, 0.8, 0.1],
+                            [0.1, 0.7, 0.2],
+                            [0.9, 0.05, 0.05],
+                            [0.2, 0.1, 0.7]]], dtype=np.float32)
+        boxes = np.array([[[0.0, 0.0, 0.5, 0.5],
+                           [0.05, 0.05, 0.5, 0.5],
+                           [0.0, 0.0, 1.0, 1.0],
+                           [0.5, 0.5, 1.0, 1.0]]], dtype=np.float32)
+        graph = helper.make_graph(
+            [helper.make_node("Constant", [], ["scores"],
+                              value=numpy_helper.from_array(scores)),
+             helper.make_node("Constant", [], ["boxes"],
+                              value=numpy_helper.from_array(boxes))],
+            "ssd",
+            [helper.make_tensor_value_info("input_0", TensorProto.FLOAT, [1, 3, 8, 8])],
+            [helper.make_tensor_value_info("scores", TensorProto.FLOAT, [1, 4, 3]),
+             helper.make_tensor_value_info("boxes", TensorProto.FLOAT, [1, 4, 4])])
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 8
+        onnx.save(model, self.path2model)
+
+        detector = create_detector("onnx", self.path2model, self.path2labels,
+                                   threshold=0.5, threads=2)
+        self.assertIsInstance(detector, OnnxDetector)
+        image = np.zeros((100, 200, 3), dtype=np.uint8)
+        detections = detector.detect(image)
+        # Overlapping honey boxes are merged, background is ignored.
+        self.assertListEqual([1, 2], [obj.class_id for obj in detections])
+        self.assertAlmostEqual(0.8, detections[0].confidence, places=5)
+        self.assertListEqual([100.0, 50.0, 200.0, 100.0],
+                             [detections[1].left, detections[1].top,
+                              detections[1].right, detections[1].bottom])
+        self.assertAlmostEqual(5000.0, detections[1].area)
+        # Models with a fixed batch size take images one at a time.
+        self.assertListEqual([detections, detections],
+                             detector.detect_batch([image, image]))
+        self.assertEqual("Water", detector.class_desc(2))
+
+        # Model outputs are handed over as arrays, without building detections.
+        class_ids, confidences, boxes = detector.detect_arrays(image)
+        self.assertListEqual([1, 2], class_ids.tolist())
+        self.assertTupleEqual((2, 4), boxes.shape)
+        self.assertListEqual(detections, to_detections((class_ids, confidences, boxes)))
+
+
+if __name__ == "__main__":
+    unittest.main()
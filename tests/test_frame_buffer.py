@@ -0,0 +1,72 @@
+"""Unit Testing for frame_buffer module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+from unittest.mock import Mock
+from itertools import count
+import sys
+import time
+from os.path import join, dirname
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from frame_buffer import FrameBuffer
+
+
+class TestFrameBuffer(unittest.TestCase):
+    """Tests frame_buffer module functionality"""
+
+    def setUp(self) -> None:
+        # Each captured image is just a sequence number.
+        self.camera = Mock()
+        self.camera.Capture.side_effect = count()
+
+    def test_get(self) -> None:
+        with self.assertRaises(ValueError):
+            FrameBuffer(self.camera, size=0)
+
+        frames = FrameBuffer(self.camera, size=3, interval=0.01,
+                             copy=lambda image: -image)
+        # No frame can be delivered before starting.
+        with self.assertRaises(TimeoutError):
+            frames.get(max_age=1.0, timeout=0.05)
+
+        frames.start()
+        self.addCleanup(frames.stop)
+        timestamp, image = frames.get(max_age=1.0, timeout=5.0)
+        self.assertLessEqual(image, 0)
+        self.assertLessEqual(time.monotonic() - timestamp, 1.0)
+
+        # A newer frame must be awaited if latest one is too old.
+        _, newer = frames.get(max_age=0.0, timeout=5.0)
+        self.assertLess(newer, image)
+
+    def test_bounded_buffer(self) -> None:
+        frames = FrameBuffer(self.camera, size=2)
+        frames.start()
+        while self.camera.Capture.call_count < 5:
+            time.sleep(0.01)
+        frames.stop(timeout=5.0)
+        self.assertFalse(frames.running)
+
+        # Only latest frames must be kept, from oldest to newest.
+        buffered = frames.frames()
+        self.assertEqual(2, len(buffered))
+        self.assertLess(buffered[0][0], buffered[1][0])
+        self.assertEqual(buffered[0][1] + 1, buffered[1][1])
+
+    def test_failed_capture(self) -> None:
+        self.camera.Capture.side_effect = [None, RuntimeError, 7, 8, 9]
+        frames = FrameBuffer(self.camera, size=1, interval=0.01)
+        frames.start()
+        self.addCleanup(frames.stop)
+        # Capture errors must not stop background thread.
+        self.assertEqual(7, frames.get(max_age=5.0, timeout=5.0)[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
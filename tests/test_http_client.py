@@ -0,0 +1,116 @@
+"""Unit Testing for http_client module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+import requests
+import gzip
+import sys
+import time
+from os.path import join, dirname
+from typing import List
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from http_client import HttpClient
+
+
+class FakeSite(BaseHTTPRequestHandler):
+    """Serves a compressible page, revalidated through its ETag."""
+
+    protocol_version = "HTTP/1.1"
+    body: bytes = b"<html>" + b"honey " * 1000 + b"</html>"
+    etag: str = '"v1"'
+    # Accept-Encoding header of every request.
+    encodings: List[str] = []
+
+    def do_GET(self) -> None:
+        FakeSite.encodings.append(self.headers.get("Accept-Encoding", ""))
+        if self.path == "/slow":
+            time.sleep(1.0)
+        if self.path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == FakeSite.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        content = gzip.compress(FakeSite.body)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", FakeSite.etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    """Tests http_client module functionality"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSite)
+        cls.server.daemon_threads = True
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        host, port = cls.server.server_address[:2]
+        cls.url = f"http://{host}:{port}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        self.client = HttpClient(connect_timeout=1.0, read_timeout=0.2)
+        self.addCleanup(self.client.close)
+
+    def test_revalidation(self) -> None:
+        text = self.client.get_text(self.url + "/page")
+        self.assertEqual(FakeSite.body.decode(), text)
+        self.assertIn("gzip", FakeSite.encodings[-1])
+        # Compressed size is counted, not decoded one.
+        received = self.client.bytes_received
+        self.assertLess(0, received)
+        self.assertLess(received, len(FakeSite.body) // 10)
+
+        # Unchanged page is served from memory.
+        self.assertEqual(text, self.client.get_text(self.url + "/page"))
+        self.assertEqual(1, self.client.not_modified)
+        self.assertEqual(received, self.client.bytes_received)
+        self.assertEqual(2, self.client.requests)
+
+    def test_cache_size(self) -> None:
+        client = HttpClient(cache_bytes=len(FakeSite.body) + 1)
+        self.addCleanup(client.close)
+        client.get_text(self.url + "/a")
+        client.get_text(self.url + "/b")
+        # Oldest page was evicted, so it gets downloaded again.
+        client.get_text(self.url + "/a")
+        self.assertEqual(0, client.not_modified)
+        client.get_text(self.url + "/a")
+        self.assertEqual(1, client.not_modified)
+
+    def test_errors(self) -> None:
+        start = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            self.client.get_text(self.url + "/slow")
+        self.assertLess(time.monotonic() - start, 0.9)
+
+        with self.assertRaises(requests.HTTPError):
+            self.client.get_text(self.url + "/missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Unit Testing for inventory_history module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import sys
+from os.path import join, dirname, isfile, getsize
+from os import remove
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from inventory_history import InventoryHistory, RECORD
+
+
+class TestInventoryHistory(unittest.TestCase):
+    """Tests inventory_history module functionality"""
+
+    def setUp(self) -> None:
+        self.path2history: str = join(dirname(__file__), ".history_test.bin")
+        self.history = InventoryHistory(self.path2history, ["honey", "water"])
+        # Honey is eaten every hour, water never changes.
+        for hour in range(6):
+            self.history.append({"honey": (5 - hour, 1, 0.69),
+                                 "water": (2, 0, 0.5)},
+                                timestamp=3600.0 * hour)
+
+    def tearDown(self) -> None:
+        if isfile(self.path2history):
+            remove(self.path2history)
+
+    def test_query(self) -> None:
+        self.assertEqual(12, len(self.history.query()))
+        records = self.history.query(3600.0, 7200.0, "honey")
+        self.assertListEqual([4, 3], records["amount"].tolist())
+        self.assertEqual(0, len(self.history.query(class_name="rice")))
+        self.assertListEqual([(0.0, 2)], self.history.changes("water"))
+        self.assertListEqual([(14400.0, 1), (18000.0, 0)],
+                             self.history.changes("honey", since=14400.0))
+
+        # Records and class names must survive a restart.
+        history = InventoryHistory(self.path2history, ["rice", "honey"])
+        self.assertTupleEqual(("honey", "water", "rice"), history.classes)
+        self.assertEqual(12, len(history.query()))
+
+        # Partially written records must be discarded.
+        with open(self.path2history, "ab") as f:
+            f.write(b"\0" * (RECORD.itemsize // 2))
+        history = InventoryHistory(self.path2history, ["honey"])
+        self.assertEqual(12, len(history.query()))
+
+        with open(self.path2history, "wb") as f:
+            f.write(b"not a history file")
+        with self.assertRaises(ValueError):
+            InventoryHistory(self.path2history, ["honey"])
+
+    def test_depletion(self) -> None:
+        # Honey ran out on last snapshot, water is not being consumed.
+        self.assertEqual(18000.0, self.history.depletion("honey"))
+        self.assertIsNone(self.history.depletion("water"))
+        self.assertIsNone(self.history.depletion("rice"))
+
+        # Only consumption since last restock matters.
+        self.history.append({"honey": (6, 1, 0.69)}, timestamp=21600.0)
+        self.history.append({"honey": (4, 1, 0.69)}, timestamp=25200.0)
+        self.assertAlmostEqual(25200.0 + 2 * 3600.0,
+                               self.history.depletion("honey"))
+        self.assertIsNone(self.history.depletion("honey", window=60.0))
+
+    def test_compaction(self) -> None:
+        with self.assertRaises(ValueError):
+            InventoryHistory(self.path2history, ["honey"], max_size=1)
+
+        max_size = 4096 + 40 * RECORD.itemsize
+        history = InventoryHistory(self.path2history, ["honey", "water"], max_size)
+        for hour in range(6, 60):
+            history.append({"honey": (hour % 4, 1, 0.69), "water": (2, 0, 0.5)},
+                           timestamp=3600.0 * hour)
+            self.assertLessEqual(getsize(self.path2history), max_size)
+
+        # Newest snapshots are kept whole, unchanged water records are dropped.
+        records = history.query()
+        self.assertEqual(3600.0 * 59, records["time"][-1])
+        self.assertEqual(len(history.query(class_name="honey")),
+                         len(set(history.query(class_name="honey")["time"])))
+        self.assertLess(len(history.query(class_name="water")),
+                        len(history.query(class_name="honey")))
+
+
+if __name__ == "__main__":
+    unittest.main()
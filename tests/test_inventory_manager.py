@@ -5,11 +5,13 @@ Author:
 """
 
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 from random import randint
-from jetson.inference import detectNet
+import numpy as np
 import csv
-from typing import List
+import time
+from threading import Thread
+from typing import Dict, List
 import sys
 from os.path import join, dirname, isfile
 from os import remove
@@ -21,6 +23,8 @@ from inventory_manager import (ProductType,
                                InventoryManager,
                                UnkownClassNameError,
                                InvalidConstraintError)
+from detectors import Detection, FakeDetector
+from tiled_detector import Region
 
 
 class TestInventoryManager(unittest.TestCase):
@@ -39,6 +43,8 @@ class TestInventoryManager(unittest.TestCase):
             labels_file.writelines("\n".join(cls.classes))
         InventoryManager._PATH2CONSTRAINTS = join(dirname(__file__),
                                                   ".constraints.csv")
+        InventoryManager._PATH2PRICES = join(dirname(__file__), ".prices.json")
+        InventoryManager._PATH2HISTORY = join(dirname(__file__), ".history.bin")
         cls.path2model: str = join(dirname(__file__), "sample.onnx")
         with open(cls.path2model, "w", newline=""):
             pass
@@ -51,21 +57,24 @@ class TestInventoryManager(unittest.TestCase):
             remove(cls.path2labels)
         if isfile(InventoryManager._PATH2CONSTRAINTS):
             remove(InventoryManager._PATH2CONSTRAINTS)
+        if isfile(InventoryManager._PATH2PRICES):
+            remove(InventoryManager._PATH2PRICES)
+        if isfile(InventoryManager._PATH2HISTORY):
+            remove(InventoryManager._PATH2HISTORY)
         if isfile(cls.path2model):
             remove(cls.path2model)
 
     def setUp(self) -> None:
-        self.mocket_detectnet = patch("inventory_manager.detectNet")
-        self.addCleanup(self.mocket_detectnet.stop)
-        self.mocket_detectnet = self.mocket_detectnet.start()
+        self.detector = FakeDetector(("BACKGROUND",) + self.classes)
 
-        self.mocket_video = patch("inventory_manager.videoSource")
-        self.addCleanup(self.mocket_video.stop)
-        self.mocket_video = self.mocket_video.start()
+        self.camera = Mock()
 
         self.manager = InventoryManager(self.path2model,
                                         self.path2labels,
-                                        self.input_uri)
+                                        self.input_uri,
+                                        detector=self.detector,
+                                        camera=self.camera)
+        self.addCleanup(self.manager.close)
 
     def test_inventory(self) -> None:
         with patch("inventory_manager.InventoryManager._update_prices"), \
@@ -77,22 +86,62 @@ class TestInventoryManager(unittest.TestCase):
             mocked_load.reset_mock(side_effect=True)
 
             # Generate an inventory with random number of product units.
-            sample_data = self.inventory_data.copy()
-            for product in sample_data.values():
-                product.amount = randint(1, 5)
+            sample_data = {name: ProductType(name, amount=randint(1, 5))
+                           for name in self.classes}
 
             # Generate a sample list of objects detected by an AI model.
-            detections: List[detectNet.Detection] = []
-            for index, class_name in enumerate(self.classes):
-                obj = detectNet.Detection()
-                obj.ClassID = index
+            detections: List[Detection] = []
+            for index, class_name in enumerate(self.classes, start=1):
                 product = sample_data[class_name]
-                detections.extend([obj] * product.amount)
+                detections.extend([Detection(index)] * product.amount)
 
-            # Set up mocks' behaviour, note "()" to use upper level mocks.
-            self.mocket_detectnet().Detect.return_value = detections
-            self.mocket_detectnet().GetClassDesc.side_effect = lambda id: self.classes[id]
-            self.assertDictEqual(sample_data, self.manager.inventory())
+            self.detector.detections = detections
+            self.assertDictEqual(sample_data, dict(self.manager.inventory()))
+
+            # Every inventory update must be logged.
+            records = self.manager.history.query(class_name=self.classes[0])
+            self.assertEqual(sample_data[self.classes[0]].amount,
+                             records["amount"][-1])
+
+    def test_shared_inventory(self) -> None:
+        # Slow detections make every caller overlap the first one.
+        slow_detector = FakeDetector(("BACKGROUND",) + self.classes, [Detection(1)],
+                                     latency=0.2)
+        manager = InventoryManager(self.path2model, self.path2labels, self.input_uri,
+                                   detector=slow_detector, camera=self.camera)
+        self.addCleanup(manager.close)
+        with patch("inventory_manager.InventoryManager._update_prices"), \
+             patch.object(slow_detector, "detect", wraps=slow_detector.detect) as mocked_detect:
+            results: List[Dict[str, ProductType]] = []
+            threads = [Thread(target=lambda: results.append(manager.inventory()))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(1, mocked_detect.call_count)
+            self.assertEqual(4, len(results))
+            self.assertTrue(all(result == results[0] for result in results))
+            # Every caller shares one read-only result.
+            self.assertTrue(all(result is results[0] for result in results))
+            with self.assertRaises(AttributeError):
+                results[0][self.classes[0]].amount = 9
+            with self.assertRaises(TypeError):
+                results[0][self.classes[0]] = ProductType(self.classes[0])
+            product = results[0][self.classes[0]].copy()
+            product.amount = 9
+            self.assertEqual(1, results[1][self.classes[0]].amount)
+
+        with patch("inventory_manager.InventoryManager._update_prices"), \
+             patch.object(self.detector, "detect", wraps=self.detector.detect) as mocked_detect:
+            # Recent results are reused, unless they are too old.
+            self.manager.inventory()
+            self.manager.inventory(max_age=60.0)
+            self.assertEqual(1, mocked_detect.call_count)
+            self.manager.inventory(max_age=0.0)
+            self.assertEqual(2, mocked_detect.call_count)
+            self.manager.inventory(force_refresh=True, max_age=60.0)
+            self.assertEqual(3, mocked_detect.call_count)
 
     def test_update_constraint(self) -> None:
         # Check unexpected product class name.
@@ -103,28 +152,41 @@ class TestInventoryManager(unittest.TestCase):
             self.manager.update_constraint(self.classes[0], -1)
 
         # Create a new sample inventory result.
-        sample_data1 = self.inventory_data.copy()
+        sample_data1 = {name: ProductType(name) for name in self.classes}
         sample_data1[self.classes[-1]].constraint = 3
 
         # Update constraints and compare loaded results. 
         self.manager.update_constraint(self.classes[-1], 3)
-        sample_data2 = self.inventory_data.copy()
-        self.manager._load_constraints(sample_data2)
+        self.manager._load_constraints()
+        sample_data2 = self.manager.state.snapshot()
         
         self.assertDictEqual(sample_data1, sample_data2)
 
+        # A wrong bulk update must not change any constraint.
+        with self.assertRaises(InvalidConstraintError):
+            self.manager.update_constraints({self.classes[0]: 2,
+                                             self.classes[-1]: -1})
+        with self.assertRaises(UnkownClassNameError):
+            self.manager.update_constraints({self.classes[0]: 2, "?": 1})
+        self.assertDictEqual({self.classes[0]: 0, self.classes[-1]: 3},
+                             self.manager._constraints.constraints())
+
+        # Several constraints can be updated at once.
+        self.manager.update_constraints({self.classes[0]: 4,
+                                         self.classes[-1]: 1})
+        self.assertDictEqual({self.classes[0]: 4, self.classes[-1]: 1},
+                             self.manager._constraints.constraints())
+
     def test_load_constraints(self) -> None:
         # Check if a default constraints file was created.
         self.assertTrue(isfile(InventoryManager._PATH2CONSTRAINTS))
         # Check if default constraint are loaded correctly.
-        sample_data1 = self.inventory_data.copy()
-        self.manager._load_constraints(sample_data1)
-        self.assertDictEqual(self.inventory_data, sample_data1)
+        self.manager._load_constraints()
+        self.assertDictEqual(self.inventory_data, self.manager.state.snapshot())
 
         # Generate a file with random constraints per product.
-        sample_data2 = self.inventory_data.copy()
-        for product in sample_data2.values():
-            product.constraint = randint(1, 5)
+        sample_data2 = {name: ProductType(name, constraint=randint(1, 5))
+                        for name in self.classes}
         with open(InventoryManager._PATH2CONSTRAINTS, "w", newline="") as csv_file:
             csv_writer = csv.writer(csv_file)
             csv_writer.writerow(["Class", "Constraint"])
@@ -132,13 +194,165 @@ class TestInventoryManager(unittest.TestCase):
                                   for key, value in sample_data2.items()])
 
         # Check if non-default constraints are loaded correctly.
-        sample_data3 = self.inventory_data.copy()
-        self.manager._load_constraints(sample_data3)
-        self.assertDictEqual(sample_data2, sample_data3)
+        self.manager._load_constraints()
+        self.assertDictEqual(sample_data2, self.manager.state.snapshot())
+
+        # Unchanged constraints must not be applied again.
+        with patch.object(self.manager.state, "set_constraints") as mocked_set:
+            self.manager._load_constraints()
+            mocked_set.assert_not_called()
 
         # Reset constraints file.
         remove(InventoryManager._PATH2CONSTRAINTS)
 
+    def test_update_prices(self) -> None:
+        prices = [(name, "https://shop.com/" + name, 1.0, "£")
+                  for name in self.classes]
+        cache = self.manager.price_cache
+        with patch.object(cache, "get_prices", return_value=prices) as mocked_get, \
+             patch.object(cache, "refresh", return_value=prices) as mocked_refresh:
+            self.manager._update_prices()
+            mocked_get.assert_called_once_with(list(self.classes))
+            self.assertEqual(1.0, self.manager.state.snapshot()[self.classes[0]].price)
+
+            # Forced refreshes must skip cached prices.
+            self.manager._update_prices(force_refresh=True)
+            mocked_refresh.assert_called_once_with(list(self.classes))
+
+    def test_picture(self) -> None:
+        self.camera.Capture.side_effect = lambda: np.zeros((48, 64, 3), np.uint8)
+        data = self.manager.picture()
+        self.assertTrue(data.startswith(b"\xff\xd8"))
+        # Last frame must not be encoded again.
+        self.assertIs(data, self.manager.picture(previous=True))
+        self.assertEqual(1, self.camera.Capture.call_count)
+        self.assertIsNot(data, self.manager.picture())
+
+        # Sensor noise must not change photo keys, unlike a new scene.
+        rng = np.random.default_rng(0)
+        self.camera.Capture.side_effect = lambda: rng.integers(100, 104, (48, 64, 3),
+                                                               dtype=np.uint8)
+        data, key = self.manager.photo()
+        other_data, other_key = self.manager.photo()
+        self.assertNotEqual(data, other_data)
+        self.assertEqual(key, other_key)
+        self.assertEqual((other_data, key), self.manager.photo(previous=True))
+        self.camera.Capture.side_effect = lambda: np.full((48, 64, 3), 255, np.uint8)
+        self.assertNotEqual(key, self.manager.photo()[1])
+
+        # Frames smaller than scene grid get keys of their own as well.
+        self.camera.Capture.side_effect = lambda: np.zeros((8, 8, 3), np.uint8)
+        key = self.manager.photo()[1]
+        self.assertEqual(key, self.manager.photo()[1])
+        self.camera.Capture.side_effect = lambda: np.full((8, 8, 3), 255, np.uint8)
+        self.assertNotEqual(key, self.manager.photo()[1])
+
+    def test_skip_unchanged_scenes(self) -> None:
+        manager = InventoryManager(self.path2model, self.path2labels,
+                                   self.input_uri, change_area_threshold=0.01,
+                                   detector=self.detector, camera=self.camera)
+        self.addCleanup(manager.close)
+        source = manager.sources[0]
+        self.detector.detections = [Detection(1), Detection(1)]
+        dark = np.zeros((64, 64, 3), np.uint8)
+        self.camera.Capture.return_value = dark
+        self.assertDictEqual({self.classes[0]: 2}, source.update())
+
+        # Same image must not go through detection again.
+        self.detector.detections = []
+        self.assertDictEqual({self.classes[0]: 2}, source.update())
+        self.assertEqual(1, source.scene_change.skips)
+
+        self.camera.Capture.return_value = np.full((64, 64, 3), 255, np.uint8)
+        self.assertDictEqual({}, source.update())
+
+    def test_several_cameras(self) -> None:
+        shelves = [Mock(), Mock(), Mock()]
+        for camera in shelves:
+            camera.Capture.return_value = np.zeros((8, 8, 3), np.uint8)
+        with self.assertRaises(ValueError):
+            InventoryManager(self.path2model, self.path2labels, ["a", "b"],
+                             detector=self.detector, camera=shelves)
+
+        manager = InventoryManager(self.path2model, self.path2labels,
+                                   ["top", "middle", "bottom"],
+                                   capture_interval=[0.0, 0.1, 0.2],
+                                   detector=self.detector, camera=shelves,
+                                   source_timeout=0.5)
+        self.addCleanup(manager.close)
+        self.detector.detections = [Detection(1), Detection(2)]
+        with patch("inventory_manager.InventoryManager._update_prices"):
+            result = manager.inventory()
+            self.assertEqual(3, result[self.classes[0]].amount)
+            self.assertDictEqual({self.classes[0]: 1, self.classes[1]: 1},
+                                 manager.breakdown()["middle"])
+
+            # Cameras must not be captured again within their interval.
+            manager.inventory()
+            self.assertListEqual([2, 1, 1], [camera.Capture.call_count
+                                             for camera in shelves])
+            time.sleep(0.2)
+
+            # A broken camera must keep its latest counts.
+            shelves[1].Capture.side_effect = RuntimeError("Camera unplugged")
+            self.detector.detections = [Detection(1)]
+            with self.assertLogs(level="WARNING"):
+                result = manager.inventory()
+            self.assertEqual(3, result[self.classes[0]].amount)
+            self.assertEqual(1, result[self.classes[1]].amount)
+            self.assertIn("Camera unplugged", manager.sources[1].error)
+
+            # A stalled camera must not block the others.
+            shelves[1].Capture.side_effect = lambda: time.sleep(2.0)
+            start = time.monotonic()
+            with self.assertLogs(level="WARNING"):
+                result = manager.inventory()
+            self.assertLess(time.monotonic() - start, 1.5)
+            self.assertEqual(3, result[self.classes[0]].amount)
+
+            # Nothing can be reported if every camera fails.
+            for camera in shelves:
+                camera.Capture.side_effect = RuntimeError("Camera unplugged")
+            with self.assertRaises(RuntimeError), self.assertLogs(level="WARNING"):
+                manager.inventory()
+
+    def test_regions(self) -> None:
+        self.camera.Capture.return_value = np.zeros((100, 200, 3), np.uint8)
+        manager = InventoryManager(self.path2model, self.path2labels, self.input_uri,
+                                   detector=self.detector, camera=self.camera,
+                                   regions=[Region("top", 0, 0, 1, 0.5),
+                                            Region("bottom", 0, 0.5, 1, 1)])
+        self.addCleanup(manager.close)
+        self.assertDictEqual({}, manager.region_breakdown())
+
+        self.detector.detections = [Detection(1, 0.9, 0, 0, 10, 10),
+                                    Detection(1, 0.9, 0, 60, 10, 70),
+                                    Detection(2, 0.9, 0, 80, 10, 90)]
+        with patch("inventory_manager.InventoryManager._update_prices"):
+            result = manager.inventory()
+        self.assertEqual(2, result[self.classes[0]].amount)
+        self.assertDictEqual({self.input_uri: {"top": {self.classes[0]: 1},
+                                               "bottom": {self.classes[0]: 1,
+                                                          self.classes[1]: 1}}},
+                             manager.region_breakdown())
+
+    def test_default_detector(self) -> None:
+        with patch("inventory_manager.DetectNetDetector") as mocked_detector:
+            mocked_detector.return_value = self.detector
+            manager = InventoryManager(self.path2model, self.path2labels,
+                                       self.input_uri, sensitivity=0.6,
+                                       camera=self.camera)
+            self.addCleanup(manager.close)
+            mocked_detector.assert_called_once_with(self.path2model, self.path2labels, 0.6)
+
+            # Detector keeps objects any class threshold would accept.
+            manager = InventoryManager(self.path2model, self.path2labels,
+                                       self.input_uri, sensitivity=0.6,
+                                       class_thresholds={self.classes[0]: 0.4},
+                                       camera=self.camera)
+            self.addCleanup(manager.close)
+            mocked_detector.assert_called_with(self.path2model, self.path2labels, 0.4)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,118 @@
+"""Unit Testing for inventory_monitor module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+import numpy as np
+import time
+from typing import List
+import sys
+from os.path import join, dirname, isfile
+from os import remove
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from inventory_manager import InventoryManager
+from inventory_monitor import InventoryMonitor
+from detectors import Detection, FakeDetector
+
+
+class TestInventoryMonitor(unittest.TestCase):
+    """Tests inventory_monitor functionality"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.classes = ("honey", "water")
+        cls.path2labels: str = join(dirname(__file__), "monitor_labels.txt")
+        with open(cls.path2labels, "w", newline="") as labels_file:
+            labels_file.write("\n".join(("BACKGROUND",) + cls.classes))
+        InventoryManager._PATH2CONSTRAINTS = join(dirname(__file__),
+                                                  ".constraints.csv")
+        InventoryManager._PATH2PRICES = join(dirname(__file__), ".prices.json")
+        InventoryManager._PATH2HISTORY = join(dirname(__file__), ".history.bin")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for path in (cls.path2labels, InventoryManager._PATH2CONSTRAINTS,
+                     InventoryManager._PATH2PRICES, InventoryManager._PATH2HISTORY):
+            if isfile(path):
+                remove(path)
+
+    def setUp(self) -> None:
+        self.detector = FakeDetector(("BACKGROUND",) + self.classes)
+        camera = Mock()
+        camera.Capture.return_value = np.zeros((8, 8, 3), np.uint8)
+        self.manager = InventoryManager("", self.path2labels, "fake",
+                                        detector=self.detector, camera=camera)
+        self.addCleanup(self.manager.close)
+        self.manager.update_constraints({"honey": 2, "water": 0})
+        patcher = patch.object(InventoryManager, "_update_prices")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.alerts: List[str] = []
+        self.monitor = InventoryMonitor(self.manager, self.alerts.append,
+                                        min_interval=0.01, max_interval=0.04)
+        self.addCleanup(self.monitor.stop, 1.0)
+
+    def test_alerts(self) -> None:
+        # First update only sets a reference.
+        self.manager.inventory()
+        self.assertListEqual([], self.alerts)
+
+        self.detector.detections = [Detection(1)] * 3
+        self.manager.inventory()
+        self.assertListEqual(["Honey is stocked again."], self.alerts)
+
+        # Demand changes without crossing zero are not reported.
+        self.detector.detections = [Detection(1)] * 4 + [Detection(2)]
+        self.manager.inventory()
+        self.assertEqual(1, len(self.alerts))
+
+        self.detector.detections = [Detection(1)]
+        self.manager.inventory()
+        self.assertEqual("Honey is running low, 1 more needed.", self.alerts[-1])
+
+        # Raising a constraint can make a product needed too.
+        self.manager.update_constraint("water", 1)
+        self.detector.detections = [Detection(1)]
+        self.manager.inventory()
+        self.assertEqual("Water is running low, 1 more needed.", self.alerts[-1])
+
+    def test_adaptive_interval(self) -> None:
+        intervals: List[float] = []
+        for _ in range(4):
+            time.sleep(0.02)
+            self.monitor.check()
+            intervals.append(self.monitor.interval)
+        # First update has changed nothing, as there are no products.
+        self.assertListEqual([0.02, 0.04, 0.04, 0.04], intervals)
+
+        # Any change brings interval back to its minimum.
+        self.detector.detections = [Detection(2)]
+        time.sleep(0.02)
+        self.monitor.check()
+        self.assertEqual(0.01, self.monitor.interval)
+
+        with self.assertRaises(ValueError):
+            InventoryMonitor(self.manager, print, 1.0, 0.5)
+
+    def test_background(self) -> None:
+        self.manager.inventory()
+        self.monitor.start()
+        self.assertTrue(self.monitor.running)
+        self.detector.detections = [Detection(1)] * 2
+        deadline = time.monotonic() + 2.0
+        while not self.alerts and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.monitor.stop(1.0)
+        self.assertFalse(self.monitor.running)
+        self.assertListEqual(["Honey is stocked again."], self.alerts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Unit Testing for inventory_state module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import sys
+from os.path import join, dirname
+from typing import List
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from inventory_state import ProductType, InventoryState, Changes
+
+
+class TestInventoryState(unittest.TestCase):
+    """Tests inventory_state functionality"""
+
+    def setUp(self) -> None:
+        self.state = InventoryState(["honey", "water"])
+
+    def test_product_type(self) -> None:
+        product = ProductType("honey", amount=1, constraint=3, price=0.5)
+        self.assertEqual(2, product.demand)
+        self.assertEqual(1.0, product.total_cost)
+        self.assertIsNone(product.price_age)
+        # Records are compact, no attribute can be added.
+        with self.assertRaises(AttributeError):
+            product.weight = 1
+        copy = product.copy()
+        self.assertEqual(product, copy)
+        copy.amount = 3
+        self.assertNotEqual(product, copy)
+        self.assertIn("amount=1", repr(product))
+
+    def test_commit(self) -> None:
+        self.state.set_amounts({"honey": 3, "rice": 1})
+        self.state.set_constraints({"water": 2})
+        changes, snapshot = self.state.commit()
+        self.assertDictEqual({"honey": {"amount": (0, 3)},
+                              "water": {"constraint": (0, 2)}}, changes)
+        self.assertEqual(3, snapshot["honey"].amount)
+        self.assertEqual(1, self.state.version)
+        # Committed records are read-only, they can be shared.
+        with self.assertRaises(AttributeError):
+            snapshot["honey"].amount = 4
+        self.assertEqual(snapshot["honey"], snapshot["honey"].copy())
+
+        # Unchanged values are not reported.
+        self.state.set_amounts({"honey": 3})
+        self.state.set_price("honey", "https://shop.com/honey", 0.7, "£", 1.0)
+        changes, _ = self.state.commit()
+        self.assertDictEqual({"honey": {"link": ("", "https://shop.com/honey"),
+                                        "price": (0.0, 0.7),
+                                        "currency": ("", "£")}}, changes)
+
+        # Values that went back before commit are not reported either.
+        self.state.set_amounts({"honey": 5})
+        self.state.set_amounts({"honey": 3})
+        self.assertDictEqual({}, self.state.commit()[0])
+        self.assertEqual(2, self.state.version)
+
+        # Commits without changes share the same records, changed ones are copied.
+        _, committed = self.state.commit()
+        self.assertIs(committed, self.state.commit()[1])
+        self.state.set_price("honey", "https://shop.com/honey", 0.7, "£", 2.0)
+        _, updated = self.state.commit()
+        self.assertEqual(2.0, updated["honey"].price_time)
+        self.assertIs(committed["water"], updated["water"])
+        self.assertListEqual(list(committed), list(updated))
+
+        # Snapshots are not affected by later updates.
+        snapshot = self.state.snapshot()
+        self.state.set_amounts({})
+        self.assertEqual(3, snapshot["honey"].amount)
+
+        # Nothing is set if any product is unknown.
+        with self.assertRaises(KeyError):
+            self.state.set_constraints({"water": 1, "rice": 1})
+        self.assertEqual(2, self.state.snapshot()["water"].constraint)
+
+    def test_subscribe(self) -> None:
+        received: List[Changes] = []
+        self.state.subscribe(lambda changes, snapshot: received.append(changes))
+        self.state.commit()
+        self.state.set_amounts({"water": 1})
+        self.state.commit()
+        self.assertListEqual([{"water": {"amount": (0, 1)}}], received)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Unit Testing for jpeg_encoder module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import numpy as np
+import sys
+from io import BytesIO
+from os.path import join, dirname
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from jpeg_encoder import JpegEncoder, encode_jpeg
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class TestJpegEncoder(unittest.TestCase):
+    """Tests jpeg_encoder module functionality"""
+
+    def setUp(self) -> None:
+        if Image is None:
+            self.skipTest("Pillow is not installed")
+        rng = np.random.default_rng(0)
+        self.image = rng.integers(0, 256, (480, 640, 4), dtype=np.uint8)
+
+    def test_encode_jpeg(self) -> None:
+        data = encode_jpeg(self.image, quality=90)
+        with Image.open(BytesIO(data)) as picture:
+            self.assertEqual("JPEG", picture.format)
+            self.assertTupleEqual((640, 480), picture.size)
+
+        # Smaller pictures must keep aspect ratio.
+        small = encode_jpeg(self.image.astype(np.float32), quality=50, max_size=320)
+        self.assertLess(len(small), len(data))
+        with Image.open(BytesIO(small)) as picture:
+            self.assertTupleEqual((320, 240), picture.size)
+
+    def test_cached_encoding(self) -> None:
+        with self.assertRaises(ValueError):
+            JpegEncoder(quality=0)
+        with self.assertRaises(ValueError):
+            JpegEncoder(max_size=0)
+
+        encoder = JpegEncoder(quality=80, max_size=100)
+        data = encoder.encode(self.image)
+        self.assertIs(data, encoder.encode(self.image))
+        self.assertEqual(1, encoder.encodes)
+
+        # A new frame must be encoded, even if pixels are equal.
+        self.assertEqual(data, encoder.encode(self.image.copy()))
+        self.assertEqual(2, encoder.encodes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Unit Testing for metrics module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import sys
+import requests
+from os.path import join, dirname
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from metrics import Histogram, Metrics, MetricsServer, MetricsReporter
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests metrics module functionality"""
+
+    def setUp(self) -> None:
+        self.metrics = Metrics(buckets=(0.01, 0.1, 1.0))
+
+    def test_histogram(self) -> None:
+        histogram = Histogram((0.01, 0.1, 1.0))
+        self.assertEqual(0.0, histogram.quantile(0.5))
+        for value in (0.005, 0.01, 0.05, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertListEqual([2, 1, 1, 1], histogram.counts)
+        self.assertEqual(5, histogram.count)
+        self.assertAlmostEqual(2.565, histogram.total)
+        self.assertEqual(0.1, histogram.quantile(0.5))
+        self.assertEqual(float("inf"), histogram.quantile(0.95))
+
+    def test_metrics(self) -> None:
+        self.assertEqual("No metrics recorded", self.metrics.summary())
+        # Failed stages must be measured too.
+        with self.assertRaises(RuntimeError), self.metrics.timer("capture"):
+            raise RuntimeError
+        self.metrics.observe("detect", 0.05)
+        self.metrics.increment("photo_upload", 2)
+        self.assertEqual(1, self.metrics.histogram("capture").count)
+        self.assertIsNone(self.metrics.histogram("scrape_http"))
+        self.assertEqual(2, self.metrics.counter("photo_upload"))
+        self.assertIn("detect: 1 calls, mean 50.0ms, p95 <= 100.0ms",
+                      self.metrics.summary())
+
+        text = self.metrics.render()
+        self.assertIn('deeppantry_stage_seconds_bucket{stage="detect",le="0.1"} 1', text)
+        self.assertIn('deeppantry_stage_seconds_bucket{stage="detect",le="+Inf"} 1', text)
+        self.assertIn('deeppantry_stage_seconds_count{stage="detect"} 1', text)
+        self.assertIn('deeppantry_events_total{event="photo_upload"} 2', text)
+
+        self.metrics.reset()
+        self.assertEqual(0, self.metrics.counter("photo_upload"))
+
+    def test_services(self) -> None:
+        self.metrics.observe("detect", 0.05)
+        server = MetricsServer(self.metrics, 0)
+        server.start()
+        self.addCleanup(server.stop)
+        self.assertTrue(server.url.startswith("http://127.0.0.1:"))
+        response = requests.get(server.url, timeout=5.0)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.metrics.render(), response.text)
+        self.assertEqual(404, requests.get(server.url + "/other", timeout=5.0).status_code)
+
+        with self.assertRaises(ValueError):
+            MetricsReporter(self.metrics, 0)
+        reporter = MetricsReporter(self.metrics, 3600.0)
+        with self.assertLogs(level="INFO") as logs:
+            reporter.start()
+            reporter.stop(timeout=5.0)
+        self.assertFalse(reporter.running)
+        self.assertIn("Metrics: detect: 1 calls", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
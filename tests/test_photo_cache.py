@@ -0,0 +1,142 @@
+"""Unit Testing for photo_cache module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+import json
+import sys
+import time
+from os.path import join, dirname, isfile
+from os import remove
+from typing import List, Set
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from photo_cache import PhotoCache
+from telegram import Bot
+
+
+class FakeBotApi(BaseHTTPRequestHandler):
+    """Imitates sendPhoto method of Telegram Bot API."""
+
+    # Content type of every received request, and known file ids.
+    requests: List[str] = []
+    file_ids: Set[str] = set()
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        content_type = self.headers["Content-Type"]
+        FakeBotApi.requests.append(content_type)
+
+        if content_type.startswith("multipart/form-data"):
+            file_id = f"photo-{len(FakeBotApi.file_ids)}"
+            FakeBotApi.file_ids.add(file_id)
+        else:
+            file_id = json.loads(body)["photo"]
+
+        if file_id in FakeBotApi.file_ids:
+            status, answer = 200, {"ok": True, "result": {
+                "message_id": len(FakeBotApi.requests),
+                "date": int(time.time()),
+                "chat": {"id": 42, "type": "private"},
+                "photo": [{"file_id": file_id + "-small", "file_unique_id": "s",
+                           "width": 90, "height": 60},
+                          {"file_id": file_id, "file_unique_id": "l",
+                           "width": 640, "height": 480}],
+            }}
+        else:
+            status, answer = 400, {"ok": False, "error_code": 400,
+                                   "description": "Bad Request: wrong file identifier"}
+
+        data = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+class TestPhotoCache(unittest.TestCase):
+    """Tests photo_cache module functionality"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBotApi)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+        host, port = cls.server.server_address[:2]
+        cls.bot = Bot("123:TEST", base_url=f"http://{host}:{port}/bot")
+        cls.path2photos: str = join(dirname(__file__), ".photos.json")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+        if isfile(cls.path2photos):
+            remove(cls.path2photos)
+
+    def setUp(self) -> None:
+        FakeBotApi.requests = []
+        FakeBotApi.file_ids = set()
+        if isfile(self.path2photos):
+            remove(self.path2photos)
+
+    def _uploads(self) -> int:
+        return sum(content_type.startswith("multipart/form-data")
+                   for content_type in FakeBotApi.requests)
+
+    def test_send_photo(self) -> None:
+        with self.assertRaises(ValueError):
+            PhotoCache(max_size=0)
+
+        photos = PhotoCache(self.path2photos, max_size=2)
+        message = photos.send_photo(self.bot, 42, b"pantry")
+        self.assertEqual("photo-0", message.photo[-1].file_id)
+        # Same contents must be sent by file id.
+        photos.send_photo(self.bot, 42, b"pantry")
+        self.assertEqual((1, 1), (photos.hits, photos.uploads))
+        self.assertEqual(1, self._uploads())
+        self.assertEqual(2, len(FakeBotApi.requests))
+
+        # Cached file ids must survive a restart.
+        photos = PhotoCache(self.path2photos, max_size=2)
+        photos.send_photo(self.bot, 42, b"pantry")
+        self.assertEqual(1, self._uploads())
+
+        # Least recently sent photo is evicted first.
+        photos.send_photo(self.bot, 42, b"empty pantry")
+        photos.send_photo(self.bot, 42, b"full pantry")
+        self.assertEqual(3, self._uploads())
+        photos.send_photo(self.bot, 42, b"pantry")
+        self.assertEqual(4, self._uploads())
+
+    def test_photo_key(self) -> None:
+        photos = PhotoCache(self.path2photos)
+        photos.send_photo(self.bot, 42, b"pantry", key="scene-1")
+        # Different contents of the same scene must be sent by file id.
+        photos.send_photo(self.bot, 42, b"noisy pantry", key="scene-1")
+        self.assertEqual((1, 1), (photos.hits, photos.uploads))
+        photos.send_photo(self.bot, 42, b"pantry", key="scene-2")
+        self.assertEqual(2, self._uploads())
+
+    def test_rejected_file_id(self) -> None:
+        photos = PhotoCache(self.path2photos)
+        photos.send_photo(self.bot, 42, b"pantry")
+        # Server forgets uploaded files, so photo must be uploaded again.
+        FakeBotApi.file_ids.clear()
+        with self.assertLogs(level="WARNING"):
+            message = photos.send_photo(self.bot, 42, b"pantry")
+        self.assertEqual("photo-0", message.photo[-1].file_id)
+        self.assertEqual(2, self._uploads())
+        self.assertEqual((0, 2), (photos.hits, photos.uploads))
+
+
+if __name__ == "__main__":
+    unittest.main()
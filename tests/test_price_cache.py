@@ -0,0 +1,215 @@
+"""Unit Testing for price_cache module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+import sys
+import time
+from threading import Event, Thread
+from os.path import join, dirname, isfile
+from os import remove
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from price_cache import PriceCache, PriceRefresher
+
+
+class TestPriceCache(unittest.TestCase):
+    """Tests price_cache module functionality"""
+
+    path2cache: str = join(dirname(__file__), ".prices.json")
+
+    def setUp(self) -> None:
+        self.scraper = Mock(side_effect=lambda names: [
+            (name, "https://shop.com/" + name, 1.5, "£") for name in names
+        ])
+        self.addCleanup(self._remove_cache)
+
+    def _remove_cache(self) -> None:
+        if isfile(self.path2cache):
+            remove(self.path2cache)
+
+    def test_get_prices(self) -> None:
+        with self.assertRaises(ValueError):
+            PriceCache(max_size=0)
+
+        cache = PriceCache(ttl=60.0, scraper=self.scraper)
+        expected = [("honey", "https://shop.com/honey", 1.5, "£"),
+                    ("water", "https://shop.com/water", 1.5, "£")]
+        # First lookup must be scraped, second one must not.
+        self.assertListEqual(expected, cache.get_prices(["honey", "water"]))
+        self.assertListEqual(expected, cache.get_prices(["honey", "water"]))
+        self.scraper.assert_called_once_with(["honey", "water"])
+        self.assertEqual((2, 0, 2), (cache.hits, cache.stale_hits, cache.misses))
+
+        # Only missing products must be scraped.
+        self.assertListEqual(expected[::-1] + [("tea", "https://shop.com/tea", 1.5, "£")],
+                             cache.get_prices(["water", "honey", "tea"]))
+        self.scraper.assert_called_with(["tea"])
+
+        # Failed lookups must not be cached.
+        self.scraper.side_effect = lambda names: [(n, "", 0.0, "") for n in names]
+        cache.get_prices(["soda"])
+        self.assertIsNone(cache.age("soda"))
+
+    def test_eviction(self) -> None:
+        cache = PriceCache(max_size=2, scraper=self.scraper)
+        cache.get_prices(["honey", "water"])
+        # Recently used products must survive eviction.
+        cache.get_prices(["honey"])
+        cache.get_prices(["tea"])
+        self.assertIsNotNone(cache.age("honey"))
+        self.assertIsNone(cache.age("water"))
+
+    def test_stale_while_revalidate(self) -> None:
+        cache = PriceCache(ttl=60.0, max_stale=60.0, scraper=self.scraper)
+        now = time.time()
+        cache.get_prices(["honey"])
+
+        with patch("price_cache.time.time", return_value=now + 90.0), \
+             patch("price_cache.Thread") as mocked_thread:
+            # Stale prices are served while being fetched again.
+            self.assertEqual(1.5, cache.get_prices(["honey"])[0][2])
+            self.assertEqual(1, cache.stale_hits)
+            mocked_thread.assert_called_once()
+            target = mocked_thread.call_args.kwargs["target"]
+            target(*mocked_thread.call_args.kwargs["args"])
+        self.assertEqual(2, self.scraper.call_count)
+
+        with patch("price_cache.time.time", return_value=now + 300.0):
+            # Expired prices are fetched before answering.
+            cache.get_prices(["honey"])
+            self.assertEqual(2, cache.misses)
+            self.assertEqual(3, self.scraper.call_count)
+
+    def test_fetch_outside_lock(self) -> None:
+        cache = PriceCache(scraper=self.scraper)
+        cache.get_prices(["honey"])
+        scraping, release = Event(), Event()
+        fast_scraper = self.scraper.side_effect
+
+        def slow_scraper(names):
+            scraping.set()
+            release.wait(5.0)
+            return fast_scraper(names)
+
+        self.scraper.side_effect = slow_scraper
+        fetcher = Thread(target=cache.refresh, args=(["honey", "water"],))
+        fetcher.start()
+        self.addCleanup(fetcher.join, 5.0)
+        self.addCleanup(release.set)
+        self.assertTrue(scraping.wait(5.0))
+
+        # Cached prices are served while others are being scraped.
+        start = time.monotonic()
+        self.assertEqual(1.5, cache.get_prices(["honey"])[0][2])
+        self.assertIsNotNone(cache.fetched("honey"))
+        self.assertLess(time.monotonic() - start, 1.0)
+
+        release.set()
+        fetcher.join(5.0)
+        self.assertIsNotNone(cache.age("water"))
+
+    def test_persistence(self) -> None:
+        cache = PriceCache(self.path2cache, scraper=self.scraper)
+        cache.get_prices(["honey"])
+        self.assertTrue(isfile(self.path2cache))
+
+        # A new cache must start warm.
+        cache = PriceCache(self.path2cache, scraper=self.scraper)
+        self.assertListEqual([("honey", "https://shop.com/honey", 1.5, "£")],
+                             cache.get_prices(["honey"]))
+        self.assertEqual((1, 0), (cache.hits, cache.misses))
+
+        # A corrupted file must not prevent the cache from working.
+        with open(self.path2cache, "w") as f:
+            f.write("{")
+        cache = PriceCache(self.path2cache, scraper=self.scraper)
+        self.assertIsNone(cache.age("honey"))
+
+    def test_save_outside_lock(self) -> None:
+        cache = PriceCache(self.path2cache, scraper=self.scraper)
+        cache.get_prices(["honey"])
+        writing, release = Event(), Event()
+
+        def slow_dump(*args, **kwargs):
+            writing.set()
+            release.wait(5.0)
+
+        with patch("price_cache.json.dump", side_effect=slow_dump):
+            fetcher = Thread(target=cache.refresh, args=(["water"],))
+            fetcher.start()
+            self.addCleanup(fetcher.join, 5.0)
+            self.addCleanup(release.set)
+            self.assertTrue(writing.wait(5.0))
+
+            # Prices are served while they are written to disk.
+            start = time.monotonic()
+            self.assertEqual(1.5, cache.peek(["water"])[0][2])
+            self.assertLess(time.monotonic() - start, 1.0)
+            release.set()
+            fetcher.join(5.0)
+
+        # A failed write must not fail lookups.
+        with patch("price_cache.replace", side_effect=OSError("Disk full")), \
+             self.assertLogs(level="WARNING"):
+            self.assertEqual(1.5, cache.get_prices(["rice"])[0][2])
+        self.assertIsNotNone(cache.age("rice"))
+
+    def test_peek(self) -> None:
+        cache = PriceCache(scraper=self.scraper)
+        # Missing products get default values without network access.
+        self.assertListEqual([("honey", "", 0.0, "")], cache.peek(["honey"]))
+        self.scraper.assert_not_called()
+
+        cache.refresh(["honey"])
+        self.assertListEqual([("honey", "https://shop.com/honey", 1.5, "£")],
+                             cache.peek(["honey"]))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_refresher(self) -> None:
+        with self.assertRaises(ValueError):
+            PriceRefresher(PriceCache(), ["honey"], 0.0)
+
+        cache = PriceCache(scraper=self.scraper)
+        refresher = PriceRefresher(cache, ["honey", "water"], 60.0)
+        refresher.start()
+        self.assertTrue(refresher.running)
+        # Refresher must stop while waiting for next refresh.
+        refresher.stop(timeout=5.0)
+        self.assertFalse(refresher.running)
+        self.scraper.assert_called_once_with(["honey", "water"])
+        self.assertIsNotNone(cache.age("water"))
+
+    def test_peek_while_refreshing(self) -> None:
+        cache = PriceCache(scraper=self.scraper)
+        cache.refresh(["honey"])
+        scraping, release = Event(), Event()
+        fast_scraper = self.scraper.side_effect
+
+        def slow_scraper(names):
+            scraping.set()
+            release.wait(5.0)
+            return fast_scraper(names)
+
+        self.scraper.side_effect = slow_scraper
+        refresher = PriceRefresher(cache, ["honey", "water"], 60.0)
+        refresher.start()
+        self.addCleanup(refresher.stop, 5.0)
+        self.addCleanup(release.set)
+        self.assertTrue(scraping.wait(5.0))
+
+        # Readers never wait for an ongoing refresh.
+        start = time.monotonic()
+        self.assertListEqual([("honey", "https://shop.com/honey", 1.5, "£"),
+                              ("water", "", 0.0, "")],
+                             cache.peek(["honey", "water"]))
+        self.assertLess(time.monotonic() - start, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
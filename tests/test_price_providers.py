@@ -0,0 +1,197 @@
+"""Unit Testing for price_providers module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+import sys
+import time
+from os.path import join, dirname
+from typing import Callable, List, Optional, Type
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+# Make sure to use this naming format: <product_name>-<website_name>-test.txt
+HTML_TEST_FILE: str = join(dirname(__file__), "honey-Trolley.co.uk-test.txt")
+
+from price_providers import (RateLimiter,
+                             CircuitBreaker,
+                             PriceProvider,
+                             TrolleyProvider,
+                             PriceAggregator)
+from price_cache import PriceInfo
+from http_client import HttpClient
+
+
+def shop_handler(body: bytes, status: int, paths: List[str]) -> Type[BaseHTTPRequestHandler]:
+    """Makes a handler that answers every search with the same page."""
+
+    class ShopHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:
+            paths.append(self.path)
+            content = body if status == 200 else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *_) -> None:
+            pass
+
+    return ShopHandler
+
+
+class FakeProvider(PriceProvider):
+    """Answers searches through a function, recording when they start."""
+
+    def __init__(self, answer: Callable[[str], Optional[PriceInfo]], **kwargs) -> None:
+        super().__init__("fake", **kwargs)
+        self.answer = answer
+        self.started: List[float] = []
+
+    def search(self, product_name: str) -> Optional[PriceInfo]:
+        self.started.append(time.monotonic())
+        return self.answer(product_name)
+
+
+class TestPriceProviders(unittest.TestCase):
+    """Tests price_providers module functionality"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        with open(HTML_TEST_FILE, "rb") as f:
+            body = f.read()
+        # Every shop answers with its own page, or an error.
+        cls.paths: List[List[str]] = [[], [], []]
+        pages = [(body, 200),
+                 (body.replace(b"&pound;0.69<", b"&pound;0.59<"), 200),
+                 (b"", 503)]
+        cls.servers: List[ThreadingHTTPServer] = []
+        cls.urls: List[str] = []
+        for (page, status), paths in zip(pages, cls.paths):
+            server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                         shop_handler(page, status, paths))
+            server.daemon_threads = True
+            Thread(target=server.serve_forever, daemon=True).start()
+            host, port = server.server_address[:2]
+            cls.servers.append(server)
+            cls.urls.append(f"http://{host}:{port}")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for server in cls.servers:
+            server.shutdown()
+            server.server_close()
+
+    def setUp(self) -> None:
+        for paths in self.paths:
+            paths.clear()
+        self.client = HttpClient(connect_timeout=1.0, read_timeout=1.0)
+        self.addCleanup(self.client.close)
+
+    def provider(self, index: int, **kwargs) -> TrolleyProvider:
+        return TrolleyProvider(f"shop{index}", self.urls[index],
+                               client=self.client, **kwargs)
+
+    def test_cheapest_wins(self) -> None:
+        aggregator = PriceAggregator([self.provider(0), self.provider(1)],
+                                     max_workers=4)
+        self.addCleanup(aggregator.close)
+        prices = aggregator.scrape_prices(["honey", "water"])
+        self.assertEqual(("honey", self.urls[1] + "/product/morrisons-savers-honey/IBN007",
+                          0.59, "£"), prices[0])
+        self.assertEqual("water", prices[1][0])
+        # Every shop is asked for every product.
+        self.assertEqual(2, len(self.paths[0]))
+        self.assertEqual(2, len(self.paths[1]))
+
+    def test_failing_provider(self) -> None:
+        aggregator = PriceAggregator([self.provider(0),
+                                      self.provider(2, failure_threshold=2)])
+        self.addCleanup(aggregator.close)
+        names = ["honey", "rice", "pasta", "water"]
+        prices = aggregator.scrape_prices(names)
+        self.assertListEqual(names, [info[0] for info in prices])
+        self.assertEqual(0.69, prices[0][2])
+        # Failing shop is skipped once its circuit opens.
+        self.assertEqual(2, len(self.paths[2]))
+        self.assertTrue(aggregator.providers[1].breaker.is_open)
+
+        # Default values are returned if nobody can answer.
+        aggregator = PriceAggregator([self.provider(2, failure_threshold=1)])
+        self.addCleanup(aggregator.close)
+        self.assertListEqual([("honey", "", 0.0, "")], aggregator.scrape_prices(["honey"]))
+
+    def test_throttled_provider(self) -> None:
+        offer = lambda name: (name, "https://shop.com/" + name, 1.0, "£")
+        throttled = FakeProvider(offer, rate_limit=5.0)
+        unlimited = FakeProvider(offer)
+        aggregator = PriceAggregator([throttled, unlimited], max_workers=1)
+        self.addCleanup(aggregator.close)
+        start = time.monotonic()
+        names = ["honey", "rice", "pasta", "water"]
+        self.assertListEqual(names, [info[0] for info in aggregator.scrape_prices(names)])
+        # Waiting for a rate limit must not hold shared workers.
+        self.assertGreaterEqual(throttled.started[-1] - start, 0.55)
+        self.assertLess(unlimited.started[-1] - start, 0.3)
+
+    def test_unexpected_failure(self) -> None:
+        def answer(name: str) -> Optional[PriceInfo]:
+            raise ValueError("Unexpected page layout")
+
+        provider = FakeProvider(answer, failure_threshold=1, reset_timeout=0.05)
+        aggregator = PriceAggregator([provider])
+        self.addCleanup(aggregator.close)
+        with self.assertLogs(level="WARNING"):
+            self.assertListEqual([("honey", "", 0.0, "")], aggregator.scrape_prices(["honey"]))
+        self.assertTrue(provider.breaker.is_open)
+
+        # Failed trial calls must let later ones happen.
+        time.sleep(0.06)
+        with self.assertLogs(level="WARNING"):
+            aggregator.scrape_prices(["honey"])
+        time.sleep(0.06)
+        provider.answer = lambda name: (name, "https://shop.com/" + name, 1.0, "£")
+        self.assertEqual(1.0, aggregator.scrape_prices(["honey"])[0][2])
+        self.assertFalse(provider.breaker.is_open)
+        self.assertEqual(3, len(provider.started))
+
+    def test_circuit_breaker(self) -> None:
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        # A single trial call is allowed after a while.
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+    def test_rate_limiter(self) -> None:
+        with self.assertRaises(ValueError):
+            RateLimiter(0.0)
+        limiter = RateLimiter(rate=50.0, burst=2)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        # First two are free, then one every 20ms.
+        self.assertGreaterEqual(time.monotonic() - start, 0.075)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,7 +16,7 @@ sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
 # Make sure to use this naming format: <product_name>-<website_name>-test.txt
 HTML_TEST_FILE: str = join(dirname(__file__), "honey-Trolley.co.uk-test.txt")
 
-from price_scraper import scrape_prices
+from price_scraper import scrape_prices, extract_listings
 
 
 class TestPriceScraper(unittest.TestCase):
@@ -72,7 +72,72 @@ class TestPriceScraper(unittest.TestCase):
             mocked_get.return_value = r
             self.assertListEqual(self.default_price_info,
                                  scrape_prices(self.product_names))
-            
+
+    def test_scrape_prices_concurrently(self) -> None:
+        # Check that a non-positive number of workers is rejected.
+        with self.assertRaises(ValueError):
+            scrape_prices(self.product_names, max_workers=0)
+
+        def fake_get(url: str, **kwargs) -> requests.Response:
+            # Only the first product can be found on the website.
+            r = requests.Response()
+            r.status_code = 200 if url.endswith(self.product_names[0]) else 404
+            return r
+
+        with patch("price_scraper.requests.Session.get") as mocked_get:
+            requests.Response.text = self.html_text
+            mocked_get.side_effect = fake_get
+            names = ["water", self.product_names[0], "cookies"]
+            expected = [("water", "", 0.0, "")] + self.price_info + \
+                       [("cookies", "", 0.0, "")]
+            # Check if results keep input order and timeout is passed along.
+            self.assertListEqual(expected, scrape_prices(names, max_workers=3,
+                                                         timeout=1.5))
+            for call in mocked_get.call_args_list:
+                self.assertEqual(1.5, call.kwargs["timeout"])
+
+    def test_extract_listings(self) -> None:
+        # Streaming and strained parsers must agree on every entry.
+        listings = list(extract_listings(self.html_text))
+        self.assertEqual(20, len(listings))
+        self.assertListEqual(listings,
+                             list(extract_listings(self.html_text, "html.parser")))
+        self.assertIn(("/product/morrisons-savers-honey/IBN007", "£0.69"),
+                      listings)
+
+        # Entries in later blocks are extracted as well, by both parsers.
+        extra = '<div><div class="product-listing"><a href="/x"><div class="_price">£0.01</div></a></div>' \
+                '<div class="product-listing"><a href="/y"><div>No price</div></a></div></div>'
+        html_text = self.html_text.replace("</body>", extra + "</body>")
+        for parser in ("lxml", "html.parser"):
+            self.assertListEqual(listings + [("/x", "£0.01")],
+                                 list(extract_listings(html_text, parser)))
+
+        # Parsing can be left before the end of the page.
+        pending = extract_listings(html_text)
+        self.assertEqual(listings[0], next(pending))
+        pending.close()
+        self.assertListEqual([], list(extract_listings("<html></html>")))
+
+    def test_malformed_listings(self) -> None:
+        malformed = '<div><div class="product-listing"><a><div class="_price">£0.01</div></a></div>' \
+                    '<div class="product-listing"><a href="/x"><div class="_price"></div></a></div>' \
+                    '<div class="product-listing"><a href="/y"><div class="_price">Sold out</div></a></div></div>'
+        html_text = self.html_text.replace("</body>", malformed + "</body>")
+        # Entries without link or price are skipped by both parsers.
+        for parser in ("lxml", "html.parser"):
+            self.assertEqual(("/y", "Sold out"),
+                             list(extract_listings(html_text, parser))[-1])
+
+        # Unreadable prices must not hide valid entries.
+        with patch("price_scraper.requests.Session.get") as mocked_get, \
+             patch.object(requests.Response, "text", html_text):
+            r = requests.Response()
+            r.status_code = 200
+            mocked_get.return_value = r
+            self.assertListEqual(self.price_info,
+                                 scrape_prices(self.product_names))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,92 @@
+"""Unit Testing for scene_change module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import numpy as np
+import sys
+from os.path import join, dirname
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from scene_change import SceneChangeDetector
+
+
+class TestSceneChangeDetector(unittest.TestCase):
+    """Tests scene_change module functionality"""
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        self.image = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        self.scene = SceneChangeDetector(block_threshold=0.08,
+                                         area_threshold=0.002)
+
+    def test_signature(self) -> None:
+        self.assertTupleEqual((32, 32), self.scene.signature(self.image).shape)
+        # Alpha channel and image size must not matter.
+        rgba = np.dstack([self.image, np.zeros((480, 640), np.uint8)])
+        np.testing.assert_allclose(self.scene.signature(self.image),
+                                   self.scene.signature(rgba.astype(np.float32)),
+                                   atol=1e-5)
+        self.assertTupleEqual((32, 32),
+                              self.scene.signature(self.image[:40, :50]).shape)
+
+    def test_has_changed(self) -> None:
+        # First frame is always a change.
+        self.assertTrue(self.scene.has_changed(self.image))
+        self.assertFalse(self.scene.has_changed(self.image))
+
+        # Slight lighting changes must be ignored.
+        brighter = np.clip(self.image.astype(np.int16) + 5, 0, 255).astype(np.uint8)
+        self.assertFalse(self.scene.has_changed(brighter))
+
+        # A product disappearing from a small area must be noticed.
+        moved = self.image.copy()
+        moved[100:140, 200:260] = 0
+        self.assertGreater(self.scene.difference(moved), 0.002)
+        self.assertTrue(self.scene.has_changed(moved))
+        self.assertFalse(self.scene.has_changed(moved))
+        self.assertEqual(0.0, self.scene.difference(moved))
+
+        self.assertEqual((5, 3), (self.scene.checks, self.scene.skips))
+        self.assertIn("3/5 times (60.0%)", self.scene.report())
+
+        self.scene.reset()
+        self.assertTrue(self.scene.has_changed(moved))
+
+    def test_reference_key(self) -> None:
+        self.assertIsNone(self.scene.reference_key(self.image))
+        self.scene.has_changed(self.image)
+        key = self.scene.reference_key(self.image)
+        self.assertIsNotNone(key)
+
+        # Noise must not change the key, unlike a content hash would.
+        noise = np.random.default_rng(1).integers(-3, 4, self.image.shape)
+        noisy = np.clip(self.image + noise, 0, 255).astype(np.uint8)
+        self.assertEqual(key, self.scene.reference_key(noisy))
+
+        moved = self.image.copy()
+        moved[100:140, 200:260] = 0
+        self.assertIsNone(self.scene.reference_key(moved))
+        self.scene.has_changed(moved)
+        self.assertNotIn(self.scene.reference_key(moved), (None, key))
+
+    def test_small_frames(self) -> None:
+        # Frames smaller than the grid get a block per pixel, never an empty one.
+        small = self.image[:8, :12]
+        signature = self.scene.signature(small)
+        self.assertTupleEqual((8, 12), signature.shape)
+        self.assertFalse(np.isnan(signature).any())
+        self.assertTrue(self.scene.has_changed(small))
+        self.assertFalse(self.scene.has_changed(small))
+        self.assertIsNotNone(self.scene.reference_key(small))
+        self.assertIsNone(self.scene.reference_key(255 - small))
+        # A frame of another size is a change, instead of failing.
+        self.assertTrue(self.scene.has_changed(self.image))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Unit Testing for tiled_detector module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+import numpy as np
+import sys
+from os.path import join, dirname
+from typing import Any, List, Sequence
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from detectors import Detection, Detector
+from tiled_detector import Region, TiledDetector, parse_regions
+
+
+class BrightDetector(Detector):
+    """Detects the bounding box of bright pixels, as a single object."""
+
+    thread_safe = True
+
+    def __init__(self) -> None:
+        self.batches: List[int] = []
+
+    def detect(self, image: Any) -> List[Detection]:
+        rows, cols = np.nonzero(image[..., 0])
+        if not rows.size:
+            return []
+        return [Detection(1, 0.9, cols.min(), rows.min(), cols.max() + 1, rows.max() + 1)]
+
+    def detect_batch(self, images: Sequence[Any]) -> List[List[Detection]]:
+        self.batches.append(len(images))
+        return super().detect_batch(images)
+
+    def class_desc(self, class_id: int) -> str:
+        return ["BACKGROUND", "honey"][class_id]
+
+
+class TestTiledDetector(unittest.TestCase):
+    """Tests tiled_detector module functionality"""
+
+    def setUp(self) -> None:
+        self.image = np.zeros((100, 200, 3), dtype=np.uint8)
+        # A single object, which sits on the border of several tiles.
+        self.image[40:60, 90:110] = 255
+
+    def test_parse_regions(self) -> None:
+        self.assertListEqual([Region("top", 0, 0, 1, 0.5), Region("bottom", 0, 0.5, 1, 1)],
+                             parse_regions(" top:0,0,1,0.5; bottom:0,0.5,1,1;"))
+        self.assertListEqual([], parse_regions(""))
+        for text in ("top:0,0,1", "top:0,0,1,1.5", "top:0.5,0,0.5,1", ":0,0,1,1", "top:a,0,1,1"):
+            with self.assertRaises(ValueError):
+                parse_regions(text)
+        self.assertTupleEqual((0, 50, 200, 100), Region("bottom", 0, 0.5, 1, 1).box(200, 100))
+
+    def test_windows(self) -> None:
+        with self.assertRaises(ValueError):
+            TiledDetector(BrightDetector(), tile_size=0)
+        with self.assertRaises(ValueError):
+            TiledDetector(BrightDetector(), overlap=1.0)
+
+        detector = TiledDetector(BrightDetector())
+        self.assertListEqual([(0, 0, 200, 100)], detector.windows(200, 100))
+
+        # Last tile is aligned with region end, tiles never leave it.
+        detector = TiledDetector(BrightDetector(), [Region("left", 0, 0, 0.6, 1)],
+                                 tile_size=64, overlap=0.5)
+        self.assertListEqual([(0, 0, 64, 64), (28, 0, 92, 64), (56, 0, 120, 64),
+                              (0, 18, 64, 82), (28, 18, 92, 82), (56, 18, 120, 82),
+                              (0, 36, 64, 100), (28, 36, 92, 100), (56, 36, 120, 100)],
+                             detector.windows(200, 100))
+
+    def test_detect(self) -> None:
+        inner = BrightDetector()
+        detector = TiledDetector(inner, tile_size=64, overlap=0.5, batch_size=4)
+        self.assertTrue(detector.thread_safe)
+        self.assertEqual("honey", detector.class_desc(1))
+
+        # Partial boxes from every tile merge into the whole object.
+        detections = detector.detect(self.image)
+        self.assertListEqual([Detection(1, 0.9, 90, 40, 110, 60)], detections)
+        self.assertEqual(len(detector.windows(200, 100)), sum(inner.batches))
+        self.assertLessEqual(max(inner.batches), 4)
+
+        # Nothing is detected outside regions.
+        detector = TiledDetector(BrightDetector(), [Region("left", 0, 0, 0.4, 1)])
+        self.assertListEqual([], detector.detect(self.image))
+
+        # Whole frames are handed over as they are.
+        detector = TiledDetector(BrightDetector())
+        self.assertListEqual([Detection(1, 0.9, 90, 40, 110, 60)],
+                             detector.detect(self.image))
+
+
+if __name__ == "__main__":
+    unittest.main()
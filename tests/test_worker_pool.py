@@ -0,0 +1,80 @@
+"""Unit Testing for worker_pool module.
+
+Author:
+    Andrés Pérez
+"""
+
+import unittest
+from threading import Event
+import sys
+from os.path import join, dirname
+from typing import List
+
+# Add tested modules to Python path.
+sys.path.insert(0, join(dirname(dirname(__file__)), "src"))
+
+from worker_pool import WorkerPool
+
+
+class TestWorkerPool(unittest.TestCase):
+    """Tests worker_pool module functionality"""
+
+    def setUp(self) -> None:
+        self.release = Event()
+        self.done: List[str] = []
+
+    def _task(self, name: str, started: Event) -> None:
+        started.set()
+        self.release.wait(5.0)
+        self.done.append(name)
+
+    def test_limits(self) -> None:
+        with self.assertRaises(ValueError):
+            WorkerPool(workers=0)
+        with self.assertRaises(ValueError):
+            WorkerPool(max_queue=0)
+
+        pool = WorkerPool(workers=2, max_queue=2, limits={"picture": 1})
+        pool.start()
+        self.addCleanup(pool.stop, 5.0)
+        self.addCleanup(self.release.set)
+
+        first, second, third = Event(), Event(), Event()
+        self.assertTrue(pool.submit("picture", self._task, "first", first))
+        self.assertTrue(first.wait(5.0))
+        # A second picture must wait even though a thread is idle.
+        self.assertTrue(pool.submit("picture", self._task, "second", second))
+        self.assertFalse(second.wait(0.1))
+        self.assertEqual(1, pool.pending)
+
+        # Other kinds can still overtake waiting tasks.
+        self.assertTrue(pool.submit("help", self._task, "third", third))
+        self.assertTrue(third.wait(5.0))
+        self.assertFalse(second.is_set())
+
+        # Excess work must be rejected once queue is full.
+        self.assertTrue(pool.submit("picture", self._task, "fourth", Event()))
+        self.assertFalse(pool.submit("help", self._task, "rejected", Event()))
+        self.assertEqual(2, pool.pending)
+
+        self.release.set()
+        self.assertTrue(second.wait(5.0))
+        pool.stop(timeout=5.0)
+        self.assertFalse(pool.running)
+        self.assertListEqual(["first", "fourth", "second", "third"], sorted(self.done))
+        self.assertFalse(pool.submit("help", self._task, "late", Event()))
+
+    def test_failed_task(self) -> None:
+        pool = WorkerPool(workers=1)
+        pool.start()
+        self.addCleanup(pool.stop, 5.0)
+        finished = Event()
+        # Errors must not stop background threads.
+        with self.assertLogs(level="ERROR"):
+            self.assertTrue(pool.submit("inventory", lambda: 1 / 0))
+            self.assertTrue(pool.submit("inventory", finished.set))
+            self.assertTrue(finished.wait(5.0))
+
+
+if __name__ == "__main__":
+    unittest.main()